@@ -1,12 +1,25 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta, timezone
+from bisect import bisect_left
+import heapq
 import re
 from dateutil.relativedelta import relativedelta
-from app.models import Subscription, Order, SubscriptionStats, MissedPaymentStats
+from app.models import (
+    Subscription, Order, SubscriptionStats, MissedPaymentStats, DistributionStats, QuantileSummary,
+    MissedPaymentTrendPoint, SubscriptionMissedPayments, BillingPeriod, GraceWindowStats
+)
+from app.sketches import QuantileSketch
 
-def calculate_subscription_stats(subscriptions: List[Subscription]) -> SubscriptionStats:
+# Relative accuracy of the quantile sketches behind the distribution stats
+DEFAULT_SKETCH_ALPHA = 0.01
+
+# An order closing within this many days of an expected billing date fulfills it
+GRACE_DAYS = 7
+
+def calculate_subscription_stats(subscriptions: List[Subscription], as_of: Optional[datetime] = None) -> SubscriptionStats:
     """
     Calculate subscription statistics based on the list of subscriptions.
+    Canceled subscriptions without an end date are measured up to `as_of` (default: now).
     """
     total_subscriptions = len(subscriptions)
     active_subscriptions = sum(1 for sub in subscriptions if sub.status__c == "active")
@@ -14,7 +27,7 @@ def calculate_subscription_stats(subscriptions: List[Subscription]) -> Subscript
     cancelled_subscriptions = sum(1 for sub in subscriptions if sub.status__c == "canceled")
     
     # Calculate average subscription length
-    now = datetime.now(timezone.utc)
+    now = as_of or datetime.now(timezone.utc)
     subscription_lengths = []
     
     for sub in subscriptions:
@@ -49,66 +62,351 @@ def parse_billing_interval(interval_str: str) -> Tuple[int, str]:
         return value, unit
     return 1, "month"  # Default to 1 month if parsing fails
 
-def calculate_missed_payments(subscriptions: List[Subscription], all_orders: Dict[int, List[Order]]) -> MissedPaymentStats:
+def advance_billing_date(current_date: datetime, interval_value: int, interval_unit: str) -> datetime:
     """
-    Calculate the number and value of missed payments from on-hold or active subscriptions.
+    Calculate the next billing date after `current_date` for a parsed billing interval.
     """
-    now = datetime.now(timezone.utc)
-    missed_payments_count = 0
-    missed_payments_value = 0.0
+    # A zero interval would never advance, so treat it as one unit
+    interval_value = max(interval_value, 1)
+    if interval_unit == "month" or interval_unit == "months":
+        return current_date + relativedelta(months=interval_value)
+    elif interval_unit == "year" or interval_unit == "years":
+        return current_date + relativedelta(years=interval_value)
+    elif interval_unit == "day" or interval_unit == "days":
+        return current_date + timedelta(days=interval_value)
+    elif interval_unit == "week" or interval_unit == "weeks":
+        return current_date + timedelta(weeks=interval_value)
+    else:
+        # Default to monthly if unit is unknown
+        return current_date + relativedelta(months=interval_value)
+
+def _expected_billing_dates(sub: Subscription, until: datetime) -> List[datetime]:
+    """
+    List the dates a payment was due for a subscription, from its start date up to `until`.
+    """
+    expected_dates = []
+    if not sub.start_date__c:
+        return expected_dates
+
+    # Parse billing interval
+    interval_value, interval_unit = parse_billing_interval(sub.billing_interval__c)
+    current_date = sub.start_date__c
+
+    while current_date <= until:
+        expected_dates.append(current_date)
+        current_date = advance_billing_date(current_date, interval_value, interval_unit)
+
+    return expected_dates
+
+def is_billable(sub: Subscription) -> bool:
+    """
+    Whether a subscription is expected to produce recurring payments (active or on-hold with a recurring amount).
+    """
+    return sub.status__c in ["active", "on-hold"] and bool(sub.recurring_amount__c)
+
+def _first_matching_orders(expected_dates: List[datetime], closedates: List[datetime],
+                           grace_days: int = GRACE_DAYS) -> List[Optional[int]]:
+    """
+    For each expected date, find the index of the earliest order closedate that fulfills it.
+
+    An order fulfills an expected date when it closes within `grace_days` of
+    it, i.e. when abs((closedate - expected_date).days) <= grace_days. Both
+    lists must be sorted; since the window start only moves forward, a single
+    pointer sweeps the orders once for all expected dates.
+    """
+    before = timedelta(days=grace_days)
+    # timedelta.days floors, so anything up to (but excluding) grace_days + 1 days later still matches
+    after = timedelta(days=grace_days + 1)
+
+    matches = []
+    i = 0
+    for expected_date in expected_dates:
+        while i < len(closedates) and closedates[i] < expected_date - before:
+            i += 1
+        if i < len(closedates) and closedates[i] < expected_date + after:
+            matches.append(i)
+        else:
+            matches.append(None)
+    return matches
+
+def _nearest_order_distances(expected_dates: List[datetime], closedates: List[datetime]) -> List[Optional[int]]:
+    """
+    For each expected date, the smallest abs((closedate - expected_date).days)
+    over all orders, or None without orders. An expected date is fulfilled
+    under a grace window of g days exactly when its distance is <= g.
+
+    The nearest order is either the last one before the expected date or the
+    first one on or after it; both lists are sorted, so one pointer finds them.
+    """
+    distances = []
+    i = 0
+    for expected_date in expected_dates:
+        while i < len(closedates) and closedates[i] < expected_date:
+            i += 1
+        candidates = []
+        if i > 0:
+            candidates.append(abs((closedates[i - 1] - expected_date).days))
+        if i < len(closedates):
+            candidates.append(abs((closedates[i] - expected_date).days))
+        distances.append(min(candidates) if candidates else None)
+    return distances
+
+def count_missed_payments(sub: Subscription, sub_orders: List[Order], now: datetime,
+                          grace_days: int = GRACE_DAYS) -> int:
+    """
+    Count the expected payments of a single subscription, up to `now`, that
+    have no matching order closed by `now`.
+    """
+    closedates = sorted(order.closedate for order in sub_orders)
+    matches = _first_matching_orders(_expected_billing_dates(sub, now), closedates, grace_days)
+
+    # Orders closing after `now` had not happened yet at that point
+    return sum(1 for match in matches if match is None or closedates[match] > now)
+
+def build_billing_timeline(sub: Subscription, sub_orders: List[Order], as_of: datetime) -> List[BillingPeriod]:
+    """
+    List every expected billing date of a subscription up to `as_of`, marked
+    as matched (with the fulfilling order) or missed, using the same schedule
+    and grace window as calculate_missed_payments.
+
+    Subscriptions that cannot miss payments (canceled or prepaid) are only
+    scheduled up to their end date, if they have one.
+    """
+    until = as_of
+    if not is_billable(sub) and sub.end_date__c:
+        until = min(as_of, sub.end_date__c)
+
+    sub_orders = sorted(sub_orders, key=lambda order: order.closedate)
+    closedates = [order.closedate for order in sub_orders]
+    expected_dates = _expected_billing_dates(sub, until)
+
+    periods = []
+    for expected_date, match in zip(expected_dates, _first_matching_orders(expected_dates, closedates)):
+        if match is not None and closedates[match] <= as_of:
+            order = sub_orders[match]
+            periods.append(BillingPeriod(
+                expected_date=expected_date, status="matched", order_id=order.id, closedate=order.closedate
+            ))
+        else:
+            periods.append(BillingPeriod(expected_date=expected_date, status="missed"))
+    return periods
+
+def calculate_missed_payments_by_subscription(subscriptions: List[Subscription], all_orders: Dict[int, List[Order]],
+                                              as_of: Optional[datetime] = None,
+                                              grace_days: int = GRACE_DAYS) -> List[SubscriptionMissedPayments]:
+    """
+    Calculate the number and value of missed payments for each on-hold or active subscription.
+    Payments are evaluated as of `as_of` (default: now); orders closed after it are ignored.
+    """
+    now = as_of or datetime.now(timezone.utc)
+    results = []
     
     for sub in subscriptions:
-        if sub.status__c not in ["active", "on-hold"]:
-            continue
-            
-        # Skip subscriptions with no recurring amount
-        if not sub.recurring_amount__c:
+        # Only active or on-hold subscriptions with a recurring amount can miss payments
+        if not is_billable(sub):
             continue
             
         # Get orders for this subscription
         sub_orders = all_orders.get(sub.id, [])
         
-        # Sort orders by date
-        sub_orders.sort(key=lambda x: x.closedate)
-        
-        # Parse billing interval
-        interval_value, interval_unit = parse_billing_interval(sub.billing_interval__c)
-        
-        # Calculate expected number of orders based on start date and billing interval
-        expected_dates = []
-        current_date = sub.start_date__c
-        
-        while current_date <= now:
-            expected_dates.append(current_date)
-            
-            # Calculate the next expected date based on the billing interval
-            if interval_unit == "month" or interval_unit == "months":
-                current_date += relativedelta(months=interval_value)
-            elif interval_unit == "year" or interval_unit == "years":
-                current_date += relativedelta(years=interval_value)
-            elif interval_unit == "day" or interval_unit == "days":
-                current_date += timedelta(days=interval_value)
-            elif interval_unit == "week" or interval_unit == "weeks":
-                current_date += timedelta(weeks=interval_value)
-            else:
-                # Default to monthly if unit is unknown
-                current_date += relativedelta(months=interval_value)
-        
-        # Count how many expected dates don't have a corresponding order
-        # Allow for a 7-day window for each expected date
-        for expected_date in expected_dates:
-            order_found = False
-            for order in sub_orders:
-                # If an order exists within 7 days of the expected date, count it as fulfilled
-                if abs((order.closedate - expected_date).days) <= 7:
-                    order_found = True
-                    break
-            
-            if not order_found:
-                missed_payments_count += 1
-                missed_payments_value += sub.recurring_amount__c or 0
+        missed = count_missed_payments(sub, sub_orders, now, grace_days)
+        results.append(SubscriptionMissedPayments(
+            subscription_id=sub.id,
+            status=sub.status__c,
+            recurring_amount=sub.recurring_amount__c,
+            missed_payments_count=missed,
+            missed_payments_value=missed * sub.recurring_amount__c
+        ))
+    
+    return results
+
+def summarize_missed_payments(per_subscription: List[SubscriptionMissedPayments]) -> MissedPaymentStats:
+    """
+    Add up per-subscription missed payments into totals.
+    """
+    missed_payments_count = 0
+    missed_payments_value = 0.0
+    
+    for result in per_subscription:
+        missed_payments_count += result.missed_payments_count
+        missed_payments_value += result.missed_payments_value
     
     return MissedPaymentStats(
         missed_payments_count=missed_payments_count,
         missed_payments_value=missed_payments_value
-    )
\ No newline at end of file
+    )
+
+def calculate_missed_payments(subscriptions: List[Subscription], all_orders: Dict[int, List[Order]],
+                              as_of: Optional[datetime] = None, grace_days: int = GRACE_DAYS) -> MissedPaymentStats:
+    """
+    Calculate the number and value of missed payments from on-hold or active subscriptions.
+    Payments are evaluated as of `as_of` (default: now); orders closed after it are ignored.
+    """
+    return summarize_missed_payments(
+        calculate_missed_payments_by_subscription(subscriptions, all_orders, as_of, grace_days)
+    )
+
+def calculate_missed_payments_by_grace(subscriptions: List[Subscription], all_orders: Dict[int, List[Order]],
+                                       grace_days: List[int], as_of: Optional[datetime] = None) -> List[GraceWindowStats]:
+    """
+    Calculate missed payments under several grace windows at once.
+
+    Gives the same numbers as calling calculate_missed_payments once per
+    window, but each subscription is swept once: every expected date gets
+    the distance in days to its nearest order, and it is missed under exactly
+    the windows smaller than that distance.
+    """
+    now = as_of or datetime.now(timezone.utc)
+    windows = sorted(set(grace_days))
+    count_delta = [0] * (len(windows) + 1)
+    value_delta = [0.0] * (len(windows) + 1)
+
+    for sub in subscriptions:
+        if not is_billable(sub):
+            continue
+
+        # Orders closing after `now` had not happened yet at that point
+        closedates = sorted(order.closedate for order in all_orders.get(sub.id, []) if order.closedate <= now)
+        for distance in _nearest_order_distances(_expected_billing_dates(sub, now), closedates):
+            # Missed under every window below the distance to the nearest order
+            missed_windows = len(windows) if distance is None else bisect_left(windows, distance)
+            if missed_windows:
+                count_delta[0] += 1
+                count_delta[missed_windows] -= 1
+                value_delta[0] += sub.recurring_amount__c
+                value_delta[missed_windows] -= sub.recurring_amount__c
+
+    stats = {}
+    missed_count = 0
+    missed_value = 0.0
+    for position, window in enumerate(windows):
+        missed_count += count_delta[position]
+        missed_value += value_delta[position]
+        stats[window] = GraceWindowStats(
+            grace_days=window,
+            missed_payments_count=missed_count,
+            missed_payments_value=missed_value
+        )
+    return [stats[window] for window in grace_days]
+
+def top_delinquent_subscriptions(per_subscription: List[SubscriptionMissedPayments],
+                                 limit: int) -> List[SubscriptionMissedPayments]:
+    """
+    Select the `limit` subscriptions with the highest missed value (ties broken by missed count).
+
+    Uses a bounded heap, so the cost is O(n log limit) instead of a full sort.
+    """
+    delinquent = (result for result in per_subscription if result.missed_payments_count > 0)
+    return heapq.nlargest(
+        limit, delinquent, key=lambda result: (result.missed_payments_value, result.missed_payments_count)
+    )
+
+def calculate_missed_payment_trend(subscriptions: List[Subscription], all_orders: Dict[int, List[Order]],
+                                   as_of_dates: List[datetime]) -> List[MissedPaymentTrendPoint]:
+    """
+    Calculate missed payment count and value at each of several as-of dates.
+
+    Gives the same numbers as calling calculate_missed_payments once per date,
+    but in a single pass per subscription: an expected date is missed from the
+    date itself until its earliest matching order closes (or forever), so each
+    expected date adds +1 / -1 events to a difference array over the sorted
+    as-of dates, and prefix sums give the value at every date.
+    """
+    if not as_of_dates:
+        return []
+
+    ranking = sorted(range(len(as_of_dates)), key=lambda i: as_of_dates[i])
+    sorted_dates = [as_of_dates[i] for i in ranking]
+    latest = sorted_dates[-1]
+
+    count_delta = [0] * (len(sorted_dates) + 1)
+    value_delta = [0.0] * (len(sorted_dates) + 1)
+
+    for sub in subscriptions:
+        if not is_billable(sub):
+            continue
+
+        expected_dates = _expected_billing_dates(sub, latest)
+        closedates = sorted(order.closedate for order in all_orders.get(sub.id, []))
+        amount = sub.recurring_amount__c
+
+        for expected_date, match in zip(expected_dates, _first_matching_orders(expected_dates, closedates)):
+            # Missed at every as-of date in [expected_date, match)
+            start = bisect_left(sorted_dates, expected_date)
+            end = len(sorted_dates) if match is None else bisect_left(sorted_dates, closedates[match])
+            if start < end:
+                count_delta[start] += 1
+                count_delta[end] -= 1
+                value_delta[start] += amount
+                value_delta[end] -= amount
+
+    points: List[Optional[MissedPaymentTrendPoint]] = [None] * len(as_of_dates)
+    missed_count = 0
+    missed_value = 0.0
+    for position, index in enumerate(ranking):
+        missed_count += count_delta[position]
+        missed_value += value_delta[position]
+        points[index] = MissedPaymentTrendPoint(
+            as_of=as_of_dates[index],
+            missed_payments_count=missed_count,
+            missed_payments_value=missed_value
+        )
+    return points
+
+def build_distribution_sketches(subscriptions: List[Subscription], all_orders: Dict[int, List[Order]],
+                                alpha: float = DEFAULT_SKETCH_ALPHA,
+                                as_of: Optional[datetime] = None) -> Dict[str, QuantileSketch]:
+    """
+    Build quantile sketches for subscription length, missed-payment value per
+    subscription and order value. Sketches built over disjoint shards of the
+    data can be combined with `QuantileSketch.merge`.
+    """
+    now = as_of or datetime.now(timezone.utc)
+    sketches = {
+        "subscription_length_days": QuantileSketch(alpha),
+        "missed_payment_value_per_subscription": QuantileSketch(alpha),
+        "order_value": QuantileSketch(alpha),
+    }
+
+    for sub in subscriptions:
+        # Same length definition as calculate_subscription_stats
+        end_date = sub.end_date__c if sub.end_date__c else now if sub.status__c == "canceled" else None
+        if sub.start_date__c and end_date:
+            sketches["subscription_length_days"].add((end_date - sub.start_date__c).days)
+
+        sub_orders = all_orders.get(sub.id, [])
+        for order in sub_orders:
+            sketches["order_value"].add(order.total_order_value__c)
+
+        if is_billable(sub):
+            missed = count_missed_payments(sub, sub_orders, now)
+            sketches["missed_payment_value_per_subscription"].add(missed * sub.recurring_amount__c)
+
+    return sketches
+
+def summarize_sketches(sketches: Dict[str, QuantileSketch]) -> DistributionStats:
+    """
+    Turn a set of (possibly merged) sketches into p50/p90/p99 summaries.
+    """
+    def summarize(sketch: QuantileSketch) -> QuantileSummary:
+        return QuantileSummary(
+            count=sketch.count,
+            p50=sketch.quantile(0.5),
+            p90=sketch.quantile(0.9),
+            p99=sketch.quantile(0.99)
+        )
+
+    return DistributionStats(
+        relative_accuracy=sketches["order_value"].alpha,
+        subscription_length_days=summarize(sketches["subscription_length_days"]),
+        missed_payment_value_per_subscription=summarize(sketches["missed_payment_value_per_subscription"]),
+        order_value=summarize(sketches["order_value"])
+    )
+
+def calculate_distributions(subscriptions: List[Subscription], all_orders: Dict[int, List[Order]],
+                            as_of: Optional[datetime] = None) -> DistributionStats:
+    """
+    Calculate approximate p50/p90/p99 of subscription length, missed-payment
+    value per subscription and order value using bounded-memory sketches.
+    """
+    return summarize_sketches(build_distribution_sketches(subscriptions, all_orders, as_of=as_of))
@@ -1,40 +1,73 @@
 import httpx
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, MutableMapping, Optional
+import asyncio
 import logging
+import os
+import time
 from datetime import datetime
+from app.cassette import cassette_transport
+from app.cache import CacheBackend, CACHE_TTL_SECONDS, dump_models, load_models
+from app.metrics import UPSTREAM_REQUEST_SECONDS, UPSTREAM_IN_FLIGHT, TRUNCATED_PAGINATIONS, count_page, record_cache_lookup
 from app.models import Subscription, Order
+from app.tracing import span
 
 logger = logging.getLogger(__name__)
 
 class AudicusAPIClient:
     BASE_URL = "https://jungle.audicus.com/v1/coding_test"
     
-    def __init__(self):
-        self.client = httpx.AsyncClient(timeout=30.0)
+    def __init__(self, order_index: Optional[MutableMapping[int, Order]] = None, cache: Optional[CacheBackend] = None,
+                 base_url: Optional[str] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
+        # Recorded or replayed through a cassette when AUDICUS_RECORD or AUDICUS_REPLAY is set
+        self.client = httpx.AsyncClient(timeout=30.0, transport=transport or cassette_transport())
+        # Point at another upstream (e.g. a local mock) with base_url or AUDICUS_BASE_URL
+        self.base_url = (base_url or os.getenv("AUDICUS_BASE_URL") or self.BASE_URL).rstrip("/")
+        # Orders fetched so far, by id (e.g. an OrderIndex); may be shared between clients
+        self.order_index = order_index if order_index is not None else {}
+        # Complete subscription listings and per-subscription orders are cached here when set
+        self.cache = cache
     
     async def close(self):
         await self.client.aclose()
     
-    async def get_subscriptions(self, per_page: int = 100) -> List[Subscription]:
+    async def _get(self, endpoint: str, url: str, **attributes) -> httpx.Response:
         """
-        Fetch all subscriptions from the API with pagination.
+        GET from upstream, recording latency by endpoint and status and a
+        span carrying `attributes`.
         """
-        all_subscriptions = []
-        page = 1
-        more_pages = True
-        
-        while more_pages:
+        status = "error"
+        started = time.perf_counter()
+        UPSTREAM_IN_FLIGHT.inc()
+        with span("upstream.request", endpoint=endpoint, **attributes) as request_span:
             try:
-                url = f"{self.BASE_URL}/subscriptions/{page}?per_page={per_page}"
                 response = await self.client.get(url)
+                status = str(response.status_code)
+                return response
+            finally:
+                UPSTREAM_IN_FLIGHT.dec()
+                UPSTREAM_REQUEST_SECONDS.labels(endpoint, status).observe(time.perf_counter() - started)
+                request_span.set("status", status)
+    
+    async def subscription_pages(self, per_page: int = 100) -> AsyncIterator[List[Subscription]]:
+        """
+        Fetch all subscriptions from the API, one page at a time, without
+        keeping earlier pages. A page that cannot be fetched ends the listing
+        by raising, so callers can tell a truncated listing from a complete one.
+        """
+        page = 1
+        while True:
+            try:
+                url = f"{self.base_url}/subscriptions/{page}?per_page={per_page}"
+                count_page()
+                response = await self._get("subscriptions", url, page=page)
                 response.raise_for_status()
                 
                 data = response.json()
                 subscriptions = data.get("subscriptions", [])
                 
                 if not subscriptions:
-                    more_pages = False
-                else:
+                    return
+                with span("decode", summarize=True, endpoint="subscriptions", records=len(subscriptions)):
                     # Convert string dates to datetime objects
                     for sub in subscriptions:
                         for date_field in ["end_date__c", "next_payment_date__c", "start_date__c"]:
@@ -44,15 +77,44 @@ class AudicusAPIClient:
                                 except (ValueError, AttributeError):
                                     sub[date_field] = None
                     
-                    all_subscriptions.extend([Subscription(**sub) for sub in subscriptions])
-                    page += 1
+                    page_subscriptions = [Subscription(**sub) for sub in subscriptions]
                     
             except httpx.HTTPError as e:
                 logger.error(f"HTTP error fetching subscriptions page {page}: {e}")
-                more_pages = False
+                TRUNCATED_PAGINATIONS.labels("subscriptions").inc()
+                raise
             except Exception as e:
                 logger.error(f"Error fetching subscriptions page {page}: {e}")
-                more_pages = False
+                TRUNCATED_PAGINATIONS.labels("subscriptions").inc()
+                raise
+            
+            yield page_subscriptions
+            page += 1
+    
+    async def get_subscriptions(self, per_page: int = 100) -> List[Subscription]:
+        """
+        Fetch all subscriptions from the API with pagination.
+        """
+        cache_key = f"subscriptions:{per_page}"
+        if self.cache is not None:
+            cached = await self.cache.get(cache_key)
+            record_cache_lookup("subscriptions", cached is not None)
+            if cached is not None:
+                return load_models(Subscription, cached)
+        
+        all_subscriptions = []
+        complete = True
+        
+        try:
+            async for subscriptions in self.subscription_pages(per_page):
+                all_subscriptions.extend(subscriptions)
+        except Exception:
+            # Logged by subscription_pages; serve what was fetched
+            complete = False
+        
+        # Listings cut short by an error are not cached
+        if self.cache is not None and complete and all_subscriptions:
+            await self.cache.set(cache_key, dump_models(all_subscriptions), CACHE_TTL_SECONDS)
                 
         return all_subscriptions
     
@@ -60,14 +122,26 @@ class AudicusAPIClient:
         """
         Fetch all orders for a specific subscription with pagination.
         """
+        cache_key = f"orders:{subscription_id}"
+        if self.cache is not None:
+            cached = await self.cache.get(cache_key)
+            record_cache_lookup("orders", cached is not None)
+            if cached is not None:
+                cached_orders = load_models(Order, cached)
+                for order in cached_orders:
+                    self.order_index[order.id] = order
+                return cached_orders
+        
         all_orders = []
         page = 1
         more_pages = True
+        complete = True
         
         while more_pages:
             try:
-                url = f"{self.BASE_URL}/orders/{subscription_id}/{page}"
-                response = await self.client.get(url)
+                url = f"{self.base_url}/orders/{subscription_id}/{page}"
+                count_page()
+                response = await self._get("orders", url, subscription_id=subscription_id, page=page)
                 response.raise_for_status()
                 
                 data = response.json()
@@ -76,20 +150,32 @@ class AudicusAPIClient:
                 if not orders:
                     more_pages = False
                 else:
-                    # Convert string dates to datetime objects
-                    for order in orders:
-                        if order.get("closedate"):
-                            order["closedate"] = datetime.fromisoformat(order["closedate"].replace("Z", "+00:00"))
-                    
-                    all_orders.extend([Order(**order) for order in orders])
+                    with span("decode", summarize=True, endpoint="orders", records=len(orders)):
+                        # Convert string dates to datetime objects
+                        for order in orders:
+                            if order.get("closedate"):
+                                order["closedate"] = datetime.fromisoformat(order["closedate"].replace("Z", "+00:00"))
+                        
+                        page_orders = [Order(**order) for order in orders]
+                    for order in page_orders:
+                        self.order_index[order.id] = order
+                    all_orders.extend(page_orders)
                     page += 1
                     
             except httpx.HTTPError as e:
                 logger.error(f"HTTP error fetching orders for subscription {subscription_id}, page {page}: {e}")
                 more_pages = False
+                complete = False
             except Exception as e:
                 logger.error(f"Error fetching orders for subscription {subscription_id}, page {page}: {e}")
                 more_pages = False
+                complete = False
+        
+        if not complete:
+            TRUNCATED_PAGINATIONS.labels("orders").inc()
+        
+        if self.cache is not None and complete:
+            await self.cache.set(cache_key, dump_models(all_orders), CACHE_TTL_SECONDS)
                 
         return all_orders
         
@@ -98,8 +184,8 @@ class AudicusAPIClient:
         Fetch a specific order by ID.
         """
         try:
-            url = f"{self.BASE_URL}/order/{order_id}"
-            response = await self.client.get(url)
+            url = f"{self.base_url}/order/{order_id}"
+            response = await self._get("order", url)
             response.raise_for_status()
             
             data = response.json()
@@ -108,11 +194,39 @@ class AudicusAPIClient:
             if order_data and order_data.get("closedate"):
                 order_data["closedate"] = datetime.fromisoformat(order_data["closedate"].replace("Z", "+00:00"))
                 
-            return Order(**order_data) if order_data else None
+            if not order_data:
+                return None
+            
+            order = Order(**order_data)
+            self.order_index[order.id] = order
+            return order
             
         except httpx.HTTPError as e:
             logger.error(f"HTTP error fetching order {order_id}: {e}")
             return None
         except Exception as e:
             logger.error(f"Error fetching order {order_id}: {e}")
-            return None
\ No newline at end of file
+            return None
+    
+    async def get_orders(self, order_ids: List[int], max_concurrency: int = 10) -> List[Optional[Order]]:
+        """
+        Fetch several orders by ID, in the order requested.
+        
+        Orders already pulled by get_subscription_orders or get_order are
+        served from the order index; only the misses are fetched, with at
+        most `max_concurrency` requests in flight. Orders that cannot be
+        fetched come back as None.
+        """
+        misses = list(dict.fromkeys(order_id for order_id in order_ids if order_id not in self.order_index))
+        
+        if misses:
+            logger.info(f"Fetching {len(misses)} of {len(order_ids)} orders not in the order index")
+            semaphore = asyncio.Semaphore(max_concurrency)
+            
+            async def fetch(order_id: int):
+                async with semaphore:
+                    await self.get_order(order_id)
+            
+            await asyncio.gather(*[fetch(order_id) for order_id in misses])
+        
+        return [self.order_index.get(order_id) for order_id in order_ids]
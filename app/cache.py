@@ -0,0 +1,244 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple, Type, TypeVar
+from pydantic import BaseModel
+from app.metrics import CACHE_EVICTIONS
+from app.models import Order
+
+logger = logging.getLogger(__name__)
+
+M = TypeVar("M", bound=BaseModel)
+
+# Where cached upstream responses and snapshots are kept, e.g. memory://,
+# sqlite:///var/cache/audicus.db or redis://localhost:6379/0 (unset: no cache)
+CACHE_URL = os.getenv("CACHE_URL")
+
+# How long cached upstream responses are served
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+
+# Entries kept by the in-memory backend before the least recently used are evicted
+MEMORY_CACHE_MAX_ENTRIES = 100_000
+
+# Orders kept by an order index before the least recently used are evicted
+ORDER_INDEX_MAX_ENTRIES = 100_000
+
+class CacheBackend(ABC):
+    """
+    Byte-valued key-value store with per-key expiry, shared by everything
+    that caches upstream data. Implementations decide where the bytes live
+    (process memory, a SQLite file, a Redis server); callers serialize.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Per-process cache with least-recently-used eviction.
+    """
+
+    def __init__(self, max_entries: int = MEMORY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            CACHE_EVICTIONS.inc()
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def size_bytes(self) -> int:
+        """
+        Bytes held by the entries: keys, values and their expiry bookkeeping.
+        """
+        return sys.getsizeof(self._entries) + sum(
+            sys.getsizeof(key) + sys.getsizeof(entry) + sys.getsizeof(entry[0]) + sys.getsizeof(entry[1])
+            for key, entry in list(self._entries.items())
+        )
+
+class OrderIndex(MutableMapping):
+    """
+    Orders by id, as fetched from upstream, for serving repeat lookups.
+
+    Orders are forgotten CACHE_TTL_SECONDS after they were fetched, like any
+    cached upstream response, so changes upstream show up; past `max_entries`
+    the least recently used are evicted.
+    """
+
+    def __init__(self, max_entries: int = ORDER_INDEX_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, Tuple[float, Order]]" = OrderedDict()
+
+    def __getitem__(self, order_id: int) -> Order:
+        expires, order = self._entries[order_id]
+        if expires <= time.monotonic():
+            del self._entries[order_id]
+            raise KeyError(order_id)
+        self._entries.move_to_end(order_id)
+        return order
+
+    def __setitem__(self, order_id: int, order: Order) -> None:
+        self._entries[order_id] = (time.monotonic() + self.ttl_seconds, order)
+        self._entries.move_to_end(order_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __delitem__(self, order_id: int) -> None:
+        del self._entries[order_id]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Cache in a SQLite file, shared by every process on the host that opens it.
+    Calls run in worker threads, each with its own connection.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _get(self, key: str) -> Optional[bytes]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                (key, value, now + ttl_seconds)
+            )
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+
+    def _delete(self, key: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl_seconds)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Cache on a Redis-protocol server, shared by every replica pointing at it.
+
+    Needs the `redis` package; any asyncio client with the same get, set and
+    delete methods (such as fakeredis) can be passed in instead of a URL.
+    """
+
+    def __init__(self, url: Optional[str] = None, client=None, prefix: str = "audicus:"):
+        if client is None:
+            try:
+                import redis.asyncio
+            except ImportError:
+                raise ImportError("The redis package is required for redis:// cache URLs")
+            client = redis.asyncio.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        await self.client.set(self.prefix + key, value, px=max(1, int(ttl_seconds * 1000)))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(self.prefix + key)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+def create_cache_backend(url: str) -> CacheBackend:
+    """
+    Build the backend a cache URL points at: memory://, sqlite:///<path> or redis[s]://...
+    """
+    if url.startswith("memory://"):
+        return MemoryCacheBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteCacheBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://")):
+        return RedisCacheBackend(url)
+    raise ValueError(f"Unsupported cache URL: {url}")
+
+def dump_models(models: List[BaseModel]) -> bytes:
+    """
+    Serialize models compactly: field names once, then one row of values per
+    model, as JSON compressed with zlib.
+    """
+    fields = list(models[0].__dict__) if models else []
+    rows = [[getattr(model, name) for name in fields] for model in models]
+    payload = json.dumps({"fields": fields, "rows": rows}, separators=(",", ":"),
+                         default=lambda value: value.isoformat() if isinstance(value, datetime) else str(value))
+    return zlib.compress(payload.encode("utf-8"))
+
+def load_models(model_class: Type[M], data: bytes) -> List[M]:
+    payload = json.loads(zlib.decompress(data))
+    fields = payload["fields"]
+    return [model_class(**dict(zip(fields, row))) for row in payload["rows"]]
+
+cache_backend: Optional[CacheBackend] = create_cache_backend(CACHE_URL) if CACHE_URL else None
@@ -0,0 +1,220 @@
+import asyncio
+import atexit
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Record every upstream response into this cassette file (gzipped JSON)
+AUDICUS_RECORD = os.getenv("AUDICUS_RECORD")
+
+# Serve upstream responses from this cassette instead of the network
+AUDICUS_REPLAY = os.getenv("AUDICUS_REPLAY")
+
+# Replay latency divisor: 1 keeps the recorded timing, 2 halves it, 0 answers immediately
+AUDICUS_REPLAY_SPEED = float(os.getenv("AUDICUS_REPLAY_SPEED", "1"))
+
+# Bumped when the cassette layout changes
+CASSETTE_FORMAT = 1
+
+# Response headers worth keeping; the rest are dropped to keep cassettes small
+KEPT_HEADERS = ("content-type", "retry-after")
+
+# Headers describing the encoded body, which no longer apply once it is read
+BODY_ENCODING_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+class CassetteMissError(httpx.TransportError):
+    """
+    A replayed request that the cassette has no response for.
+    """
+
+class Cassette:
+    """
+    Upstream interactions recorded in order.
+
+    Each interaction is (method, target, status, latency in seconds, kept
+    headers, body), where target is the URL path and query without scheme or
+    host, so a cassette recorded against one upstream replays against any
+    base URL. Saved as gzipped JSON; response bodies repeat field names on
+    every record, which is what compresses best.
+    """
+
+    def __init__(self, interactions: Optional[List[list]] = None, recorded_at: Optional[str] = None):
+        self.interactions = interactions if interactions is not None else []
+        self.recorded_at = recorded_at or datetime.now(timezone.utc).isoformat()
+        # Held only for appends and copying the list, never while writing
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._saved_count = len(self.interactions)
+        self._by_target: Optional[Dict[Tuple[str, str], List[list]]] = None
+
+    def __len__(self) -> int:
+        return len(self.interactions)
+
+    def add(self, method: str, target: str, status: int, latency: float, headers: Dict[str, str], body: str) -> None:
+        with self._lock:
+            self.interactions.append([method, target, status, round(latency, 6), headers, body])
+            self._by_target = None
+
+    def by_target(self) -> Dict[Tuple[str, str], List[list]]:
+        """
+        Responses (status, latency, headers, body) by (method, target), in recorded order.
+        """
+        if self._by_target is None:
+            by_target = defaultdict(list)
+            for method, target, *response in self.interactions:
+                by_target[(method, target)].append(response)
+            self._by_target = dict(by_target)
+        return self._by_target
+
+    @property
+    def unsaved(self) -> bool:
+        return len(self.interactions) != self._saved_count
+
+    def save(self, path: str) -> None:
+        """
+        Write the cassette atomically, so a reader never sees half of it.
+
+        Only the copy of the interaction list is taken under the lock that
+        `add` uses, so recording carries on while the file is written.
+        """
+        with self._save_lock:
+            with self._lock:
+                interactions = list(self.interactions)
+            data = {"format": CASSETTE_FORMAT, "recorded_at": self.recorded_at, "interactions": interactions}
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+            self._saved_count = len(interactions)
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != CASSETTE_FORMAT:
+            raise ValueError(f"{path} is cassette format {data.get('format')}, expected {CASSETTE_FORMAT}")
+        return cls(data["interactions"], data["recorded_at"])
+
+    @classmethod
+    def load_recording(cls, path: str) -> "Cassette":
+        """
+        The cassette at `path` merged with the ones every recording process
+        saved beside it (see save_recordings), each keeping its own order.
+        """
+        paths = [path] if os.path.exists(path) else []
+        paths += sorted(
+            (candidate for candidate in glob.glob(f"{glob.escape(path)}.*") if candidate.rsplit(".", 1)[1].isdigit()),
+            key=lambda candidate: int(candidate.rsplit(".", 1)[1])
+        )
+        if not paths:
+            raise FileNotFoundError(f"No cassette at {path} or recorded beside it")
+        cassettes = [cls.load(cassette_path) for cassette_path in paths]
+        return cls([interaction for cassette in cassettes for interaction in cassette.interactions],
+                   min(cassette.recorded_at for cassette in cassettes))
+
+def _target(request: httpx.Request) -> str:
+    return request.url.raw_path.decode("ascii")
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """
+    Passes requests through to `transport` and records each response into
+    the cassette, which is saved separately (see save_recordings).
+    """
+
+    def __init__(self, cassette: Cassette, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.cassette = cassette
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        body = await response.aread()
+        latency = time.perf_counter() - started
+
+        headers = {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers}
+        self.cassette.add(request.method, _target(request), response.status_code, latency, headers,
+                          body.decode("utf-8", errors="replace"))
+        passed_headers = [(name, value) for name, value in response.headers.items() if name not in BODY_ENCODING_HEADERS]
+        return httpx.Response(response.status_code, headers=passed_headers, content=body, request=request)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    Answers requests from a cassette, after the recorded latency divided by
+    `speed` (0: immediately).
+
+    Repeated requests for the same target get the recorded responses in
+    order and then start over, so a workload can be replayed any number of
+    times. Requests the cassette never saw raise CassetteMissError.
+    """
+
+    def __init__(self, cassette: Cassette, speed: float = 1.0):
+        self.speed = speed
+        self.responses = cassette.by_target()
+        self.positions: Dict[Tuple[str, str], int] = defaultdict(int)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = (request.method, _target(request))
+        responses = self.responses.get(key)
+        if not responses:
+            raise CassetteMissError(f"No recorded response for {request.method} {key[1]}", request=request)
+
+        position = self.positions[key]
+        self.positions[key] = (position + 1) % len(responses)
+        status, latency, headers, body = responses[position]
+        if self.speed > 0 and latency > 0:
+            await asyncio.sleep(latency / self.speed)
+        return httpx.Response(status, headers=headers, content=body.encode("utf-8"), request=request)
+
+# Cassettes shared by every client in the process, by path
+_recordings: Dict[str, Cassette] = {}
+_replays: Dict[str, Cassette] = {}
+
+def cassette_transport(record: Optional[str] = AUDICUS_RECORD, replay: Optional[str] = AUDICUS_REPLAY,
+                       speed: float = AUDICUS_REPLAY_SPEED) -> Optional[httpx.AsyncBaseTransport]:
+    """
+    Transport for a new upstream client: replaying `replay`, recording into
+    `record`, or None for the network as usual.
+
+    Every client recording to the same path appends to one cassette, which
+    is written by save_recordings at shutdown (or at exit); replaying the
+    path merges what each process recorded.
+    """
+    if replay and record:
+        raise ValueError("Set AUDICUS_RECORD or AUDICUS_REPLAY, not both")
+    if replay:
+        if replay not in _replays:
+            _replays[replay] = Cassette.load_recording(replay)
+            logger.info(f"Replaying {len(_replays[replay])} upstream responses from {replay}")
+        return ReplayTransport(_replays[replay], speed)
+    if record:
+        if not _recordings:
+            atexit.register(save_recordings)
+        cassette = _recordings.setdefault(record, Cassette())
+        return RecordingTransport(cassette)
+    return None
+
+def save_recordings() -> None:
+    """
+    Write every cassette recorded in this process that has new interactions.
+
+    Each process saves to its own `{path}.{pid}`, so that workers recording
+    to the same path don't overwrite each other's cassettes.
+    """
+    for path, cassette in list(_recordings.items()):
+        if cassette.unsaved:
+            process_path = f"{path}.{os.getpid()}"
+            cassette.save(process_path)
+            logger.info(f"Saved {len(cassette)} upstream responses to {process_path}")
@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from app.models import Subscription, Order, CohortRetention, CohortRetentionResponse
+
+def _months_between(start: datetime, end: datetime) -> int:
+    """
+    Number of whole months from `start` to `end` (negative if `end` is earlier).
+    """
+    months = (end.year - start.year) * 12 + end.month - start.month
+    if (end.day, end.time()) < (start.day, start.time()):
+        months -= 1
+    return months
+
+def calculate_cohort_retention(subscriptions: List[Subscription], all_orders: Dict[int, List[Order]],
+                               max_months: int = 36, now: Optional[datetime] = None) -> CohortRetentionResponse:
+    """
+    Build a retention matrix of subscriptions grouped by start month.
+
+    A subscription is retained at month offset k if it was still running k
+    whole months after it started. Subscriptions end at `end_date__c`, or at
+    `now` when canceled without an end date; everything else is still running.
+    Offsets a cohort has not reached yet are left out.
+
+    Runs in a single pass: each subscription adds one count to a histogram of
+    lifetimes for its cohort, and retention is the suffix sum of that histogram,
+    so the cost is O(subscriptions + cohorts * max_months).
+    """
+    now = now or datetime.now(timezone.utc)
+
+    lifetimes: Dict[str, List[int]] = {}
+    horizons: Dict[str, int] = {}
+    paid_orders: Dict[str, int] = {}
+    paid_order_value: Dict[str, float] = {}
+
+    for sub in subscriptions:
+        if not sub.start_date__c:
+            continue
+
+        start = sub.start_date__c
+        cohort = f"{start.year:04d}-{start.month:02d}"
+        if cohort not in lifetimes:
+            cohort_start = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            horizons[cohort] = max(0, min(_months_between(cohort_start, now), max_months))
+            lifetimes[cohort] = [0] * (horizons[cohort] + 1)
+            paid_orders[cohort] = 0
+            paid_order_value[cohort] = 0.0
+
+        horizon = horizons[cohort]
+        end_date = sub.end_date__c if sub.end_date__c else now if sub.status__c == "canceled" else None
+        lifetime = horizon if end_date is None else max(0, min(_months_between(start, end_date), horizon))
+        lifetimes[cohort][lifetime] += 1
+
+        for order in all_orders.get(sub.id, []):
+            paid_orders[cohort] += 1
+            paid_order_value[cohort] += order.total_order_value__c
+
+    cohorts = []
+    for cohort in sorted(lifetimes):
+        histogram = lifetimes[cohort]
+        retained = [0] * len(histogram)
+        running = 0
+        for offset in range(len(histogram) - 1, -1, -1):
+            running += histogram[offset]
+            retained[offset] = running
+
+        size = retained[0]
+        cohorts.append(CohortRetention(
+            cohort=cohort,
+            subscriptions=size,
+            retained=retained,
+            retention_rate=[count / size for count in retained],
+            paid_orders=paid_orders[cohort],
+            paid_order_value=paid_order_value[cohort]
+        ))
+
+    return CohortRetentionResponse(max_months=max_months, cohorts=cohorts)
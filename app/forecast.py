@@ -0,0 +1,193 @@
+import os
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from dateutil.relativedelta import relativedelta
+from app.analytics import parse_billing_interval, advance_billing_date
+from app.models import Subscription, ForecastBucket, ForecastResponse
+from app.snapshot import Snapshot
+
+# Days of projected payments kept in the index; queries must end within it
+FORECAST_HORIZON_DAYS = int(os.getenv("FORECAST_HORIZON_DAYS", "730"))
+
+# Longest forecast the endpoint accepts
+MAX_FORECAST_DAYS = 365
+
+class FenwickTree:
+    """
+    Binary indexed tree over a fixed number of slots, supporting point
+    updates and prefix sums in O(log n).
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._tree = [0.0] * (size + 1)
+
+    def add(self, index: int, delta: float) -> None:
+        index += 1
+        while index <= self.size:
+            self._tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, end: int) -> float:
+        """
+        Sum of slots [0, end).
+        """
+        end = min(max(end, 0), self.size)
+        total = 0.0
+        while end > 0:
+            total += self._tree[end]
+            end -= end & -end
+        return total
+
+    def range_sum(self, start: int, end: int) -> float:
+        """
+        Sum of slots [start, end).
+        """
+        return self.prefix_sum(end) - self.prefix_sum(start)
+
+def _fingerprint(sub: Subscription) -> Tuple:
+    return (sub.status__c, sub.next_payment_date__c, sub.billing_interval__c, sub.recurring_amount__c)
+
+class RevenueIndex:
+    """
+    Index of projected recurring payments for active subscriptions.
+
+    Each active subscription with a recurring amount and a next payment date
+    is projected forward along its billing interval. Payments are bucketed by
+    day into Fenwick trees (one for amounts, one for payment counts), so any
+    date range sum costs O(log horizon).
+
+    The index is kept in sync with snapshots incrementally: only subscriptions
+    whose next payment date, interval, amount or status changed are removed
+    and re-projected, and queries never rebuild anything.
+    """
+
+    def __init__(self, horizon_days: int = FORECAST_HORIZON_DAYS):
+        if horizon_days <= MAX_FORECAST_DAYS:
+            raise ValueError("horizon_days must exceed MAX_FORECAST_DAYS")
+        self.horizon_days = horizon_days
+        self.version: Optional[int] = None
+        self.base_day: Optional[int] = None
+        self._reset(None)
+
+    def _reset(self, base_day: Optional[int]) -> None:
+        self.base_day = base_day
+        self._amounts = FenwickTree(self.horizon_days)
+        self._payments = FenwickTree(self.horizon_days)
+        self._entries: Dict[int, Tuple[Tuple, float, List[int]]] = {}
+
+    def _project(self, sub: Subscription) -> List[int]:
+        """
+        Slots of every projected payment of a subscription inside the horizon.
+        """
+        if sub.status__c != "active" or not sub.recurring_amount__c or not sub.next_payment_date__c:
+            return []
+
+        interval_value, interval_unit = parse_billing_interval(sub.billing_interval__c)
+        end_day = self.base_day + self.horizon_days
+        slots = []
+        current_date = sub.next_payment_date__c
+        while current_date.date().toordinal() < end_day:
+            slot = current_date.date().toordinal() - self.base_day
+            if slot >= 0:
+                slots.append(slot)
+            current_date = advance_billing_date(current_date, interval_value, interval_unit)
+        return slots
+
+    def _insert(self, sub: Subscription) -> None:
+        slots = self._project(sub)
+        amount = sub.recurring_amount__c or 0.0
+        for slot in slots:
+            self._amounts.add(slot, amount)
+            self._payments.add(slot, 1)
+        self._entries[sub.id] = (_fingerprint(sub), amount, slots)
+
+    def _remove(self, sub_id: int) -> None:
+        _, amount, slots = self._entries.pop(sub_id)
+        for slot in slots:
+            self._amounts.add(slot, -amount)
+            self._payments.add(slot, -1)
+
+    def update(self, subscriptions: List[Subscription], today: date) -> int:
+        """
+        Bring the index in line with `subscriptions`, returning how many
+        subscriptions had to be (re)projected.
+        """
+        today_day = today.toordinal()
+        if self.base_day is None or today_day + MAX_FORECAST_DAYS > self.base_day + self.horizon_days:
+            # The horizon no longer covers the longest query, so start a new window
+            self._reset(today_day)
+
+        changed = 0
+        seen = set()
+        for sub in subscriptions:
+            seen.add(sub.id)
+            entry = self._entries.get(sub.id)
+            if entry is not None:
+                if entry[0] == _fingerprint(sub):
+                    continue
+                self._remove(sub.id)
+            self._insert(sub)
+            changed += 1
+
+        for sub_id in [sub_id for sub_id in self._entries if sub_id not in seen]:
+            self._remove(sub_id)
+            changed += 1
+
+        return changed
+
+    def sync(self, snapshot: Snapshot) -> None:
+        """
+        Apply a snapshot to the index unless it has already been applied.
+        """
+        if self.version == snapshot.version:
+            return
+        self.update(snapshot.subscriptions, snapshot.fetched_at.date())
+        self.version = snapshot.version
+
+    def range_sum(self, start: date, end: date) -> Tuple[float, int]:
+        """
+        Expected revenue and number of payments due in [start, end).
+        """
+        if self.base_day is None:
+            return 0.0, 0
+        lo = start.toordinal() - self.base_day
+        hi = end.toordinal() - self.base_day
+        return self._amounts.range_sum(lo, hi), round(self._payments.range_sum(lo, hi))
+
+    def forecast(self, start: date, days: int, bucket: str = "week") -> ForecastResponse:
+        """
+        Expected recurring revenue over the next `days` days, split into day, week or month buckets.
+        """
+        end = start + timedelta(days=days)
+        buckets = []
+        bucket_start = start
+        while bucket_start < end:
+            if bucket == "day":
+                bucket_end = bucket_start + timedelta(days=1)
+            elif bucket == "week":
+                bucket_end = bucket_start + timedelta(weeks=1)
+            else:
+                bucket_end = bucket_start + relativedelta(months=1)
+            bucket_end = min(bucket_end, end)
+
+            revenue, payments = self.range_sum(bucket_start, bucket_end)
+            buckets.append(ForecastBucket(
+                start=bucket_start,
+                end=bucket_end,
+                expected_revenue=round(revenue, 2),
+                expected_payments=payments
+            ))
+            bucket_start = bucket_end
+
+        revenue, payments = self.range_sum(start, end)
+        return ForecastResponse(
+            start=start,
+            days=days,
+            bucket=bucket,
+            expected_revenue=round(revenue, 2),
+            expected_payments=payments,
+            buckets=buckets
+        )
+
+revenue_index = RevenueIndex()
@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.snapshot import Snapshot
+from app.timestamps import to_micros
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed; compression would not pay for itself
+MIN_COMPRESSED_BYTES = 1024
+
+# Distinct responses (query strings) kept per snapshot
+RESPONSE_CACHE_MAX_ENTRIES = 256
+
+# Content codings we can produce, in order of preference
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+class EncodedResponse:
+    """
+    One response body for a snapshot, with its compressed variants built on
+    first use and kept for as long as the snapshot is served.
+    """
+
+    def __init__(self, base_etag: str, body: bytes):
+        self.base_etag = base_etag
+        self.bodies: Dict[str, bytes] = {"identity": body}
+
+    def body(self, encoding: str) -> bytes:
+        if encoding not in self.bodies:
+            identity = self.bodies["identity"]
+            if encoding == "gzip":
+                # mtime=0 keeps the bytes, and so the ETag, identical across processes
+                self.bodies[encoding] = gzip.compress(identity, compresslevel=6, mtime=0)
+            elif encoding == "br":
+                self.bodies[encoding] = brotli.compress(identity, quality=5)
+            else:
+                raise ValueError(f"Unsupported content coding {encoding}")
+        return self.bodies[encoding]
+
+    def etag(self, encoding: str) -> str:
+        """
+        Strong ETag of the body in `encoding`; each coding is its own representation.
+        """
+        return self.base_etag if encoding == "identity" else f'{self.base_etag[:-1]}-{encoding}"'
+
+def request_key(query_items: Iterable[Tuple[str, str]]) -> str:
+    """
+    Query parameters in a canonical order. Only names are sorted: the order of
+    repeated values (such as grace_days, whose first value is the headline
+    window) changes the response.
+    """
+    return "&".join(f"{name}={value}" for name, value in sorted(query_items, key=lambda item: item[0]))
+
+def base_etag(snapshot: Snapshot, key: str) -> str:
+    """
+    Validator for a query's response on a snapshot. It is built from the
+    fetch time, which every worker and replica serving the same snapshot
+    shares, and a digest of the query.
+    """
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return f'"{to_micros(snapshot.fetched_at):x}-{digest}"'
+
+def _parse_etags(header: str) -> List[str]:
+    return [tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()]
+
+def not_modified(if_none_match: Optional[str], base: str) -> Optional[str]:
+    """
+    The tag from If-None-Match that shows the client already has this
+    response (in any coding), or None if it must be sent.
+    """
+    if not if_none_match:
+        return None
+    for tag in _parse_etags(if_none_match):
+        if tag == "*" or tag == base or (tag.startswith(base[:-1] + "-") and tag.endswith('"')):
+            return tag
+    return None
+
+def choose_encoding(accept_encoding: Optional[str], size: int) -> str:
+    """
+    The preferred coding the client accepts (q > 0), or identity for small bodies.
+    """
+    if size < MIN_COMPRESSED_BYTES or not accept_encoding:
+        return "identity"
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    for coding in ENCODINGS:
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return "identity"
+
+def cached_response(snapshot: Snapshot, key: str) -> Optional[EncodedResponse]:
+    responses: "OrderedDict[str, EncodedResponse]" = snapshot.derive("http_responses", OrderedDict)
+    response = responses.get(key)
+    if response is not None:
+        responses.move_to_end(key)
+    return response
+
+def store_response(snapshot: Snapshot, key: str, response: EncodedResponse) -> None:
+    """
+    Keep the response with the snapshot, dropping the least recently used past the limit.
+    """
+    responses: "OrderedDict[str, EncodedResponse]" = snapshot.derive("http_responses", OrderedDict)
+    responses[key] = response
+    responses.move_to_end(key)
+    while len(responses) > RESPONSE_CACHE_MAX_ENTRIES:
+        responses.popitem(last=False)
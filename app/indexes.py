@@ -0,0 +1,99 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional
+from app.analytics import parse_billing_interval
+from app.models import Subscription, SubscriptionFilter
+
+def normalize_billing_interval(interval_str: str) -> str:
+    """
+    Canonical form of a billing interval, so "3 months" and "3 month" match.
+    """
+    value, unit = parse_billing_interval(interval_str)
+    return f"{value} {unit.rstrip('s')}"
+
+def _rows_to_bitmap(rows: Iterable[int], size: int) -> int:
+    bits = bytearray((size + 7) // 8)
+    for row in rows:
+        bits[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(bits, "little")
+
+def _bitmap_to_rows(bitmap: int, size: int) -> List[int]:
+    rows = []
+    for offset, byte in enumerate(bitmap.to_bytes((size + 7) // 8, "little")):
+        while byte:
+            low = byte & -byte
+            rows.append(offset * 8 + low.bit_length() - 1)
+            byte ^= low
+    return rows
+
+class SubscriptionIndex:
+    """
+    Secondary indexes over a list of subscriptions, built once per snapshot.
+
+    Status and billing interval are indexed as bitmaps (one arbitrary-size
+    int per value, bit i set for row i), start date and recurring amount as
+    sorted arrays. A filter intersects one bitmap per criterion, using binary
+    search to turn the range criteria into bitmaps, so no query rescans the
+    subscription list.
+    """
+
+    def __init__(self, subscriptions: List[Subscription]):
+        self.subscriptions = subscriptions
+        self.size = len(subscriptions)
+        self.positions: Dict[int, int] = {sub.id: row for row, sub in enumerate(subscriptions)}
+
+        statuses: Dict[str, List[int]] = {}
+        intervals: Dict[str, List[int]] = {}
+        for row, sub in enumerate(subscriptions):
+            statuses.setdefault(sub.status__c, []).append(row)
+            intervals.setdefault(normalize_billing_interval(sub.billing_interval__c), []).append(row)
+        self.by_status = {key: _rows_to_bitmap(rows, self.size) for key, rows in statuses.items()}
+        self.by_interval = {key: _rows_to_bitmap(rows, self.size) for key, rows in intervals.items()}
+
+        by_start = sorted((sub.start_date__c, row) for row, sub in enumerate(subscriptions) if sub.start_date__c)
+        self._start_keys = [key for key, _ in by_start]
+        self._start_rows = [row for _, row in by_start]
+
+        by_amount = sorted((sub.recurring_amount__c, row) for row, sub in enumerate(subscriptions)
+                           if sub.recurring_amount__c is not None)
+        self._amount_keys = [key for key, _ in by_amount]
+        self._amount_rows = [row for _, row in by_amount]
+
+    def get(self, sub_id: int) -> Optional[Subscription]:
+        row = self.positions.get(sub_id)
+        return self.subscriptions[row] if row is not None else None
+
+    def _range_bitmap(self, keys: list, rows: List[int], low, high) -> int:
+        start = bisect_left(keys, low) if low is not None else 0
+        end = bisect_right(keys, high) if high is not None else len(keys)
+        return _rows_to_bitmap(rows[start:end], self.size)
+
+    def filter(self, criteria: SubscriptionFilter) -> List[Subscription]:
+        """
+        Return the subscriptions matching every given criterion, in their original order.
+        """
+        bitmaps = []
+        if criteria.status:
+            bitmap = 0
+            for status in criteria.status:
+                bitmap |= self.by_status.get(status, 0)
+            bitmaps.append(bitmap)
+        if criteria.billing_interval:
+            bitmap = 0
+            for interval in criteria.billing_interval:
+                bitmap |= self.by_interval.get(normalize_billing_interval(interval), 0)
+            bitmaps.append(bitmap)
+        if criteria.start_date_from is not None or criteria.start_date_to is not None:
+            bitmaps.append(self._range_bitmap(self._start_keys, self._start_rows,
+                                              criteria.start_date_from, criteria.start_date_to))
+        if criteria.recurring_amount_min is not None or criteria.recurring_amount_max is not None:
+            bitmaps.append(self._range_bitmap(self._amount_keys, self._amount_rows,
+                                              criteria.recurring_amount_min, criteria.recurring_amount_max))
+
+        if not bitmaps:
+            return self.subscriptions
+
+        result = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            result &= bitmap
+
+        return [self.subscriptions[row] for row in _bitmap_to_rows(result, self.size)]
@@ -0,0 +1,54 @@
+import logging
+import os
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class LeaderLock:
+    """
+    Exclusive advisory lock on a file, used to elect one process as leader.
+
+    The lock is taken without blocking and held until `release` or process
+    exit, when the OS drops it and another process can take over. Where
+    `fcntl` is unavailable every process considers itself the leader.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        """
+        Take the lock if no other process holds it. Returns whether this process holds it.
+        """
+        if self._fd is not None or fcntl is None:
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        # Record the leader's pid for whoever is debugging
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        logger.info(f"Process {os.getpid()} is now the snapshot leader")
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, Optional
+from app.metrics import EVENT_LOOP_LAG_SECONDS, EVENT_LOOP_LAG_QUANTILE_SECONDS, EVENT_LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+# How often the loop's lag is sampled (0 disables the monitor)
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.1"))
+
+# Blocking the loop longer than this is logged with the stack of the blocking code
+SLOW_CALLBACK_SECONDS = float(os.getenv("SLOW_CALLBACK_SECONDS", "0.1"))
+
+# Samples kept for the lag percentiles (a minute at the default interval)
+LAG_WINDOW = 600
+
+LAG_QUANTILES = (0.5, 0.9, 0.99)
+
+class LoopMonitor:
+    """
+    Samples event loop lag and catches whatever blocks the loop.
+
+    A task on the loop wakes every `interval` and records how late it woke;
+    that delay is how long some callback or coroutine step held the loop. A
+    watchdog thread checks the task's heartbeat, and when the loop has not
+    come back for `slow_threshold`, logs the loop thread's stack while it is
+    still stuck, which names the code responsible.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL_SECONDS, slow_threshold: float = SLOW_CALLBACK_SECONDS):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.samples: Deque[float] = deque(maxlen=LAG_WINDOW)
+        self.stalls = 0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        Start sampling the running loop; call from a coroutine on it.
+        """
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await asyncio.to_thread(self._watchdog.join)
+
+    async def _sample(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - expected)
+            self.samples.append(lag)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            if lag >= self.slow_threshold:
+                logger.warning(f"Event loop was blocked for {lag * 1000:.0f} ms")
+
+    def _watch(self) -> None:
+        """
+        Watchdog thread: log the loop thread's stack once per stall.
+        """
+        reported = None
+        while not self._stop.wait(self.slow_threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.slow_threshold or reported == heartbeat:
+                continue
+            reported = heartbeat
+            self.stalls += 1
+            EVENT_LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(stack unavailable)\n"
+            logger.warning(f"Event loop blocked for over {blocked * 1000:.0f} ms, currently in:\n{stack}")
+
+    def lag_quantiles(self) -> Dict[float, float]:
+        """
+        Lag percentiles in seconds over the recent window.
+        """
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in LAG_QUANTILES}
+
+    def publish(self) -> None:
+        """
+        Copy the recent percentiles into their gauges; called before metrics are rendered.
+        """
+        for q, lag in self.lag_quantiles().items():
+            EVENT_LOOP_LAG_QUANTILE_SECONDS.labels(str(q)).set(lag)
+
+loop_monitor = LoopMonitor()
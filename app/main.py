@@ -1,10 +1,36 @@
-from fastapi import FastAPI, HTTPException, Depends
-from typing import Dict, List
-import logging
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from typing import Callable, List, Literal, Optional, Set
+from datetime import datetime, timedelta, timezone
+from dateutil.relativedelta import relativedelta
 import asyncio
+import logging
+import os
+import random
 from app.api_client import AudicusAPIClient
-from app.analytics import calculate_subscription_stats, calculate_missed_payments
-from app.models import AnalyticsResponse, Order
+from app.cache import OrderIndex, cache_backend
+from app.cassette import save_recordings
+from app.analytics import (
+    calculate_subscription_stats, calculate_missed_payments, calculate_distributions, calculate_missed_payment_trend,
+    calculate_missed_payments_by_subscription, summarize_missed_payments, top_delinquent_subscriptions,
+    build_billing_timeline, is_billable, calculate_missed_payments_by_grace, GRACE_DAYS
+)
+from app.cohorts import calculate_cohort_retention
+from app.forecast import revenue_index, MAX_FORECAST_DAYS
+from app.sampling import stratify_subscriptions, stratified_sample, estimate_missed_payments
+from app.indexes import SubscriptionIndex
+from app.metrics import SNAPSHOT_AGE_SECONDS, render_metrics, timed
+from app.tracing import TRACE_FILE, current_trace, span, trace, finish_trace
+from app.loop_monitor import LOOP_LAG_INTERVAL_SECONDS, loop_monitor
+from app.memory import MEMORY_SAMPLE_SIZE, cache_contents, memory_report
+from app.http_cache import EncodedResponse, base_etag, cached_response, choose_encoding, not_modified, request_key, store_response
+from app.profiling import ProfilerBusyError, RequestProfiler, profile_token_valid
+from app.snapshot import Snapshot, snapshot_store, fetch_orders
+from app.models import (
+    AnalyticsResponse, BillingTimeline, CohortRetentionResponse, DelinquentSubscriptions, ForecastResponse, GraceWindowStats,
+    MemoryReport, MissedPaymentStats, MissedPaymentTrend, OrderList, SubscriptionFilter, SubscriptionList, SubscriptionMissedPayments
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,70 +38,768 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Audicus Subscription Analytics")
 
+# Most as-of dates a single trend request may ask for
+MAX_TREND_POINTS = 1000
+
+# Limits on the grace windows a single /analytics request may ask for
+MAX_GRACE_WINDOWS = 10
+MAX_GRACE_DAYS = 365
+
+# Most order ids a single /orders request may ask for
+MAX_ORDER_IDS = 1000
+
+# Orders pulled by any client in this process, by id, until they expire with the upstream cache
+order_index = OrderIndex()
+
+# Load the data snapshot during startup, before any request is accepted
+PRELOAD_SNAPSHOT = os.getenv("PRELOAD_SNAPSHOT", "").lower() in ("1", "true", "yes")
+
+# Keeps background tasks referenced until they finish
+background_tasks: Set[asyncio.Task] = set()
+
+# Requests that are not traced, such as metric scrapes
+UNTRACED_PATHS = {"/metrics"}
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Treat naive query datetimes as UTC so they compare with upstream dates.
+    """
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+def get_subscription_filter(
+    status: Optional[List[str]] = Query(None, description="Only subscriptions with one of these statuses"),
+    billing_interval: Optional[List[str]] = Query(None, description="Only subscriptions with one of these billing intervals"),
+    start_date_from: Optional[datetime] = Query(None, description="Earliest start date (inclusive)"),
+    start_date_to: Optional[datetime] = Query(None, description="Latest start date (inclusive)"),
+    recurring_amount_min: Optional[float] = Query(None, description="Smallest recurring amount (inclusive)"),
+    recurring_amount_max: Optional[float] = Query(None, description="Largest recurring amount (inclusive)")
+) -> SubscriptionFilter:
+    return SubscriptionFilter(
+        status=status,
+        billing_interval=billing_interval,
+        start_date_from=_as_utc(start_date_from),
+        start_date_to=_as_utc(start_date_to),
+        recurring_amount_min=recurring_amount_min,
+        recurring_amount_max=recurring_amount_max
+    )
+
+def get_subscription_index(snapshot: Snapshot) -> SubscriptionIndex:
+    """
+    Secondary indexes over the snapshot's subscriptions, built once per snapshot.
+    """
+    return snapshot.derive("subscription_index", lambda: SubscriptionIndex(snapshot.subscriptions))
+
+def get_missed_payments_by_subscription(snapshot: Snapshot) -> List[SubscriptionMissedPayments]:
+    """
+    Per-subscription missed payments as of the snapshot time, computed once per snapshot.
+    """
+    def build() -> List[SubscriptionMissedPayments]:
+        with timed("calculate_missed_payments_by_subscription"), \
+                span("calculate_missed_payments_by_subscription", summarize=True):
+            return calculate_missed_payments_by_subscription(snapshot.subscriptions, snapshot.orders, snapshot.fetched_at)
+
+    return snapshot.derive("missed_by_subscription", build)
+
 # Dependency to get API client
 async def get_api_client():
-    client = AudicusAPIClient()
+    client = AudicusAPIClient(order_index=order_index, cache=cache_backend)
     try:
         yield client
     finally:
         await client.close()
 
+async def refresh_snapshot_in_background():
+    client = AudicusAPIClient(order_index=order_index, cache=cache_backend)
+    try:
+        with trace("snapshot.refresh_in_background") as recorded:
+            await snapshot_store.refresh_in_background(client)
+        await finish_trace(recorded)
+    finally:
+        await client.close()
+
+async def keep_snapshot_current():
+    """
+    Refresh the snapshot (as leader) or pick up the leader's latest one (as
+    follower) without waiting for a request to find it stale.
+    """
+    while True:
+        await asyncio.sleep(snapshot_store.poll_seconds)
+        client = AudicusAPIClient(order_index=order_index, cache=cache_backend)
+        try:
+            await snapshot_store.get(client)
+        except Exception as e:
+            logger.error(f"Error keeping the snapshot current: {str(e)}", exc_info=True)
+        finally:
+            await client.close()
+
+def start_background_task(coroutine) -> None:
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Trace each request and report its phases in a Server-Timing header.
+    """
+    if request.url.path in UNTRACED_PATHS:
+        return await call_next(request)
+    
+    # Spans are only kept when they will be exported or for an authorized profile;
+    # Server-Timing needs just the phase totals
+    profiled = "profile" in request.query_params and profile_token_valid(request.headers.get("x-profile-token"))
+    detailed = bool(TRACE_FILE) or profiled
+    with trace(f"{request.method} {request.url.path}", detailed=detailed, **{"http.method": request.method}) as recorded:
+        response = await call_next(request)
+        recorded.root.set("http.status_code", response.status_code)
+    
+    response.headers["Server-Timing"] = recorded.server_timing()
+    if TRACE_FILE:
+        start_background_task(finish_trace(recorded))
+    return response
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    """
+    Sample event loop lag and log whatever blocks the loop, from before the snapshot preload on.
+    """
+    if LOOP_LAG_INTERVAL_SECONDS > 0:
+        loop_monitor.start()
+
+@app.on_event("startup")
+async def preload_snapshot():
+    """
+    Serve the last snapshot written to SNAPSHOT_FILE right away, refresh it in
+    the background if this process is the leader, and keep following it.
+    With PRELOAD_SNAPSHOT, make sure a snapshot is loaded before the server
+    starts accepting traffic.
+    """
+    if snapshot_store.snapshot_path is not None:
+        if await snapshot_store.preload() and snapshot_store.is_leader():
+            start_background_task(refresh_snapshot_in_background())
+        start_background_task(keep_snapshot_current())
+    
+    if PRELOAD_SNAPSHOT and not snapshot_store.is_fresh():
+        client = AudicusAPIClient(order_index=order_index, cache=cache_backend)
+        try:
+            await snapshot_store.get(client)
+        except Exception as e:
+            logger.error(f"Error preloading the snapshot: {str(e)}", exc_info=True)
+        finally:
+            await client.close()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in list(background_tasks):
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    if snapshot_store.leader_lock is not None:
+        snapshot_store.leader_lock.release()
+    if cache_backend is not None:
+        await cache_backend.close()
+    await asyncio.to_thread(save_recordings)
+    await loop_monitor.stop()
+
 @app.get("/analytics", response_model=AnalyticsResponse)
-async def get_analytics(api_client: AudicusAPIClient = Depends(get_api_client)):
+async def get_analytics(
+    request: Request,
+    include_distributions: bool = False,
+    mode: Literal["exact", "approx"] = "exact",
+    sample: float = Query(0.05, gt=0, le=1, description="Fraction of each stratum to sample in approx mode"),
+    seed: Optional[int] = Query(None, description="Random seed for reproducible approx samples"),
+    as_of: Optional[datetime] = Query(None, description="Evaluate analytics as of this time (default: snapshot time)"),
+    grace_days: Optional[List[int]] = Query(None, description="Grace windows in days for matching orders (repeatable)"),
+    engine: Literal["python", "sql"] = Query("python", description="Compute exact figures in Python or in SQL over the warehouse"),
+    criteria: SubscriptionFilter = Depends(get_subscription_filter),
+    profile: Optional[Literal["cpu", "alloc"]] = Query(None, description="Return a CPU or allocation profile of this request"),
+    profile_token: Optional[str] = Header(None, alias="X-Profile-Token"),
+    api_client: AudicusAPIClient = Depends(get_api_client)
+):
     """
     Get subscription analytics including:
     - Total, active, on-hold, and cancelled subscriptions
     - Average subscription length
     - Number and value of missed payments (from on-hold or active subscriptions)
+    - Optionally, p50/p90/p99 of subscription length, missed-payment value per
+      subscription and order value (`include_distributions=true`)
+    
+    With `mode=approx`, orders are only fetched for a sample of the billable
+    subscriptions stratified by status and billing interval, and the missed
+    payment figures are estimates with confidence intervals.
+    
+    Results are evaluated as of `as_of`, which defaults to the time the
+    snapshot was fetched, so repeated calls on one snapshot are identical.
+    
+    The status, billing interval, start date and recurring amount filters
+    restrict every figure to the matching subscriptions.
+    
+    `grace_days` (default 7) sets how many days an order may be off from an
+    expected billing date. With several values, every window is evaluated in
+    the same pass and reported in `missed_payment_stats_by_grace`, while
+    `missed_payment_stats` uses the first one.
+    
+    With `engine=sql` (requires `WAREHOUSE_PATH`), subscription stats and
+    missed payments are computed by SQL queries over the local warehouse
+    instead of in Python; filters and distributions are not supported there.
+    
+    With `profile=cpu` or `profile=alloc` and the `PROFILE_TOKEN` in an
+    `X-Profile-Token` header, the response is `{"analytics": ..., "profile": ...}`
+    with a cProfile or tracemalloc profile of this request.
+    
+    Exact Python responses carry an ETag for the snapshot and query, answer a
+    matching `If-None-Match` with 304, and are cached per snapshot (gzip or
+    brotli compressed for larger bodies when the client accepts it).
     """
+    run_uncached = lambda: get_analytics(
+        request=None, include_distributions=include_distributions, mode=mode, sample=sample, seed=seed, as_of=as_of,
+        grace_days=grace_days, engine=engine, criteria=criteria, profile=None, profile_token=None,
+        api_client=api_client
+    )
     try:
-        # Fetch all subscriptions
-        logger.info("Fetching subscriptions...")
-        subscriptions = await api_client.get_subscriptions()
+        if profile is not None:
+            if not profile_token_valid(profile_token):
+                raise HTTPException(status_code=403, detail="Profiling requires a valid X-Profile-Token")
+            return await get_profiled_analytics(profile, run_uncached)
+        
+        as_of = _as_utc(as_of)
+        
+        if grace_days is not None:
+            if len(grace_days) > MAX_GRACE_WINDOWS:
+                raise HTTPException(status_code=400, detail=f"At most {MAX_GRACE_WINDOWS} grace windows are supported")
+            if any(window < 0 or window > MAX_GRACE_DAYS for window in grace_days):
+                raise HTTPException(status_code=400, detail=f"grace_days must be between 0 and {MAX_GRACE_DAYS}")
         
-        if not subscriptions:
+        if engine == "sql":
+            if mode == "approx" or include_distributions or criteria != SubscriptionFilter():
+                raise HTTPException(status_code=400, detail="engine=sql does not support approx mode, distributions or filters")
+            return await get_sql_analytics(api_client, as_of, grace_days)
+        
+        if mode == "approx":
+            return await get_approx_analytics(api_client, sample, seed, include_distributions, as_of, criteria, grace_days)
+        
+        compute = lambda snapshot: compute_exact_analytics(snapshot, include_distributions, as_of, grace_days, criteria)
+        if request is not None:
+            return await get_cached_analytics(request, api_client, compute)
+        
+        # Subscriptions and orders come from the shared snapshot, refreshed when stale
+        with span("snapshot", summarize=True):
+            snapshot = await snapshot_store.get(api_client)
+        return compute(snapshot)
+    
+    except HTTPException as http_exc:
+        # Specifically catch HTTPException and re-raise it as is
+        logger.error(f"HTTPException in get_analytics: {http_exc.status_code} - {http_exc.detail}")
+        raise http_exc
+        
+    except Exception as e:
+        # For other exceptions, return a 500 status code
+        logger.error(f"Error getting analytics: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+def compute_exact_analytics(snapshot: Snapshot, include_distributions: bool, as_of: Optional[datetime],
+                            grace_days: Optional[List[int]], criteria: SubscriptionFilter) -> AnalyticsResponse:
+    """
+    Exact analytics over the snapshot, as served by /analytics.
+    """
+    all_orders = snapshot.orders
+    
+    if not snapshot.subscriptions:
+        raise HTTPException(status_code=404, detail="No subscriptions found")
+    
+    with span("filter", summarize=True) as filter_span:
+        subscriptions = get_subscription_index(snapshot).filter(criteria)
+        filter_span.set("records", len(subscriptions))
+    
+    as_of = as_of or snapshot.fetched_at
+    
+    # Calculate subscription stats
+    with timed("calculate_subscription_stats"), span("calculate_subscription_stats", summarize=True):
+        subscription_stats = calculate_subscription_stats(subscriptions, as_of)
+    
+    # Calculate missed payments, reusing the snapshot's per-subscription results when possible
+    missed_payment_stats_by_grace = None
+    if grace_days:
+        with timed("calculate_missed_payments_by_grace"), span("calculate_missed_payments_by_grace", summarize=True):
+            missed_payment_stats_by_grace = calculate_missed_payments_by_grace(subscriptions, all_orders, grace_days, as_of)
+        missed_payment_stats = MissedPaymentStats(
+            missed_payments_count=missed_payment_stats_by_grace[0].missed_payments_count,
+            missed_payments_value=missed_payment_stats_by_grace[0].missed_payments_value
+        )
+    elif as_of == snapshot.fetched_at:
+        per_subscription = get_missed_payments_by_subscription(snapshot)
+        if len(subscriptions) != len(snapshot.subscriptions):
+            selected = {sub.id for sub in subscriptions}
+            per_subscription = [result for result in per_subscription if result.subscription_id in selected]
+        with span("summarize_missed_payments", summarize=True):
+            missed_payment_stats = summarize_missed_payments(per_subscription)
+    else:
+        with timed("calculate_missed_payments"), span("calculate_missed_payments", summarize=True):
+            missed_payment_stats = calculate_missed_payments(subscriptions, all_orders, as_of)
+    
+    # Calculate distributions if requested
+    distributions = None
+    if include_distributions:
+        with span("calculate_distributions", summarize=True):
+            distributions = calculate_distributions(subscriptions, all_orders, as_of)
+    
+    # Return the combined analytics
+    return AnalyticsResponse(
+        as_of=as_of,
+        subscription_stats=subscription_stats,
+        missed_payment_stats=missed_payment_stats,
+        missed_payment_stats_by_grace=missed_payment_stats_by_grace,
+        distributions=distributions
+    )
+
+async def get_profiled_analytics(profile: str, run) -> JSONResponse:
+    """
+    Run the analytics request under the profiler and return both.
+    """
+    try:
+        with RequestProfiler(profile) as profiler:
+            analytics = await run()
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return JSONResponse(jsonable_encoder({"analytics": analytics, "profile": profiler.report(current_trace())}))
+
+async def get_cached_analytics(request: Request, api_client: AudicusAPIClient,
+                               compute: Callable[[Snapshot], AnalyticsResponse]) -> Response:
+    """
+    Serve the analytics for this query from the snapshot's response cache.
+    
+    The snapshot is looked up before anything is computed, so a client that
+    already holds the response gets a 304 without it being rebuilt or
+    re-serialized. On a miss the response is computed from that same
+    snapshot, so the ETag always describes the body.
+    """
+    with span("snapshot", summarize=True):
+        snapshot = await snapshot_store.get(api_client)
+    key = request_key(request.query_params.multi_items())
+    etag = base_etag(snapshot, key)
+    
+    # Clients may reuse the response until the snapshot is due to be refreshed
+    age = (datetime.now(timezone.utc) - snapshot.fetched_at).total_seconds()
+    headers = {"Cache-Control": f"max-age={max(0, int(snapshot_store.ttl_seconds - age))}", "Vary": "Accept-Encoding"}
+    
+    matched = not_modified(request.headers.get("if-none-match"), etag)
+    if matched is not None:
+        return Response(status_code=304, headers={**headers, "ETag": matched})
+    
+    cached = cached_response(snapshot, key)
+    if cached is None:
+        result = compute(snapshot)
+        with span("serialize"):
+            cached = EncodedResponse(etag, JSONResponse(content=jsonable_encoder(result)).body)
+        store_response(snapshot, key, cached)
+    
+    encoding = choose_encoding(request.headers.get("accept-encoding"), len(cached.body("identity")))
+    with span("encode", encoding=encoding):
+        content = cached.body(encoding)
+    headers["ETag"] = cached.etag(encoding)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type="application/json", headers=headers)
+
+async def get_sql_analytics(api_client: AudicusAPIClient, as_of: Optional[datetime],
+                            grace_days: Optional[List[int]]) -> AnalyticsResponse:
+    """
+    Compute subscription stats and missed payments in SQL over the warehouse.
+    """
+    warehouse = snapshot_store.warehouse
+    if warehouse is None:
+        raise HTTPException(status_code=400, detail="engine=sql requires WAREHOUSE_PATH to be set")
+    
+    # Queries run on the warehouse alone unless it needs syncing
+    synced_at = await snapshot_store.sync_warehouse(api_client)
+    if synced_at is None:
+        raise HTTPException(status_code=404, detail="No subscriptions found")
+    
+    as_of = as_of or synced_at
+    subscription_stats = await asyncio.to_thread(warehouse.subscription_stats, as_of)
+    if subscription_stats.total_subscriptions == 0:
+        raise HTTPException(status_code=404, detail="No subscriptions found")
+    
+    try:
+        by_grace = [
+            await asyncio.to_thread(warehouse.missed_payments, as_of, window)
+            for window in (grace_days or [GRACE_DAYS])
+        ]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    missed_payment_stats_by_grace = None
+    if grace_days:
+        missed_payment_stats_by_grace = [
+            GraceWindowStats(grace_days=window, missed_payments_count=stats.missed_payments_count,
+                             missed_payments_value=stats.missed_payments_value)
+            for window, stats in zip(grace_days, by_grace)
+        ]
+    
+    return AnalyticsResponse(
+        as_of=as_of,
+        subscription_stats=subscription_stats,
+        missed_payment_stats=by_grace[0],
+        missed_payment_stats_by_grace=missed_payment_stats_by_grace
+    )
+
+async def get_approx_analytics(api_client: AudicusAPIClient, fraction: float, seed: Optional[int],
+                               include_distributions: bool, as_of: Optional[datetime],
+                               criteria: SubscriptionFilter, grace_days: Optional[List[int]]) -> AnalyticsResponse:
+    """
+    Estimate missed payments from a stratified sample of subscriptions.
+    
+    With several grace windows, each is estimated from the same sample and
+    reported in `missed_payment_stats_by_grace`; the first one is the
+    headline estimate.
+    """
+    as_of = as_of or datetime.now(timezone.utc)
+    
+    # Every subscription is listed so strata sizes are exact; only orders are sampled
+    logger.info("Fetching subscriptions...")
+    subscriptions = await api_client.get_subscriptions()
+    
+    if not subscriptions:
+        raise HTTPException(status_code=404, detail="No subscriptions found")
+    
+    logger.info(f"Found {len(subscriptions)} subscriptions")
+    
+    subscriptions = SubscriptionIndex(subscriptions).filter(criteria)
+    with timed("calculate_subscription_stats"):
+        subscription_stats = calculate_subscription_stats(subscriptions, as_of)
+    strata = stratify_subscriptions(subscriptions)
+    samples = stratified_sample(strata, fraction, random.Random(seed))
+    sampled_subscriptions = [sub for sample in samples.values() for sub in sample]
+    
+    logger.info(f"Fetching orders for {len(sampled_subscriptions)} sampled subscriptions "
+                f"across {len(strata)} strata...")
+    all_orders = await fetch_orders(api_client, sampled_subscriptions)
+    
+    estimates = [
+        estimate_missed_payments(strata, samples, all_orders, fraction, as_of=as_of, grace_days=window)
+        for window in (grace_days or [GRACE_DAYS])
+    ]
+    estimate = estimates[0]
+    missed_payment_stats_by_grace = None
+    if grace_days:
+        missed_payment_stats_by_grace = [
+            GraceWindowStats(grace_days=window, missed_payments_count=round(window_estimate.missed_payments_count),
+                             missed_payments_value=window_estimate.missed_payments_value)
+            for window, window_estimate in zip(grace_days, estimates)
+        ]
+    
+    # Distributions in approx mode only cover the sampled subscriptions
+    distributions = calculate_distributions(sampled_subscriptions, all_orders, as_of) if include_distributions else None
+    
+    return AnalyticsResponse(
+        as_of=as_of,
+        subscription_stats=subscription_stats,
+        missed_payment_stats=MissedPaymentStats(
+            missed_payments_count=round(estimate.missed_payments_count),
+            missed_payments_value=estimate.missed_payments_value
+        ),
+        missed_payment_stats_by_grace=missed_payment_stats_by_grace,
+        distributions=distributions,
+        missed_payment_estimate=estimate
+    )
+
+@app.get("/subscriptions", response_model=SubscriptionList)
+async def get_subscriptions(
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    criteria: SubscriptionFilter = Depends(get_subscription_filter),
+    api_client: AudicusAPIClient = Depends(get_api_client)
+):
+    """
+    List subscriptions from the snapshot, optionally filtered by status,
+    billing interval, start date and recurring amount. Filters are answered
+    from indexes built once per snapshot.
+    """
+    try:
+        snapshot = await snapshot_store.get(api_client)
+        
+        if not snapshot.subscriptions:
             raise HTTPException(status_code=404, detail="No subscriptions found")
         
-        logger.info(f"Found {len(subscriptions)} subscriptions")
+        subscriptions = get_subscription_index(snapshot).filter(criteria)
+        return SubscriptionList(total=len(subscriptions), subscriptions=subscriptions[offset:offset + limit])
+    
+    except HTTPException as http_exc:
+        logger.error(f"HTTPException in get_subscriptions: {http_exc.status_code} - {http_exc.detail}")
+        raise http_exc
+        
+    except Exception as e:
+        logger.error(f"Error getting subscriptions: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/orders", response_model=OrderList)
+async def get_orders(
+    ids: List[str] = Query(..., description="Order ids, comma-separated or repeated"),
+    api_client: AudicusAPIClient = Depends(get_api_client)
+):
+    """
+    Look up several orders at once. Orders already pulled from upstream are
+    served from the order index and only the rest are fetched, with bounded
+    concurrency. Orders come back in the requested order; ids that could not
+    be found are listed in `missing`.
+    """
+    try:
+        try:
+            order_ids = [int(value) for part in ids for value in part.split(",") if value.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Order ids must be integers")
+        
+        if len(order_ids) > MAX_ORDER_IDS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_ORDER_IDS} order ids are supported")
         
-        # Calculate subscription stats
-        subscription_stats = calculate_subscription_stats(subscriptions)
+        orders = await api_client.get_orders(order_ids)
+        
+        return OrderList(
+            orders=[order for order in orders if order is not None],
+            missing=[order_id for order_id, order in zip(order_ids, orders) if order is None]
+        )
+    
+    except HTTPException as http_exc:
+        logger.error(f"HTTPException in get_orders: {http_exc.status_code} - {http_exc.detail}")
+        raise http_exc
         
-        # Fetch orders for each subscription concurrently
-        logger.info("Fetching orders for each subscription...")
-        all_orders: Dict[int, List[Order]] = {}
+    except Exception as e:
+        logger.error(f"Error getting orders: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/subscriptions/{subscription_id}/timeline", response_model=BillingTimeline)
+async def get_subscription_timeline(
+    subscription_id: int,
+    api_client: AudicusAPIClient = Depends(get_api_client)
+):
+    """
+    Get every expected billing date of a subscription up to the snapshot
+    time, marked as matched (with the order id and closedate) or missed,
+    using the same 7-day tolerance as /analytics. Served from the snapshot's
+    cached orders; each timeline is built once per snapshot.
+    """
+    try:
+        snapshot = await snapshot_store.get(api_client)
         
-        async def fetch_orders_for_subscription(sub_id: int):
-            orders = await api_client.get_subscription_orders(sub_id)
-            if orders:
-                all_orders[sub_id] = orders
+        sub = get_subscription_index(snapshot).get(subscription_id)
+        if sub is None:
+            raise HTTPException(status_code=404, detail=f"Subscription {subscription_id} not found")
         
-        # Create tasks for fetching orders
-        tasks = []
-        for sub in subscriptions:
-            task = fetch_orders_for_subscription(sub.id)
-            tasks.append(task)
+        def build() -> BillingTimeline:
+            periods = build_billing_timeline(sub, snapshot.orders.get(sub.id, []), snapshot.fetched_at)
+            return BillingTimeline(
+                subscription_id=sub.id,
+                status=sub.status__c,
+                billing_interval=sub.billing_interval__c,
+                recurring_amount=sub.recurring_amount__c,
+                billable=is_billable(sub),
+                as_of=snapshot.fetched_at,
+                missed_payments_count=sum(1 for period in periods if period.status == "missed"),
+                periods=periods
+            )
         
-        # Execute all tasks concurrently
-        await asyncio.gather(*tasks)
+        return snapshot.derive(("timeline", subscription_id), build)
+    
+    except HTTPException as http_exc:
+        logger.error(f"HTTPException in get_subscription_timeline: {http_exc.status_code} - {http_exc.detail}")
+        raise http_exc
         
-        logger.info(f"Fetched orders for {len(all_orders)} subscriptions")
+    except Exception as e:
+        logger.error(f"Error getting timeline for subscription {subscription_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/cohorts", response_model=CohortRetentionResponse)
+async def get_cohorts(
+    months: int = Query(36, ge=1, le=120, description="Number of monthly offsets to report"),
+    api_client: AudicusAPIClient = Depends(get_api_client)
+):
+    """
+    Get a retention matrix of subscriptions grouped by start month, with
+    paid-order counts and value per cohort. Served from the same snapshot as
+    /analytics, so it does not trigger another upstream pass.
+    """
+    try:
+        snapshot = await snapshot_store.get(api_client)
         
-        # Calculate missed payments
-        missed_payment_stats = calculate_missed_payments(subscriptions, all_orders)
+        if not snapshot.subscriptions:
+            raise HTTPException(status_code=404, detail="No subscriptions found")
         
-        # Return the combined analytics
-        return AnalyticsResponse(
-            subscription_stats=subscription_stats,
-            missed_payment_stats=missed_payment_stats
+        return snapshot.derive(
+            ("cohorts", months),
+            lambda: calculate_cohort_retention(snapshot.subscriptions, snapshot.orders, months, now=snapshot.fetched_at)
         )
     
     except HTTPException as http_exc:
-        # Specifically catch HTTPException and re-raise it as is
-        logger.error(f"HTTPException in get_analytics: {http_exc.status_code} - {http_exc.detail}")
+        logger.error(f"HTTPException in get_cohorts: {http_exc.status_code} - {http_exc.detail}")
         raise http_exc
         
     except Exception as e:
-        # For other exceptions, return a 500 status code
-        logger.error(f"Error getting analytics: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        logger.error(f"Error getting cohorts: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/forecast", response_model=ForecastResponse)
+async def get_forecast(
+    days: int = Query(90, ge=1, le=MAX_FORECAST_DAYS, description="Number of days to forecast"),
+    bucket: Literal["day", "week", "month"] = "week",
+    api_client: AudicusAPIClient = Depends(get_api_client)
+):
+    """
+    Get expected recurring revenue from active subscriptions over the next
+    `days` days, split into day, week or month buckets. Answered from an
+    index over next payment dates that is updated incrementally whenever the
+    snapshot is refreshed.
+    """
+    try:
+        snapshot = await snapshot_store.get(api_client)
+        
+        if not snapshot.subscriptions:
+            raise HTTPException(status_code=404, detail="No subscriptions found")
+        
+        revenue_index.sync(snapshot)
+        return revenue_index.forecast(snapshot.fetched_at.date(), days, bucket)
+    
+    except HTTPException as http_exc:
+        logger.error(f"HTTPException in get_forecast: {http_exc.status_code} - {http_exc.detail}")
+        raise http_exc
+        
+    except Exception as e:
+        logger.error(f"Error getting forecast: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/trend", response_model=MissedPaymentTrend)
+async def get_missed_payment_trend(
+    as_of: Optional[List[datetime]] = Query(None, description="Explicit as-of dates"),
+    start: Optional[datetime] = Query(None, description="First as-of date of a range"),
+    end: Optional[datetime] = Query(None, description="Last as-of date of a range (default: snapshot time)"),
+    step: Literal["day", "week", "month"] = "week",
+    api_client: AudicusAPIClient = Depends(get_api_client)
+):
+    """
+    Get missed payment count and value at each of a list (`as_of`) or range
+    (`start`, `end`, `step`) of as-of dates. Every point matches what
+    /analytics returns for that `as_of`, but the whole series is computed in
+    a single pass over the snapshot.
+    """
+    try:
+        snapshot = await snapshot_store.get(api_client)
+        
+        if not snapshot.subscriptions:
+            raise HTTPException(status_code=404, detail="No subscriptions found")
+        
+        dates = [_as_utc(value) for value in as_of or []]
+        if start is not None:
+            first = _as_utc(start)
+            last = _as_utc(end) or snapshot.fetched_at
+            if first > last:
+                bound = "end" if end is not None else "the snapshot time (the default end)"
+                raise HTTPException(status_code=400, detail=f"start {first.isoformat()} is after {bound} {last.isoformat()}")
+            steps = 0
+            while len(dates) <= MAX_TREND_POINTS:
+                # Offsets from the start avoid month-end drift
+                if step == "day":
+                    current = first + timedelta(days=steps)
+                elif step == "week":
+                    current = first + timedelta(weeks=steps)
+                else:
+                    current = first + relativedelta(months=steps)
+                if current > last:
+                    break
+                dates.append(current)
+                steps += 1
+        
+        if not dates:
+            raise HTTPException(status_code=400, detail="Provide as_of dates or a start date")
+        if len(dates) > MAX_TREND_POINTS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_TREND_POINTS} as-of dates are supported")
+        
+        points = calculate_missed_payment_trend(snapshot.subscriptions, snapshot.orders, dates)
+        return MissedPaymentTrend(points=points)
+    
+    except HTTPException as http_exc:
+        logger.error(f"HTTPException in get_missed_payment_trend: {http_exc.status_code} - {http_exc.detail}")
+        raise http_exc
+        
+    except Exception as e:
+        logger.error(f"Error getting missed payment trend: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/delinquent", response_model=DelinquentSubscriptions)
+async def get_delinquent_subscriptions(
+    limit: int = Query(50, ge=1, le=1000, description="Number of subscriptions to return"),
+    offset: int = Query(0, ge=0, description="Number of top subscriptions to skip"),
+    api_client: AudicusAPIClient = Depends(get_api_client)
+):
+    """
+    Get the subscriptions with the highest missed-payment value as of the
+    snapshot time. Per-subscription results are computed once per snapshot
+    and the top entries are picked with a bounded heap, so paging is cheap.
+    """
+    try:
+        snapshot = await snapshot_store.get(api_client)
+        
+        if not snapshot.subscriptions:
+            raise HTTPException(status_code=404, detail="No subscriptions found")
+        
+        per_subscription = get_missed_payments_by_subscription(snapshot)
+        total_delinquent = snapshot.derive(
+            "delinquent_count",
+            lambda: sum(1 for result in per_subscription if result.missed_payments_count > 0)
+        )
+        top = top_delinquent_subscriptions(per_subscription, offset + limit)
+        
+        return DelinquentSubscriptions(
+            as_of=snapshot.fetched_at,
+            total_delinquent=total_delinquent,
+            subscriptions=top[offset:]
+        )
+    
+    except HTTPException as http_exc:
+        logger.error(f"HTTPException in get_delinquent_subscriptions: {http_exc.status_code} - {http_exc.detail}")
+        raise http_exc
+        
+    except Exception as e:
+        logger.error(f"Error getting delinquent subscriptions: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/debug/memory", response_model=MemoryReport)
+async def get_memory_report(
+    sample: int = Query(MEMORY_SAMPLE_SIZE, ge=1, le=100_000, description="Records measured per representation"),
+    profile_token: Optional[str] = Header(None, alias="X-Profile-Token")
+):
+    """
+    Memory accounting for sizing containers: bytes per subscription and per
+    order as pydantic models, compact tuples, snapshot-file columns and the
+    cache encoding, extrapolated to the current snapshot from `sample`
+    records of each; what the caches retain on top; and current and peak
+    RSS. Requires the `PROFILE_TOKEN` in an `X-Profile-Token` header.
+    """
+    try:
+        if not profile_token_valid(profile_token):
+            raise HTTPException(status_code=403, detail="Memory accounting requires a valid X-Profile-Token")
+        
+        snapshot = snapshot_store.snapshot
+        # Requests keep filling and evicting the caches while the report is measured
+        contents = cache_contents(snapshot, order_index)
+        return await asyncio.to_thread(memory_report, snapshot, contents, cache_backend, sample)
+    
+    except HTTPException as http_exc:
+        logger.error(f"HTTPException in get_memory_report: {http_exc.status_code} - {http_exc.detail}")
+        raise http_exc
+        
+    except Exception as e:
+        logger.error(f"Error getting memory report: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus metrics: upstream latency, pagination, cache, compute time and event loop lag.
+    """
+    snapshot = snapshot_store.snapshot
+    if snapshot is not None:
+        SNAPSHOT_AGE_SECONDS.set((datetime.now(timezone.utc) - snapshot.fetched_at).total_seconds())
+    loop_monitor.publish()
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,165 @@
+import os
+import resource
+import sys
+import types
+from array import array
+from collections import OrderedDict, deque
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Mapping, Optional, Set
+from pydantic import BaseModel
+from app.cache import CacheBackend, MemoryCacheBackend, OrderIndex, dump_models
+from app.models import MemoryReport, RepresentationSize
+from app.snapshot import Snapshot
+from app.snapshot_file import ORDER_COLUMNS, SUBSCRIPTION_COLUMNS
+
+# Records measured per representation; bytes per record are extrapolated from them
+MEMORY_SAMPLE_SIZE = 1000
+
+# Objects whose size does not depend on anything they reference
+_LEAVES = (str, bytes, bytearray, int, float, bool, type(None), datetime, date, timedelta, array, memoryview, range)
+
+# Code and type objects are shared by every instance and never part of the data
+_SKIPPED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+def deep_sizeof(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    """
+    Bytes retained by `obj` and everything it references, counting each object once.
+
+    Objects whose ids are already in `seen` are not counted (nor followed),
+    so passing the same set across calls measures what each adds on top of
+    the previous ones.
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, _SKIPPED):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, _LEAVES):
+            continue
+        if isinstance(item, dict):
+            stack.extend(list(item.items()))
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(list(item))
+        else:
+            # Instance dicts and slots, including pydantic's own bookkeeping
+            if hasattr(item, "__dict__"):
+                stack.append(item.__dict__)
+            for cls in type(item).__mro__:
+                for slot in cls.__dict__.get("__slots__", ()):
+                    if slot != "__dict__" and hasattr(item, slot):
+                        stack.append(getattr(item, slot))
+    return total
+
+def copy_containers(obj: Any, memo: Optional[Dict[int, Any]] = None) -> Any:
+    """
+    `obj` with every dict, list, set, deque and tuple in it copied.
+
+    What the containers hold is shared, not copied; a container referenced
+    twice is copied once, so deep_sizeof still counts it once.
+    """
+    memo = {} if memo is None else memo
+    if id(obj) in memo:
+        return memo[id(obj)]
+    if isinstance(obj, dict):
+        # OrderedDict subclasses dict, and keeps its own (larger) layout when copied
+        copy = (OrderedDict if isinstance(obj, OrderedDict) else dict)(
+            (key, copy_containers(value, memo)) for key, value in list(obj.items())
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        kind = next(kind for kind in (list, tuple, set, frozenset, deque) if isinstance(obj, kind))
+        copy = kind(copy_containers(item, memo) for item in list(obj))
+    else:
+        return obj
+    memo[id(obj)] = copy
+    return copy
+
+def cache_contents(snapshot: Optional[Snapshot], order_index: OrderIndex) -> Dict[str, Any]:
+    """
+    Copies of what the in-process caches hold, to measure in memory_report.
+
+    The event loop keeps adding to and evicting from these caches, so the
+    copies must be taken on the loop; a worker thread can then walk them
+    without iterating a dict that changes size underneath it.
+    """
+    return {
+        "snapshot_derived": copy_containers(snapshot._derived) if snapshot is not None else {},
+        "order_index": copy_containers(vars(order_index)),
+    }
+
+def current_rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _sample(records: List[BaseModel], size: int) -> List[BaseModel]:
+    """
+    Up to `size` records spread evenly over the list.
+    """
+    step = max(1, len(records) // size)
+    return records[::step][:size]
+
+def representation_sizes(records: List[BaseModel], sample_size: int, columnar_bytes: int) -> Dict[str, RepresentationSize]:
+    """
+    Bytes per record of each way the records can be held in memory.
+
+    Shared objects (such as repeated status strings) are counted once per
+    sample, as they are in a full snapshot.
+    """
+    sample = _sample(records, sample_size)
+    count = max(len(sample), 1)
+
+    def size(per_record: float) -> RepresentationSize:
+        return RepresentationSize(records=len(records), bytes_per_record=round(per_record, 1),
+                                  estimated_bytes=round(per_record * len(records)))
+
+    # One tuple of field values per record, as with __slots__ classes or namedtuples
+    # (all built first, so no temporary's id is reused while measuring)
+    compact = [tuple(record.__dict__.values()) for record in sample]
+    return {
+        "pydantic": size((deep_sizeof(sample) - sys.getsizeof(sample)) / count),
+        "compact": size((deep_sizeof(compact) - sys.getsizeof(compact)) / count),
+        # Fixed-width columns of the snapshot file
+        "columnar": size(columnar_bytes),
+        # zlib-compressed rows, as stored in the shared cache
+        "cache": size(len(dump_models(sample)) / count if sample else 0),
+    }
+
+def memory_report(snapshot: Optional[Snapshot], contents: Mapping[str, Any], cache: Optional[CacheBackend],
+                  sample_size: int = MEMORY_SAMPLE_SIZE) -> MemoryReport:
+    """
+    What the snapshot's records cost in each representation, and what the
+    caches retain, from the cache_contents taken for this report.
+    """
+    subscriptions = snapshot.subscriptions if snapshot is not None else []
+    orders = [order for sub_orders in snapshot.orders.values() for order in sub_orders] if snapshot is not None else []
+
+    subscription_columns = sum(array(fmt).itemsize for _, fmt in SUBSCRIPTION_COLUMNS) + array("q").itemsize
+    order_columns = sum(array(fmt).itemsize for _, fmt in ORDER_COLUMNS)
+
+    # Records themselves are accounted above; caches are measured for what they add
+    records = {id(record) for record in subscriptions}
+    records.update(id(order) for order in orders)
+    caches = {name: deep_sizeof(content, set(records)) for name, content in contents.items()}
+    if isinstance(cache, MemoryCacheBackend):
+        caches["memory_cache"] = cache.size_bytes()
+
+    return MemoryReport(
+        snapshot_fetched_at=snapshot.fetched_at if snapshot is not None else None,
+        sample_size=sample_size,
+        subscriptions=representation_sizes(subscriptions, sample_size, subscription_columns),
+        orders=representation_sizes(orders, sample_size, order_columns),
+        caches=caches,
+        rss_bytes=current_rss_bytes(),
+        peak_rss_bytes=peak_rss_bytes()
+    )
@@ -0,0 +1,105 @@
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+)
+from prometheus_client import multiprocess
+
+# With several workers, point this at an empty directory shared by them so
+# /metrics adds up every worker (see prometheus_client's multiprocess mode)
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "audicus_upstream_request_seconds", "Upstream request latency",
+    ["endpoint", "status"]
+)
+
+UPSTREAM_IN_FLIGHT = Gauge(
+    "audicus_upstream_in_flight_requests", "Upstream requests currently awaiting a response",
+    multiprocess_mode="livesum"
+)
+
+SYNC_PAGES = Histogram(
+    "audicus_sync_pages", "Upstream pages fetched per snapshot sync",
+    buckets=(1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, float("inf"))
+)
+
+TRUNCATED_PAGINATIONS = Counter(
+    "audicus_truncated_paginations_total", "Paginations cut short by an upstream error",
+    ["endpoint"]
+)
+
+CACHE_LOOKUPS = Counter(
+    "audicus_cache_lookups_total", "Cache lookups by kind of entry and result",
+    ["kind", "result"]
+)
+
+CACHE_EVICTIONS = Counter(
+    "audicus_cache_evictions_total", "Entries evicted from the in-memory cache to make room"
+)
+
+SNAPSHOT_AGE_SECONDS = Gauge(
+    "audicus_snapshot_age_seconds", "Time since the served snapshot was fetched from upstream",
+    multiprocess_mode="max"
+)
+
+COMPUTE_SECONDS = Histogram(
+    "audicus_compute_seconds", "Time spent in analytics functions",
+    ["function"]
+)
+
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "audicus_event_loop_lag_seconds", "How late the event loop ran a timer, i.e. how long it was blocked",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+)
+
+EVENT_LOOP_LAG_QUANTILE_SECONDS = Gauge(
+    "audicus_event_loop_lag_quantile_seconds", "Event loop lag percentiles over the recent window",
+    ["quantile"], multiprocess_mode="max"
+)
+
+EVENT_LOOP_STALLS = Counter(
+    "audicus_event_loop_stalls_total", "Times the event loop was blocked longer than SLOW_CALLBACK_SECONDS"
+)
+
+# Pages counted towards the sync running in the current context, if any
+_sync_pages: ContextVar[Optional[List[int]]] = ContextVar("sync_pages", default=None)
+
+def count_page() -> None:
+    pages = _sync_pages.get()
+    if pages is not None:
+        pages[0] += 1
+
+@contextmanager
+def counting_sync_pages() -> Iterator[None]:
+    """
+    Count the pages fetched inside the block, including by tasks it starts, into SYNC_PAGES.
+    """
+    pages = [0]
+    token = _sync_pages.set(pages)
+    try:
+        yield
+    finally:
+        _sync_pages.reset(token)
+        SYNC_PAGES.observe(pages[0])
+
+def record_cache_lookup(kind: str, hit: bool) -> None:
+    CACHE_LOOKUPS.labels(kind, "hit" if hit else "miss").inc()
+
+def timed(function: str):
+    """
+    Context manager observing its duration into COMPUTE_SECONDS under `function`.
+    """
+    return COMPUTE_SECONDS.labels(function).time()
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Every metric in Prometheus text format, and its content type.
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
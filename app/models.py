@@ -1,6 +1,6 @@
 from pydantic import BaseModel
-from typing import Optional, List
-from datetime import datetime
+from typing import Dict, Optional, List
+from datetime import date, datetime
 
 class Subscription(BaseModel):
     id: int
@@ -17,6 +17,22 @@ class Order(BaseModel):
     total_order_value__c: float
     parent_subscription_id__c: int
 
+class OrderList(BaseModel):
+    orders: List[Order]
+    missing: List[int]
+
+class SubscriptionFilter(BaseModel):
+    status: Optional[List[str]] = None
+    billing_interval: Optional[List[str]] = None
+    start_date_from: Optional[datetime] = None
+    start_date_to: Optional[datetime] = None
+    recurring_amount_min: Optional[float] = None
+    recurring_amount_max: Optional[float] = None
+
+class SubscriptionList(BaseModel):
+    total: int
+    subscriptions: List[Subscription]
+
 class SubscriptionStats(BaseModel):
     total_subscriptions: int
     active_subscriptions: int
@@ -28,6 +44,121 @@ class MissedPaymentStats(BaseModel):
     missed_payments_count: int
     missed_payments_value: float
 
+class GraceWindowStats(BaseModel):
+    grace_days: int
+    missed_payments_count: int
+    missed_payments_value: float
+
+class SubscriptionMissedPayments(BaseModel):
+    subscription_id: int
+    status: str
+    recurring_amount: float
+    missed_payments_count: int
+    missed_payments_value: float
+
+class BillingPeriod(BaseModel):
+    expected_date: datetime
+    status: str
+    order_id: Optional[int] = None
+    closedate: Optional[datetime] = None
+
+class BillingTimeline(BaseModel):
+    subscription_id: int
+    status: str
+    billing_interval: str
+    recurring_amount: Optional[float] = None
+    billable: bool
+    as_of: datetime
+    missed_payments_count: int
+    periods: List[BillingPeriod]
+
+class DelinquentSubscriptions(BaseModel):
+    as_of: datetime
+    total_delinquent: int
+    subscriptions: List[SubscriptionMissedPayments]
+
+class MissedPaymentTrendPoint(BaseModel):
+    as_of: datetime
+    missed_payments_count: int
+    missed_payments_value: float
+
+class MissedPaymentTrend(BaseModel):
+    points: List[MissedPaymentTrendPoint]
+
+class ConfidenceInterval(BaseModel):
+    lower: float
+    upper: float
+
+class MissedPaymentEstimate(BaseModel):
+    missed_payments_count: float
+    missed_payments_count_ci: ConfidenceInterval
+    missed_payments_value: float
+    missed_payments_value_ci: ConfidenceInterval
+    confidence_level: float
+    sample_fraction: float
+    sampled_subscriptions: int
+    billable_subscriptions: int
+
+class QuantileSummary(BaseModel):
+    count: int
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p99: Optional[float] = None
+
+class DistributionStats(BaseModel):
+    relative_accuracy: float
+    subscription_length_days: QuantileSummary
+    missed_payment_value_per_subscription: QuantileSummary
+    order_value: QuantileSummary
+
 class AnalyticsResponse(BaseModel):
+    as_of: Optional[datetime] = None
     subscription_stats: SubscriptionStats
     missed_payment_stats: Optional[MissedPaymentStats] = None
+    missed_payment_stats_by_grace: Optional[List[GraceWindowStats]] = None
+    distributions: Optional[DistributionStats] = None
+    missed_payment_estimate: Optional[MissedPaymentEstimate] = None
+
+class CohortRetention(BaseModel):
+    cohort: str
+    subscriptions: int
+    retained: List[int]
+    retention_rate: List[float]
+    paid_orders: int
+    paid_order_value: float
+
+class CohortRetentionResponse(BaseModel):
+    max_months: int
+    cohorts: List[CohortRetention]
+
+class ForecastBucket(BaseModel):
+    start: date
+    end: date
+    expected_revenue: float
+    expected_payments: int
+
+class ForecastResponse(BaseModel):
+    start: date
+    days: int
+    bucket: str
+    expected_revenue: float
+    expected_payments: int
+    buckets: List[ForecastBucket]
+
+class RepresentationSize(BaseModel):
+    records: int
+    bytes_per_record: float
+    # bytes_per_record times the records in the snapshot
+    estimated_bytes: int
+
+class MemoryReport(BaseModel):
+    snapshot_fetched_at: Optional[datetime] = None
+    sample_size: int
+    # Bytes per record of each representation: pydantic models, compact tuples,
+    # snapshot-file columns and the compressed cache encoding
+    subscriptions: Dict[str, RepresentationSize]
+    orders: Dict[str, RepresentationSize]
+    # Retained bytes of each cache held by this process
+    caches: Dict[str, int]
+    rss_bytes: Optional[int] = None
+    peak_rss_bytes: int
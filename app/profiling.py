@@ -0,0 +1,157 @@
+import cProfile
+import hmac
+import os
+import pstats
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+from app.tracing import Trace
+
+# Requests must send this in X-Profile-Token to use ?profile= (unset: profiling is disabled)
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+
+# Functions or allocation sites listed in a profile
+PROFILE_TOP = 30
+
+# Frames kept per traced allocation; more attributes allocations to their callers but costs more
+ALLOC_TRACE_FRAMES = 5
+
+PROFILE_MODES = ("cpu", "alloc")
+
+class ProfilerBusyError(RuntimeError):
+    """
+    Another request is being profiled; the profilers are process-wide.
+    """
+
+def profile_token_valid(token: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+def _merge_intervals(intervals: List[Tuple[int, int]]) -> int:
+    """
+    Total length covered by the intervals, counting overlaps once.
+    """
+    covered, end = 0, None
+    for start, stop in sorted(intervals):
+        if end is None or start > end:
+            covered += stop - start
+            end = stop
+        elif stop > end:
+            covered += stop - end
+            end = stop
+    return covered
+
+def attribute_wall_time(trace: Optional[Trace], wall_seconds: float, cpu_seconds: float) -> Dict[str, Any]:
+    """
+    Split a request's wall time into waiting on upstream and work on the event loop.
+
+    Upstream wait is the time at least one upstream request was in flight, so
+    concurrent fan-out is not counted twice. Phases come from the request's
+    trace: decode (pydantic validation of upstream pages) and each analytics
+    function are CPU-bound, so their time is loop time nothing else could use.
+    """
+    attribution = {
+        "wall_ms": round(wall_seconds * 1000, 3),
+        "cpu_ms": round(cpu_seconds * 1000, 3),
+        "upstream_wait_ms": 0.0,
+        "phases_ms": {},
+    }
+    if trace is not None:
+        upstream = [(s.start_ns, s.start_ns + s.duration_ns) for s in trace.spans if s.name == "upstream.request"]
+        attribution["upstream_wait_ms"] = round(_merge_intervals(upstream) / 1e6, 3)
+        attribution["upstream_requests"] = len(upstream)
+        attribution["phases_ms"] = {name: round(ms, 3) for name, ms in trace.timings().items()}
+    return attribution
+
+class RequestProfiler:
+    """
+    Profile the work done inside the block.
+
+    `cpu` runs cProfile, `alloc` tracemalloc. Both see the whole event loop
+    thread, so work for requests served concurrently shows up too; profile
+    on a quiet worker for clean numbers. Only one request may be profiled at
+    a time.
+    """
+
+    _active = False
+
+    def __init__(self, mode: str, top: Optional[int] = None):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode}")
+        self.mode = mode
+        self.top = top or PROFILE_TOP
+        self._profile: Optional[cProfile.Profile] = None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._peak = 0
+        self._started_tracing = False
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+
+    def __enter__(self) -> "RequestProfiler":
+        if RequestProfiler._active:
+            raise ProfilerBusyError("Another request is being profiled")
+        RequestProfiler._active = True
+
+        if self.mode == "cpu":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start(ALLOC_TRACE_FRAMES)
+            tracemalloc.reset_peak()
+        self._wall_started = time.perf_counter()
+        self._cpu_started = time.thread_time()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.wall_seconds = time.perf_counter() - self._wall_started
+        self.cpu_seconds = time.thread_time() - self._cpu_started
+        try:
+            if self.mode == "cpu":
+                self._profile.disable()
+            else:
+                self._snapshot = tracemalloc.take_snapshot()
+                _, self._peak = tracemalloc.get_traced_memory()
+                if self._started_tracing:
+                    tracemalloc.stop()
+        finally:
+            RequestProfiler._active = False
+
+    def _cpu_report(self) -> Dict[str, Any]:
+        stats = pstats.Stats(self._profile)
+        functions = []
+        for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+            functions.append({
+                "function": name,
+                "location": f"{filename}:{line}",
+                "calls": calls,
+                "own_ms": round(own * 1000, 3),
+                "cumulative_ms": round(cumulative * 1000, 3),
+            })
+        # Own time points at the code burning CPU; cumulative time is dominated by event loop plumbing
+        functions.sort(key=lambda function: function["own_ms"], reverse=True)
+        return {"functions": functions[:self.top]}
+
+    def _alloc_report(self) -> Dict[str, Any]:
+        # Leave out the profiler's own bookkeeping
+        snapshot = self._snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        allocations = [
+            {
+                "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_bytes": stat.size,
+                "count": stat.count,
+            }
+            for stat in snapshot.statistics("lineno")[:self.top]
+        ]
+        return {"peak_traced_bytes": self._peak, "allocations": allocations}
+
+    def report(self, trace: Optional[Trace] = None) -> Dict[str, Any]:
+        """
+        The profile, with the wall-time attribution from the request's trace.
+        """
+        report = {"mode": self.mode, "attribution": attribute_wall_time(trace, self.wall_seconds, self.cpu_seconds)}
+        report.update(self._cpu_report() if self.mode == "cpu" else self._alloc_report())
+        return report
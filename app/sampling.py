@@ -0,0 +1,110 @@
+import math
+import random
+from datetime import datetime, timezone
+from statistics import NormalDist
+from typing import Dict, List, Optional, Tuple
+from app.analytics import is_billable, count_missed_payments, parse_billing_interval, GRACE_DAYS
+from app.models import Subscription, Order, MissedPaymentEstimate, ConfidenceInterval
+
+Stratum = Tuple[str, str]
+
+# Smallest sample drawn from a stratum, so its variance can be estimated
+MIN_SAMPLES_PER_STRATUM = 2
+
+def stratify_subscriptions(subscriptions: List[Subscription]) -> Dict[Stratum, List[Subscription]]:
+    """
+    Group billable subscriptions by status and normalized billing interval.
+
+    Non-billable subscriptions never contribute missed payments, so they are
+    left out entirely instead of wasting sample slots on them.
+    """
+    strata: Dict[Stratum, List[Subscription]] = {}
+    for sub in subscriptions:
+        if not is_billable(sub):
+            continue
+        interval_value, interval_unit = parse_billing_interval(sub.billing_interval__c)
+        key = (sub.status__c, f"{interval_value} {interval_unit}")
+        strata.setdefault(key, []).append(sub)
+    return strata
+
+def stratified_sample(strata: Dict[Stratum, List[Subscription]], fraction: float,
+                      rng: Optional[random.Random] = None) -> Dict[Stratum, List[Subscription]]:
+    """
+    Draw a simple random sample of `fraction` of each stratum (at least
+    MIN_SAMPLES_PER_STRATUM, at most the whole stratum).
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError("fraction must be in (0, 1]")
+    rng = rng or random.Random()
+
+    samples = {}
+    for key, members in strata.items():
+        size = min(len(members), max(MIN_SAMPLES_PER_STRATUM, math.ceil(fraction * len(members))))
+        samples[key] = rng.sample(members, size)
+    return samples
+
+def estimate_missed_payments(strata: Dict[Stratum, List[Subscription]],
+                             samples: Dict[Stratum, List[Subscription]],
+                             all_orders: Dict[int, List[Order]],
+                             fraction: float,
+                             confidence: float = 0.95,
+                             as_of: Optional[datetime] = None,
+                             grace_days: int = GRACE_DAYS) -> MissedPaymentEstimate:
+    """
+    Estimate missed payment count and value from a stratified sample.
+
+    Uses the stratified expansion estimator: each stratum's sample mean is
+    scaled by the stratum size, and the variance includes the finite
+    population correction, so a fully sampled stratum contributes no error.
+    Orders are only needed for the sampled subscriptions.
+    """
+    now = as_of or datetime.now(timezone.utc)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+
+    count_total = value_total = 0.0
+    count_variance = value_variance = 0.0
+    sampled = 0
+
+    for key, sample in samples.items():
+        population = len(strata[key])
+        n = len(sample)
+        if n == 0:
+            continue
+        sampled += n
+
+        counts = []
+        values = []
+        for sub in sample:
+            missed = count_missed_payments(sub, all_orders.get(sub.id, []), now, grace_days)
+            counts.append(missed)
+            values.append(missed * sub.recurring_amount__c)
+
+        count_total += population * sum(counts) / n
+        value_total += population * sum(values) / n
+
+        if n > 1 and n < population:
+            correction = population ** 2 * (1 - n / population) / n
+            count_variance += correction * _sample_variance(counts)
+            value_variance += correction * _sample_variance(values)
+
+    count_margin = z * math.sqrt(count_variance)
+    value_margin = z * math.sqrt(value_variance)
+
+    return MissedPaymentEstimate(
+        missed_payments_count=count_total,
+        missed_payments_count_ci=ConfidenceInterval(
+            lower=max(0.0, count_total - count_margin), upper=count_total + count_margin
+        ),
+        missed_payments_value=value_total,
+        missed_payments_value_ci=ConfidenceInterval(
+            lower=max(0.0, value_total - value_margin), upper=value_total + value_margin
+        ),
+        confidence_level=confidence,
+        sample_fraction=fraction,
+        sampled_subscriptions=sampled,
+        billable_subscriptions=sum(len(members) for members in strata.values())
+    )
+
+def _sample_variance(values: List[float]) -> float:
+    mean = sum(values) / len(values)
+    return sum((v - mean) ** 2 for v in values) / (len(values) - 1)
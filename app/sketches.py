@@ -0,0 +1,133 @@
+import math
+from typing import Dict, Iterable, Optional
+
+
+class QuantileSketch:
+    """
+    Mergeable streaming quantile sketch with a relative-error guarantee.
+
+    Values are mapped onto logarithmically sized buckets (the DDSketch
+    scheme): bucket ``k`` covers ``(gamma^(k-1), gamma^k]`` with
+    ``gamma = (1 + alpha) / (1 - alpha)``. Any quantile returned by
+    ``quantile`` is within a relative error of ``alpha`` of the true value
+    at that rank, i.e. ``|estimate - exact| <= alpha * |exact|``. Values whose
+    magnitude is below ``min_value`` are counted in a dedicated zero bucket
+    and reported as 0.
+
+    Memory is bounded by the dynamic range of the data rather than by the
+    number of values: with ``alpha = 0.01`` every value between 1 and 10^7
+    fits in roughly 800 buckets.
+
+    Merging only adds bucket counts, so combining sketches built on shards
+    (or returned by process-pool workers, the class is picklable) yields
+    exactly the same buckets as sketching the union directly. Sketches can
+    only be merged when they share the same ``alpha``.
+    """
+
+    def __init__(self, alpha: float = 0.01, min_value: float = 1e-9):
+        if not 0 < alpha < 1:
+            raise ValueError("alpha must be between 0 and 1")
+        self.alpha = alpha
+        self.min_value = min_value
+        self._gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self._gamma)
+        self._positive: Dict[int, int] = {}
+        self._negative: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _key(self, magnitude: float) -> int:
+        return math.ceil(math.log(magnitude) / self._log_gamma)
+
+    def _value(self, key: int) -> float:
+        # Midpoint (in relative terms) of the bucket, which bounds the error by alpha
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+    def add(self, value: float, weight: int = 1) -> None:
+        """
+        Add a value to the sketch, optionally with an integer weight.
+        """
+        if weight <= 0:
+            return
+        if value > self.min_value:
+            key = self._key(value)
+            self._positive[key] = self._positive.get(key, 0) + weight
+        elif value < -self.min_value:
+            key = self._key(-value)
+            self._negative[key] = self._negative.get(key, 0) + weight
+        else:
+            self.zero_count += weight
+
+        self.count += weight
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def extend(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """
+        Merge another sketch into this one in place.
+        """
+        if other.alpha != self.alpha or other.min_value != self.min_value:
+            raise ValueError("Cannot merge sketches with different accuracy settings")
+        for key, count in other._positive.items():
+            self._positive[key] = self._positive.get(key, 0) + count
+        for key, count in other._negative.items():
+            self._negative[key] = self._negative.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Return the estimated value at quantile ``q`` (0 <= q <= 1), or None if empty.
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("q must be between 0 and 1")
+        if self.count == 0:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = 0
+
+        # Walk from the most negative value up to the largest positive one
+        for key in sorted(self._negative, reverse=True):
+            seen += self._negative[key]
+            if seen > rank:
+                return self._clamp(-self._value(key))
+
+        seen += self.zero_count
+        if seen > rank:
+            return self._clamp(0.0)
+
+        for key in sorted(self._positive):
+            seen += self._positive[key]
+            if seen > rank:
+                return self._clamp(self._value(key))
+
+        return self.max
+
+    def _clamp(self, value: float) -> float:
+        return min(max(value, self.min), self.max)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, QuantileSketch):
+            return NotImplemented
+        return (
+            self.alpha == other.alpha
+            and self.zero_count == other.zero_count
+            and self._positive == other._positive
+            and self._negative == other._negative
+            and self.min == other.min
+            and self.max == other.max
+        )
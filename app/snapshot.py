@@ -0,0 +1,396 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Hashable, List, Mapping, Optional, Sequence, Tuple, TypeVar
+from app.api_client import AudicusAPIClient
+from app.cache import CacheBackend, cache_backend
+from app.leader import LeaderLock
+from app.metrics import counting_sync_pages, record_cache_lookup
+from app.models import Subscription, Order
+from app.tracing import span
+from app.snapshot_file import MappedOrders, MappedSnapshot, MappedSubscriptions, encode_snapshot, write_snapshot_file
+from app.warehouse import SQLiteWarehouse
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# How long a fetched snapshot is served before the next request refreshes it
+SNAPSHOT_TTL_SECONDS = float(os.getenv("SNAPSHOT_TTL_SECONDS", "300"))
+
+# Optional SQLite file every fetched snapshot is synced into (shared by all workers)
+WAREHOUSE_PATH = os.getenv("WAREHOUSE_PATH")
+
+# Optional binary snapshot file written after every upstream fetch and loaded on startup
+SNAPSHOT_FILE = os.getenv("SNAPSHOT_FILE")
+
+# Cache key the encoded snapshot is shared under
+SNAPSHOT_CACHE_KEY = "snapshot"
+
+# How often followers look for a snapshot file published by the leader
+SNAPSHOT_POLL_SECONDS = float(os.getenv("SNAPSHOT_POLL_SECONDS", "5"))
+
+# How long a follower without any snapshot waits for the leader's first one, and how
+# long past the TTL a published snapshot may get before followers fetch for themselves
+LEADER_WAIT_SECONDS = 30.0
+
+@dataclass
+class Snapshot:
+    """
+    Point-in-time view of the upstream data shared by every analytics endpoint.
+    """
+    version: int
+    fetched_at: datetime
+    subscriptions: Sequence[Subscription]
+    orders: Mapping[int, List[Order]]
+    _derived: Dict[Hashable, Any] = field(default_factory=dict, repr=False)
+
+    def derive(self, key: Hashable, builder: Callable[[], T]) -> T:
+        """
+        Return a value computed from this snapshot, building it on first use.
+
+        Derived values (indexes, per-endpoint results) live and die with the
+        snapshot, so they are rebuilt once per refresh rather than per request.
+        """
+        if key not in self._derived:
+            self._derived[key] = builder()
+        return self._derived[key]
+
+async def fetch_orders(api_client: AudicusAPIClient, subscriptions: List[Subscription]) -> Dict[int, List[Order]]:
+    """
+    Fetch orders for each of the given subscriptions concurrently.
+    """
+    all_orders: Dict[int, List[Order]] = {}
+
+    async def fetch_orders_for_subscription(sub_id: int):
+        with span("upstream.subscription_orders", subscription_id=sub_id) as orders_span:
+            orders = await api_client.get_subscription_orders(sub_id)
+            orders_span.set("records", len(orders))
+        if orders:
+            all_orders[sub_id] = orders
+
+    # Execute all tasks concurrently
+    await asyncio.gather(*[fetch_orders_for_subscription(sub.id) for sub in subscriptions])
+
+    return all_orders
+
+async def fetch_snapshot(api_client: AudicusAPIClient, version: int) -> Snapshot:
+    """
+    Fetch all subscriptions and their orders from upstream.
+    """
+    fetched_at = datetime.now(timezone.utc)
+
+    with counting_sync_pages():
+        logger.info("Fetching subscriptions...")
+        with span("upstream.subscriptions", summarize=True) as listing_span:
+            subscriptions = await api_client.get_subscriptions()
+            listing_span.set("records", len(subscriptions))
+        logger.info(f"Found {len(subscriptions)} subscriptions")
+
+        all_orders: Dict[int, List[Order]] = {}
+        if subscriptions:
+            logger.info("Fetching orders for each subscription...")
+            with span("upstream.orders", summarize=True, subscriptions=len(subscriptions)) as orders_span:
+                all_orders = await fetch_orders(api_client, subscriptions)
+                orders_span.set("records", sum(len(orders) for orders in all_orders.values()))
+            logger.info(f"Fetched orders for {len(all_orders)} subscriptions")
+
+    return Snapshot(version=version, fetched_at=fetched_at, subscriptions=subscriptions, orders=all_orders)
+
+async def stream_to_warehouse(api_client: AudicusAPIClient, warehouse: SQLiteWarehouse) -> Optional[datetime]:
+    """
+    Sync the warehouse from upstream, writing each page of subscriptions and
+    their orders as it arrives rather than building a snapshot. Returns when
+    the synced data was fetched, or None if upstream listed no subscriptions.
+
+    A listing cut short by an upstream error raises and leaves the previous
+    sync in place.
+    """
+    fetched_at = datetime.now(timezone.utc)
+    sync = await asyncio.to_thread(warehouse.begin_sync, fetched_at)
+    try:
+        with counting_sync_pages():
+            async for subscriptions in api_client.subscription_pages():
+                orders = await fetch_orders(api_client, subscriptions)
+                await asyncio.to_thread(sync.add, subscriptions,
+                                        [order for sub_orders in orders.values() for order in sub_orders])
+        synced = await asyncio.to_thread(sync.commit)
+    except BaseException:
+        sync.rollback()
+        raise
+    logger.info(f"Synced {sync.subscriptions} subscriptions from upstream into the warehouse")
+    return fetched_at if synced else None
+
+def _file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Identity of the file currently at `path`; each published snapshot replaces the file, so this changes.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def _decode_snapshot(source, version: int) -> Snapshot:
+    """
+    Build a snapshot from a snapshot file path or encoded snapshot bytes.
+
+    The snapshot reads its rows from the mapping, which stays open until the
+    snapshot is dropped.
+    """
+    mapped = MappedSnapshot(source)
+    return Snapshot(version=version, fetched_at=mapped.fetched_at,
+                    subscriptions=MappedSubscriptions(mapped), orders=MappedOrders(mapped))
+
+class SnapshotStore:
+    """
+    Holds the current snapshot and refreshes it once it is older than the TTL.
+
+    Concurrent requests that find the snapshot stale share a single refresh
+    instead of each fanning out to upstream.
+
+    With a warehouse, every fetched snapshot is synced into it, and a refresh
+    loads the warehouse copy instead of fetching when another process synced
+    it within the TTL. `sync_warehouse` keeps it current for engine=sql
+    without any snapshot.
+
+    With a snapshot file, every snapshot the leader makes current (fetched,
+    or loaded from the cache or warehouse) is also written to it, and
+    `preload` serves the last one written right after a restart. The file is
+    shared by every process using the same path: the one holding the lock
+    file next to it is the leader and the only one fetching from upstream,
+    while the others follow by loading each new file the leader publishes.
+    If the leader exits, the next process to find its snapshot stale takes
+    over; if it stops publishing, followers fetch for themselves.
+
+    With a cache backend, fetched snapshots are stored in it (encoded like the
+    snapshot file), so replicas sharing the backend reuse each other's fetch.
+    """
+
+    def __init__(self, ttl_seconds: float = SNAPSHOT_TTL_SECONDS, warehouse: Optional[SQLiteWarehouse] = None,
+                 snapshot_path: Optional[str] = None, cache: Optional[CacheBackend] = None):
+        self.ttl_seconds = ttl_seconds
+        self.warehouse = warehouse
+        self.cache = cache
+        self.snapshot_path = snapshot_path
+        self.leader_lock = LeaderLock(f"{snapshot_path}.lock") if snapshot_path else None
+        self.poll_seconds = min(ttl_seconds, SNAPSHOT_POLL_SECONDS)
+        self._snapshot: Optional[Snapshot] = None
+        self._loaded_at = 0.0
+        # Leaders keep a snapshot for the TTL, followers only until they next look for a new file
+        self._following = False
+        self._loaded_file: Optional[Tuple[int, int, int]] = None
+        self._version = 0
+        self._lock = asyncio.Lock()
+        # Warehouse syncs for engine=sql don't touch the snapshot, so they don't hold up its refreshes
+        self._warehouse_lock = asyncio.Lock()
+
+    @property
+    def snapshot(self) -> Optional[Snapshot]:
+        return self._snapshot
+
+    def is_fresh(self) -> bool:
+        fresh_for = self.poll_seconds if self._following else self.ttl_seconds
+        return self._snapshot is not None and time.monotonic() - self._loaded_at < fresh_for
+
+    def is_leader(self) -> bool:
+        """
+        Whether this process fetches from upstream, taking leadership if it is free.
+        """
+        return self.leader_lock is None or self.leader_lock.try_acquire()
+
+    async def get(self, api_client: AudicusAPIClient) -> Snapshot:
+        """
+        Return the current snapshot, refreshing it from upstream (or from the
+        leader's snapshot file) if it is stale.
+        """
+        if self.is_fresh():
+            return self._snapshot
+
+        async with self._lock:
+            # Another request may have refreshed while we waited for the lock
+            if self.is_fresh():
+                return self._snapshot
+            if self.is_leader():
+                return await self.refresh(api_client)
+            return await self.follow(api_client)
+
+    async def refresh(self, api_client: AudicusAPIClient) -> Snapshot:
+        """
+        Fetch a new snapshot from upstream (or a shared cache or recently
+        synced warehouse) and make it current.
+        """
+        snapshot = None
+        if self.cache is not None:
+            with span("snapshot.cache_load"):
+                snapshot = await self._load_from_cache()
+        if snapshot is None and self.warehouse is not None:
+            with span("snapshot.warehouse_load"):
+                snapshot = await self._load_from_warehouse()
+        if snapshot is None:
+            snapshot = await fetch_snapshot(api_client, self._version + 1)
+            if snapshot.subscriptions and self.cache is not None:
+                with span("snapshot.cache_store"):
+                    data = await asyncio.to_thread(encode_snapshot, snapshot.fetched_at, snapshot.subscriptions, snapshot.orders)
+                    await self.cache.set(SNAPSHOT_CACHE_KEY, data, self.ttl_seconds)
+            if snapshot.subscriptions and self.warehouse is not None:
+                with span("snapshot.warehouse_sync"):
+                    await asyncio.to_thread(self.warehouse.sync, snapshot.subscriptions, snapshot.orders, snapshot.fetched_at)
+
+        # An empty listing usually means upstream failed, so don't cache it
+        if snapshot.subscriptions:
+            # Followers only see what the leader publishes, wherever the snapshot came from
+            if self.leader_lock is not None and self.leader_lock.held:
+                with span("snapshot.file_write"):
+                    await asyncio.to_thread(write_snapshot_file, self.snapshot_path, snapshot.fetched_at,
+                                            snapshot.subscriptions, snapshot.orders)
+                self._loaded_file = _file_signature(self.snapshot_path)
+            self._version = snapshot.version
+            self._snapshot = snapshot
+            self._loaded_at = time.monotonic()
+            self._following = False
+
+        return snapshot
+
+    async def sync_warehouse(self, api_client: AudicusAPIClient) -> Optional[datetime]:
+        """
+        When the warehouse was last synced, first syncing it from upstream if
+        that was longer than the TTL ago. Neither path loads a snapshot: a
+        sync streams upstream pages straight into the warehouse.
+        """
+        async with self._warehouse_lock:
+            synced_at = await asyncio.to_thread(self.warehouse.synced_at)
+            if synced_at is not None and (datetime.now(timezone.utc) - synced_at).total_seconds() < self.ttl_seconds:
+                return synced_at
+
+            with span("snapshot.warehouse_sync"):
+                fetched_at = await stream_to_warehouse(api_client, self.warehouse)
+            return fetched_at or synced_at
+
+    async def follow(self, api_client: AudicusAPIClient) -> Snapshot:
+        """
+        Pick up the leader's latest snapshot file if it changed since the last look.
+        """
+        signature = _file_signature(self.snapshot_path)
+        deadline = time.monotonic() + LEADER_WAIT_SECONDS
+        while signature is None and self._snapshot is None and time.monotonic() < deadline:
+            # The leader has not published anything yet
+            await asyncio.sleep(0.1)
+            signature = _file_signature(self.snapshot_path)
+
+        if signature is not None and signature != self._loaded_file:
+            try:
+                snapshot = await asyncio.to_thread(self._read_file, self._version + 1)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable snapshot file {self.snapshot_path}: {str(e)}")
+            else:
+                self._version = snapshot.version
+                self._snapshot = snapshot
+                self._loaded_file = signature
+
+        if self._snapshot is None:
+            logger.warning(f"No snapshot published to {self.snapshot_path}, fetching from upstream")
+            return await self.refresh(api_client)
+
+        # A live leader republishes every TTL; a file well past it means the leader is stuck
+        age = (datetime.now(timezone.utc) - self._snapshot.fetched_at).total_seconds()
+        if age >= self.ttl_seconds + LEADER_WAIT_SECONDS:
+            logger.warning(f"Snapshot published to {self.snapshot_path} is {age:.0f} s old, fetching from upstream")
+            return await self.refresh(api_client)
+
+        self._loaded_at = time.monotonic()
+        self._following = True
+        return self._snapshot
+
+    def _read_file(self, version: int) -> Snapshot:
+        return _decode_snapshot(self.snapshot_path, version)
+
+    async def preload(self) -> bool:
+        """
+        Make the snapshot file current, if there is a readable one, so a
+        restarted process can serve before its first upstream fetch. Returns
+        whether a snapshot was loaded.
+
+        Only the header, string table and order offsets are read here; rows
+        become models as requests read them.
+        """
+        if self.snapshot_path is None:
+            return False
+        signature = _file_signature(self.snapshot_path)
+        if signature is None:
+            return False
+
+        started = time.perf_counter()
+        try:
+            snapshot = self._read_file(self._version + 1)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable snapshot file {self.snapshot_path}: {str(e)}")
+            return False
+
+        self._version = snapshot.version
+        self._snapshot = snapshot
+        self._loaded_file = signature
+        self._loaded_at = time.monotonic()
+        self._following = not self.is_leader()
+        logger.info(f"Loaded snapshot fetched at {snapshot.fetched_at.isoformat()} from {self.snapshot_path} "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return True
+
+    async def refresh_in_background(self, api_client: AudicusAPIClient) -> None:
+        """
+        Replace the current snapshot with a fresh one from upstream, holding
+        the refresh lock so requests keep being served from the current one.
+        """
+        try:
+            async with self._lock:
+                await self.refresh(api_client)
+        except Exception as e:
+            logger.error(f"Background snapshot refresh failed: {str(e)}", exc_info=True)
+
+    async def _load_from_cache(self) -> Optional[Snapshot]:
+        """
+        The cached snapshot, if one was stored within the TTL.
+        """
+        data = await self.cache.get(SNAPSHOT_CACHE_KEY)
+        record_cache_lookup("snapshot", data is not None)
+        if data is None:
+            return None
+        try:
+            snapshot = await asyncio.to_thread(_decode_snapshot, data, self._version + 1)
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable cached snapshot: {str(e)}")
+            return None
+        if (datetime.now(timezone.utc) - snapshot.fetched_at).total_seconds() >= self.ttl_seconds:
+            return None
+        logger.info(f"Loaded snapshot fetched at {snapshot.fetched_at.isoformat()} from the cache")
+        return snapshot
+
+    async def _load_from_warehouse(self) -> Optional[Snapshot]:
+        """
+        The warehouse contents as a snapshot, if they were synced within the TTL.
+        """
+        synced_at = await asyncio.to_thread(self.warehouse.synced_at)
+        if synced_at is None or (datetime.now(timezone.utc) - synced_at).total_seconds() >= self.ttl_seconds:
+            return None
+
+        logger.info(f"Loading snapshot synced at {synced_at.isoformat()} from the warehouse")
+        subscriptions = await asyncio.to_thread(self.warehouse.load_subscriptions)
+        orders = await asyncio.to_thread(self.warehouse.load_orders)
+        return Snapshot(version=self._version + 1, fetched_at=synced_at, subscriptions=subscriptions, orders=orders)
+
+    def invalidate(self) -> None:
+        """
+        Drop the current snapshot so the next request refetches it.
+        """
+        self._snapshot = None
+        self._loaded_at = 0.0
+        self._loaded_file = None
+
+snapshot_store = SnapshotStore(
+    warehouse=SQLiteWarehouse(WAREHOUSE_PATH) if WAREHOUSE_PATH else None,
+    snapshot_path=SNAPSHOT_FILE,
+    cache=cache_backend
+)
@@ -0,0 +1,265 @@
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from app.models import Subscription, Order
+from app.timestamps import from_micros, to_micros
+
+MAGIC = b"AUDSNAP\0"
+
+# Bumped whenever the layout below changes; older files are rejected
+FORMAT_VERSION = 1
+
+# magic, format version, reserved, fetched_at (epoch micros), subscription, order and string counts, string blob size
+HEADER = struct.Struct("<8sIIqqqqq")
+
+# Stands in for a missing datetime in the int64 columns (missing floats are NaN)
+NULL_TIME = -(2 ** 63)
+
+SUBSCRIPTION_COLUMNS = [
+    ("subscriptions.id", "q"),
+    ("subscriptions.billing_interval", "i"),
+    ("subscriptions.status", "i"),
+    ("subscriptions.start_date", "q"),
+    ("subscriptions.end_date", "q"),
+    ("subscriptions.next_payment_date", "q"),
+    ("subscriptions.recurring_amount", "d"),
+]
+
+ORDER_COLUMNS = [
+    ("orders.id", "q"),
+    ("orders.subscription_id", "q"),
+    ("orders.closedate", "q"),
+    ("orders.total_order_value", "d"),
+]
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+def _sections(subscription_count: int, order_count: int, string_count: int, blob_size: int) -> List[Tuple[str, str, int]]:
+    """
+    Name, item format and item count of every section, in file order.
+    """
+    return (
+        [(name, fmt, subscription_count) for name, fmt in SUBSCRIPTION_COLUMNS]
+        + [(name, fmt, order_count) for name, fmt in ORDER_COLUMNS]
+        # Orders of subscription row i are rows order_offsets[i]:order_offsets[i + 1]
+        + [("order_offsets", "q", subscription_count + 1),
+           ("string_offsets", "q", string_count + 1),
+           ("strings", "B", blob_size)]
+    )
+
+def _time(value: Optional[datetime]) -> int:
+    return NULL_TIME if value is None else to_micros(value)
+
+def _from_time(value: int) -> Optional[datetime]:
+    return None if value == NULL_TIME else from_micros(value)
+
+def encode_snapshot(fetched_at: datetime, subscriptions: List[Subscription], orders: Dict[int, List[Order]]) -> bytes:
+    """
+    Encode subscriptions and their orders as fixed-width columns plus a string table.
+    """
+    if sys.byteorder != "little":
+        raise RuntimeError("Snapshot files are only supported on little-endian platforms")
+
+    strings: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        return strings.setdefault(value, len(strings))
+
+    columns = {name: array(fmt) for name, fmt in SUBSCRIPTION_COLUMNS + ORDER_COLUMNS}
+    order_offsets = array("q", [0])
+    for sub in subscriptions:
+        columns["subscriptions.id"].append(sub.id)
+        columns["subscriptions.billing_interval"].append(intern(sub.billing_interval__c))
+        columns["subscriptions.status"].append(intern(sub.status__c))
+        columns["subscriptions.start_date"].append(_time(sub.start_date__c))
+        columns["subscriptions.end_date"].append(_time(sub.end_date__c))
+        columns["subscriptions.next_payment_date"].append(_time(sub.next_payment_date__c))
+        columns["subscriptions.recurring_amount"].append(
+            math.nan if sub.recurring_amount__c is None else sub.recurring_amount__c
+        )
+        for order in orders.get(sub.id, []):
+            columns["orders.id"].append(order.id)
+            columns["orders.subscription_id"].append(order.parent_subscription_id__c)
+            columns["orders.closedate"].append(to_micros(order.closedate))
+            columns["orders.total_order_value"].append(order.total_order_value__c)
+        order_offsets.append(len(columns["orders.id"]))
+
+    encoded = [value.encode("utf-8") for value in strings]
+    string_offsets = array("q", [0])
+    for value in encoded:
+        string_offsets.append(string_offsets[-1] + len(value))
+    blob = b"".join(encoded)
+
+    sections = dict(columns, order_offsets=order_offsets, string_offsets=string_offsets)
+    data = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, 0, to_micros(fetched_at),
+                                 len(subscriptions), len(columns["orders.id"]), len(encoded), len(blob)))
+    for name, _, _ in _sections(len(subscriptions), len(columns["orders.id"]), len(encoded), len(blob)):
+        data += b"\0" * (_align(len(data)) - len(data))
+        data += blob if name == "strings" else sections[name].tobytes()
+    return bytes(data)
+
+def write_snapshot_file(path: str, fetched_at: datetime, subscriptions: List[Subscription],
+                        orders: Dict[int, List[Order]]) -> None:
+    """
+    Write an encoded snapshot to `path`. The file is written next to it and
+    renamed over it, so readers that still map the previous file are unaffected.
+    """
+    data = encode_snapshot(fetched_at, subscriptions, orders)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class MappedSnapshot:
+    """
+    Read-only view of a snapshot file mapped into memory (or of encoded
+    snapshot bytes, e.g. from a cache).
+
+    Columns are exposed as typed memoryviews over the mapping and parsed as
+    rows are read; opening one only reads the header and string table. A
+    snapshot is served through MappedSubscriptions and MappedOrders, which
+    keep the mapping open and build models only for the rows requests read.
+    """
+
+    def __init__(self, source: Union[str, bytes]):
+        path = source if isinstance(source, str) else "snapshot data"
+        self._mmap = None
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap if self._mmap is not None else source)
+
+        try:
+            (magic, format_version, _, fetched_at,
+             subscription_count, order_count, string_count, blob_size) = HEADER.unpack_from(self._view)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a snapshot file")
+            if format_version != FORMAT_VERSION:
+                raise ValueError(f"{path} has snapshot format {format_version}, expected {FORMAT_VERSION}")
+
+            self.fetched_at = from_micros(fetched_at)
+            self.columns: Dict[str, memoryview] = {}
+            offset = HEADER.size
+            for name, fmt, count in _sections(subscription_count, order_count, string_count, blob_size):
+                offset = _align(offset)
+                end = offset + struct.calcsize(fmt) * count
+                if end > len(self._view):
+                    raise ValueError(f"{path} is truncated")
+                self.columns[name] = self._view[offset:end].cast(fmt)
+                offset = end
+        except Exception:
+            self.close()
+            raise
+
+        # The string table is tiny (statuses and intervals), so decode it once
+        string_offsets = self.columns["string_offsets"]
+        blob = self.columns["strings"]
+        self.strings = [
+            bytes(blob[string_offsets[i]:string_offsets[i + 1]]).decode("utf-8") for i in range(string_count)
+        ]
+
+    def __len__(self) -> int:
+        return len(self.columns["subscriptions.id"])
+
+    def subscription(self, row: int) -> Subscription:
+        columns = self.columns
+        amount = columns["subscriptions.recurring_amount"][row]
+        return Subscription(
+            id=columns["subscriptions.id"][row],
+            billing_interval__c=self.strings[columns["subscriptions.billing_interval"][row]],
+            end_date__c=_from_time(columns["subscriptions.end_date"][row]),
+            next_payment_date__c=_from_time(columns["subscriptions.next_payment_date"][row]),
+            recurring_amount__c=None if math.isnan(amount) else amount,
+            start_date__c=_from_time(columns["subscriptions.start_date"][row]),
+            status__c=self.strings[columns["subscriptions.status"][row]]
+        )
+
+    def orders(self, row: int) -> List[Order]:
+        columns = self.columns
+        offsets = columns["order_offsets"]
+        return [
+            Order(
+                id=columns["orders.id"][i],
+                closedate=from_micros(columns["orders.closedate"][i]),
+                total_order_value__c=columns["orders.total_order_value"][i],
+                parent_subscription_id__c=columns["orders.subscription_id"][i]
+            )
+            for i in range(offsets[row], offsets[row + 1])
+        ]
+
+    def close(self) -> None:
+        for column in getattr(self, "columns", {}).values():
+            column.release()
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self) -> "MappedSnapshot":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+class MappedSubscriptions(Sequence):
+    """
+    The subscriptions of a mapped snapshot, as a list of models built on
+    first access to each row and kept for the snapshot's lifetime.
+    """
+
+    def __init__(self, mapped: MappedSnapshot):
+        self._mapped = mapped
+        self._rows: List[Optional[Subscription]] = [None] * len(mapped)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[row] for row in range(len(self))[index]]
+        row = range(len(self))[index]
+        sub = self._rows[row]
+        if sub is None:
+            sub = self._rows[row] = self._mapped.subscription(row)
+        return sub
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(mine == theirs for mine, theirs in zip(self, other))
+
+class MappedOrders(Mapping):
+    """
+    The orders of a mapped snapshot by subscription id, built on first
+    access to each subscription's orders and kept for the snapshot's lifetime.
+
+    Like a snapshot fetched from upstream, only subscriptions with orders
+    have an entry.
+    """
+
+    def __init__(self, mapped: MappedSnapshot):
+        self._mapped = mapped
+        ids = mapped.columns["subscriptions.id"]
+        offsets = mapped.columns["order_offsets"]
+        self._rows: Dict[int, int] = {ids[row]: row for row in range(len(mapped)) if offsets[row + 1] > offsets[row]}
+        self._orders: Dict[int, List[Order]] = {}
+
+    def __getitem__(self, sub_id: int) -> List[Order]:
+        orders = self._orders.get(sub_id)
+        if orders is None:
+            orders = self._orders[sub_id] = self._mapped.orders(self._rows[sub_id])
+        return orders
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
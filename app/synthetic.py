@@ -0,0 +1,132 @@
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+from app.analytics import parse_billing_interval, advance_billing_date
+from app.models import Subscription, Order
+
+# Billing intervals and statuses with their share of a realistic book
+INTERVAL_WEIGHTS = [("1 month", 50), ("3 months", 20), ("6 months", 8), ("1 year", 10), ("2 weeks", 10), ("4 weeks", 2)]
+STATUS_WEIGHTS = [("active", 60), ("on-hold", 10), ("canceled", 30)]
+RECURRING_AMOUNTS = [19.99, 29.99, 49.99, 79.99, 149.99, 299.99]
+
+# Share of subscriptions that were paid up front and have no recurring amount
+PREPAID_SHARE = 0.05
+
+# Longest tenure generated, in days
+MAX_TENURE_DAYS = 5 * 365
+
+# Chance that a due payment has no order at all, and that a paid one lands well outside the grace window
+MISSED_PAYMENT_RATE = 0.05
+LATE_PAYMENT_RATE = 0.03
+
+class SyntheticBook:
+    """
+    Seeded, deterministic book of subscriptions and orders.
+
+    Every subscription (and its orders) is derived from its own random stream
+    seeded with (seed, id), so any record can be generated on its own, in any
+    order, without materializing the rest of the book. Subscription ids run
+    from 1 to `size`; order ids are `subscription id * 10_000 + n`.
+    """
+
+    def __init__(self, size: int, seed: int = 0, as_of: Optional[datetime] = None, mean_tenure_days: float = 400):
+        self.size = size
+        self.seed = seed
+        self.as_of = as_of or datetime(2025, 1, 1, tzinfo=timezone.utc)
+        self.mean_tenure_days = mean_tenure_days
+
+    def _rng(self, sub_id: int, stream: str) -> random.Random:
+        return random.Random(f"{self.seed}:{sub_id}:{stream}")
+
+    def subscription(self, sub_id: int) -> Subscription:
+        if not 1 <= sub_id <= self.size:
+            raise KeyError(sub_id)
+        rng = self._rng(sub_id, "subscription")
+
+        interval = rng.choices([i for i, _ in INTERVAL_WEIGHTS], [w for _, w in INTERVAL_WEIGHTS])[0]
+        status = rng.choices([s for s, _ in STATUS_WEIGHTS], [w for _, w in STATUS_WEIGHTS])[0]
+        # Skew towards recent signups, with a long tail of multi-year tenures
+        tenure_days = min(MAX_TENURE_DAYS, int(rng.expovariate(1 / self.mean_tenure_days)) + 1)
+        start_date = (self.as_of - timedelta(days=tenure_days)).replace(hour=rng.randrange(24), minute=rng.randrange(60))
+        amount = None if rng.random() < PREPAID_SHARE else rng.choice(RECURRING_AMOUNTS)
+
+        end_date = next_payment_date = None
+        if status == "canceled":
+            # A few canceled rows have no end date, like upstream
+            if rng.random() < 0.9:
+                end_date = start_date + timedelta(days=rng.randrange(1, tenure_days + 1))
+        else:
+            value, unit = parse_billing_interval(interval)
+            next_payment_date = start_date
+            while next_payment_date <= self.as_of:
+                next_payment_date = advance_billing_date(next_payment_date, value, unit)
+
+        return Subscription(
+            id=sub_id,
+            billing_interval__c=interval,
+            end_date__c=end_date,
+            next_payment_date__c=next_payment_date,
+            recurring_amount__c=amount,
+            start_date__c=start_date,
+            status__c=status
+        )
+
+    def orders(self, sub_id: int) -> List[Order]:
+        """
+        Orders of a subscription: one per due billing date, with jitter,
+        occasional late payments and gaps where a payment was never made.
+        """
+        return self._orders_for(self.subscription(sub_id))
+
+    def _orders_for(self, sub: Subscription) -> List[Order]:
+        sub_id = sub.id
+        rng = self._rng(sub_id, "orders")
+
+        value, unit = parse_billing_interval(sub.billing_interval__c)
+        until = min(sub.end_date__c or self.as_of, self.as_of)
+        amount = sub.recurring_amount__c or rng.choice(RECURRING_AMOUNTS)
+
+        orders = []
+        due = sub.start_date__c
+        while due <= until:
+            roll = rng.random()
+            if roll >= MISSED_PAYMENT_RATE:
+                if roll < MISSED_PAYMENT_RATE + LATE_PAYMENT_RATE:
+                    closedate = due + timedelta(days=rng.randrange(10, 30))
+                else:
+                    closedate = due + timedelta(days=rng.randrange(-3, 4), hours=rng.randrange(24))
+                if closedate <= self.as_of:
+                    orders.append(Order(
+                        id=sub_id * 10_000 + len(orders),
+                        closedate=closedate,
+                        total_order_value__c=amount,
+                        parent_subscription_id__c=sub_id
+                    ))
+            # Prepaid subscriptions only have their initial order
+            if sub.recurring_amount__c is None:
+                break
+            due = advance_billing_date(due, value, unit)
+        return orders
+
+    def order(self, order_id: int) -> Optional[Order]:
+        sub_id, n = divmod(order_id, 10_000)
+        if not 1 <= sub_id <= self.size:
+            return None
+        orders = self.orders(sub_id)
+        return orders[n] if n < len(orders) else None
+
+    def subscriptions(self) -> Iterator[Subscription]:
+        for sub_id in range(1, self.size + 1):
+            yield self.subscription(sub_id)
+
+    def dataset(self) -> Tuple[List[Subscription], Dict[int, List[Order]]]:
+        """
+        The whole book, shaped like a snapshot: subscriptions and their orders by subscription id.
+        """
+        subscriptions = list(self.subscriptions())
+        all_orders = {}
+        for sub in subscriptions:
+            orders = self._orders_for(sub)
+            if orders:
+                all_orders[sub.id] = orders
+        return subscriptions, all_orders
@@ -0,0 +1,18 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def to_micros(value: Optional[datetime]) -> Optional[int]:
+    """
+    A datetime as UTC epoch microseconds, the exact integer form datetimes are
+    stored in by the warehouse and snapshot files.
+    """
+    if value is None:
+        return None
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+def from_micros(value: Optional[int]) -> Optional[datetime]:
+    if value is None:
+        return None
+    return EPOCH + timedelta(microseconds=value)
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Append every finished trace to this file as one OTLP/JSON line (unset: traces are not exported)
+TRACE_FILE = os.getenv("TRACE_FILE")
+
+# service.name reported with exported traces
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "audicus-analytics")
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    duration_ns: int = 0
+    # Counted into the Server-Timing summary of the trace
+    summarize: bool = False
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+class _NoSpan:
+    """
+    Stands in for a span outside any trace, so callers never need to check.
+    """
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+NO_SPAN = _NoSpan()
+
+@dataclass
+class Trace:
+    """
+    Spans of one request or background job.
+
+    Only detailed traces keep a Span per block, for export or profiling.
+    Otherwise just the total time per summarized phase is kept, which is all
+    Server-Timing needs, so a cold sync does not allocate a span per upstream
+    page.
+    """
+    trace_id: str
+    detailed: bool = True
+    spans: List[Span] = field(default_factory=list)
+    root: Union[Span, _NoSpan] = NO_SPAN
+    # Nanoseconds per summarized span name, in the order first started
+    phase_ns: Dict[str, int] = field(default_factory=dict)
+    duration_ns: int = 0
+
+    def timings(self) -> Dict[str, float]:
+        """
+        Milliseconds per summarized span name, summed over repeats, in the order first started.
+        """
+        return {name: duration / 1e6 for name, duration in self.phase_ns.items()}
+
+    def server_timing(self) -> str:
+        """
+        The timings as a Server-Timing header value, e.g.
+        `snapshot;dur=12.3, decode;dur=4.5, total;dur=20.1`.
+        """
+        timings = self.timings()
+        if self.duration_ns:
+            timings["total"] = self.duration_ns / 1e6
+        return ", ".join(f"{name};dur={duration:.1f}" for name, duration in timings.items())
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """
+        The trace in OTLP/JSON (as read by the OpenTelemetry Collector's otlpjsonfile receiver).
+        """
+        return {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": TRACE_SERVICE_NAME})},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [
+                    {
+                        "traceId": self.trace_id,
+                        "spanId": span.span_id,
+                        **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                        "name": span.name,
+                        "kind": 1,
+                        "startTimeUnixNano": str(span.start_ns),
+                        "endTimeUnixNano": str(span.start_ns + span.duration_ns),
+                        "attributes": _otlp_attributes(span.attributes),
+                    }
+                    for span in self.spans
+                ],
+            }],
+        }]}
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+# Trace being recorded in the current context and the innermost open span
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+_export_lock = threading.Lock()
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def span(name: str, summarize: bool = False, **attributes: Any) -> Iterator[Any]:
+    """
+    Time the block as a child of the innermost open span. Outside a trace
+    this costs one context variable lookup and yields a span that ignores
+    attributes.
+
+    Spans opened with `summarize` are the phases reported in Server-Timing.
+    In a trace that is not detailed, other spans cost the same as outside a
+    trace, and summarized ones only add to their phase's total.
+    """
+    recorded = _current_trace.get()
+    if recorded is None or not (recorded.detailed or summarize):
+        yield NO_SPAN
+        return
+
+    if summarize:
+        recorded.phase_ns.setdefault(name, 0)
+    current = NO_SPAN
+    if recorded.detailed:
+        parent = _current_span.get()
+        current = Span(name, _new_id(64), parent.span_id if parent else None, time.time_ns(), attributes,
+                       summarize=summarize)
+        token = _current_span.set(current)
+    started = time.perf_counter_ns()
+    try:
+        yield current
+    finally:
+        duration = time.perf_counter_ns() - started
+        if summarize:
+            recorded.phase_ns[name] += duration
+        if recorded.detailed:
+            current.duration_ns = duration
+            _current_span.reset(token)
+            recorded.spans.append(current)
+
+@contextmanager
+def trace(name: str, detailed: Optional[bool] = None, **attributes: Any) -> Iterator[Trace]:
+    """
+    Record a new trace rooted at a span called `name`; pass it to
+    finish_trace once the work it covers is done.
+
+    Traces are detailed when TRACE_FILE is set (or `detailed` is passed),
+    otherwise they only keep the Server-Timing phase totals.
+    """
+    recorded = Trace(_new_id(128), detailed=bool(TRACE_FILE) if detailed is None else detailed)
+    trace_token = _current_trace.set(recorded)
+    span_token = _current_span.set(None)
+    started = time.perf_counter_ns()
+    try:
+        with span(name, **attributes) as root:
+            recorded.root = root
+            yield recorded
+    finally:
+        recorded.duration_ns = time.perf_counter_ns() - started
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+async def finish_trace(recorded: Trace) -> None:
+    """
+    Export a finished detailed trace to TRACE_FILE, if set, off the event loop.
+    """
+    if TRACE_FILE and recorded.detailed:
+        await asyncio.to_thread(export_trace, recorded, TRACE_FILE)
+
+def export_trace(recorded: Trace, path: str) -> None:
+    try:
+        line = json.dumps(recorded.to_otlp(), separators=(",", ":"))
+        with _export_lock, open(path, "a") as f:
+            f.write(line + "\n")
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Could not export trace {recorded.trace_id}: {str(e)}")
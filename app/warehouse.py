@@ -0,0 +1,399 @@
+import logging
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence
+from app.analytics import GRACE_DAYS, is_billable, _expected_billing_dates
+from app.models import Subscription, Order, SubscriptionStats, MissedPaymentStats
+# Datetimes are stored as UTC epoch microseconds, so SQL comparisons are exact
+from app.timestamps import from_micros, to_micros
+
+logger = logging.getLogger(__name__)
+
+# Rows per executemany call (also keeps IN (...) lists under SQLite's variable limit)
+BATCH_SIZE = 500
+
+# How far ahead expected billing dates are materialized, and how much of that
+# must be left before the schedule is extended
+SCHEDULE_HORIZON_DAYS = 400
+SCHEDULE_MIN_LEAD_DAYS = 30
+
+MICROS_PER_DAY = 86_400_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id INTEGER PRIMARY KEY,
+    billing_interval TEXT NOT NULL,
+    end_date INTEGER,
+    next_payment_date INTEGER,
+    recurring_amount REAL,
+    start_date INTEGER,
+    status TEXT NOT NULL,
+    last_seen INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_status ON subscriptions (status);
+
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    closedate INTEGER NOT NULL,
+    total_order_value REAL NOT NULL,
+    subscription_id INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_subscription_closedate ON orders (subscription_id, closedate);
+
+CREATE TABLE IF NOT EXISTS billing_schedule (
+    subscription_id INTEGER NOT NULL,
+    expected_date INTEGER NOT NULL,
+    PRIMARY KEY (subscription_id, expected_date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def _batches(rows: Sequence, size: int = BATCH_SIZE) -> Iterator[Sequence]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+class SQLiteWarehouse:
+    """
+    Local SQLite copy of the upstream subscriptions and orders.
+
+    Rows are upserted in batches and indexed for the analytics queries; the
+    database runs in WAL mode so several processes can read while one syncs.
+    Expected billing dates are materialized into `billing_schedule` with the
+    same schedule logic as the Python engine (up to SCHEDULE_HORIZON_DAYS
+    ahead), which lets missed payments be computed entirely in SQL.
+
+    Each call opens its own connection, so the warehouse can be used from
+    worker threads (e.g. via asyncio.to_thread) and from several processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _open(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=check_same_thread)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = self._open()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _get_meta(self, conn: sqlite3.Connection, key: str) -> Optional[str]:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, conn: sqlite3.Connection, key: str, value: str) -> None:
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+    def _write_schedules(self, conn: sqlite3.Connection, subscriptions: Sequence[Subscription], until: datetime) -> None:
+        conn.executemany("DELETE FROM billing_schedule WHERE subscription_id = ?", [(sub.id,) for sub in subscriptions])
+        rows = [
+            (sub.id, to_micros(expected_date))
+            for sub in subscriptions if is_billable(sub)
+            for expected_date in _expected_billing_dates(sub, until)
+        ]
+        conn.executemany("INSERT INTO billing_schedule (subscription_id, expected_date) VALUES (?, ?)", rows)
+
+    def upsert_subscriptions(self, subscriptions: List[Subscription], seen_at: datetime) -> int:
+        """
+        Insert or update subscriptions, regenerating the billing schedule of
+        those whose interval, start date, status or amount changed. Returns
+        the number of schedules regenerated.
+        """
+        with self._connect() as conn:
+            return self._upsert_subscriptions(conn, subscriptions, seen_at)
+
+    def _upsert_subscriptions(self, conn: sqlite3.Connection, subscriptions: List[Subscription], seen_at: datetime) -> int:
+        seen = to_micros(seen_at)
+        regenerated = 0
+        schedule_until = self._ensure_schedule_horizon(conn, seen_at)
+        for batch in _batches(subscriptions):
+            placeholders = ",".join("?" * len(batch))
+            existing = {
+                row[0]: row[1:]
+                for row in conn.execute(
+                    f"SELECT id, billing_interval, start_date, status, recurring_amount "
+                    f"FROM subscriptions WHERE id IN ({placeholders})",
+                    [sub.id for sub in batch]
+                )
+            }
+            changed = [
+                sub for sub in batch
+                if existing.get(sub.id) != (sub.billing_interval__c, to_micros(sub.start_date__c),
+                                            sub.status__c, sub.recurring_amount__c)
+            ]
+
+            conn.executemany(
+                """
+                INSERT INTO subscriptions (id, billing_interval, end_date, next_payment_date,
+                                           recurring_amount, start_date, status, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    billing_interval = excluded.billing_interval,
+                    end_date = excluded.end_date,
+                    next_payment_date = excluded.next_payment_date,
+                    recurring_amount = excluded.recurring_amount,
+                    start_date = excluded.start_date,
+                    status = excluded.status,
+                    last_seen = excluded.last_seen
+                """,
+                [
+                    (sub.id, sub.billing_interval__c, to_micros(sub.end_date__c),
+                     to_micros(sub.next_payment_date__c), sub.recurring_amount__c,
+                     to_micros(sub.start_date__c), sub.status__c, seen)
+                    for sub in batch
+                ]
+            )
+            self._write_schedules(conn, changed, schedule_until)
+            regenerated += len(changed)
+        return regenerated
+
+    def _ensure_schedule_horizon(self, conn: sqlite3.Connection, now: datetime) -> datetime:
+        """
+        Extend the materialized schedule of every subscription once it gets
+        close to running out, and return how far it reaches.
+        """
+        stored = self._get_meta(conn, "schedule_until")
+        if stored is not None:
+            schedule_until = datetime.fromisoformat(stored)
+            if now + timedelta(days=SCHEDULE_MIN_LEAD_DAYS) <= schedule_until:
+                return schedule_until
+
+        schedule_until = now + timedelta(days=SCHEDULE_HORIZON_DAYS)
+        logger.info(f"Extending billing schedules to {schedule_until.isoformat()}")
+        subscriptions = self._load_subscriptions(conn)
+        for batch in _batches(subscriptions):
+            self._write_schedules(conn, batch, schedule_until)
+        self._set_meta(conn, "schedule_until", schedule_until.isoformat())
+        return schedule_until
+
+    def upsert_orders(self, orders: List[Order], seen_at: datetime) -> None:
+        """
+        Insert or update orders.
+        """
+        with self._connect() as conn:
+            self._upsert_orders(conn, orders, seen_at)
+
+    def _upsert_orders(self, conn: sqlite3.Connection, orders: List[Order], seen_at: datetime) -> None:
+        seen = to_micros(seen_at)
+        for batch in _batches(orders):
+            conn.executemany(
+                """
+                INSERT INTO orders (id, closedate, total_order_value, subscription_id, last_seen)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    closedate = excluded.closedate,
+                    total_order_value = excluded.total_order_value,
+                    subscription_id = excluded.subscription_id,
+                    last_seen = excluded.last_seen
+                """,
+                [
+                    (order.id, to_micros(order.closedate), order.total_order_value__c,
+                     order.parent_subscription_id__c, seen)
+                    for order in batch
+                ]
+            )
+
+    def sync(self, subscriptions: List[Subscription], orders: Mapping[int, List[Order]], fetched_at: datetime) -> None:
+        """
+        Make the warehouse match a full upstream fetch held in memory (see WarehouseSync).
+        """
+        sync = self.begin_sync(fetched_at)
+        try:
+            sync.add(subscriptions, [order for sub_orders in orders.values() for order in sub_orders])
+            sync.commit()
+        except BaseException:
+            sync.rollback()
+            raise
+
+    def begin_sync(self, fetched_at: datetime) -> "WarehouseSync":
+        """
+        Start a sync of a full upstream fetch that arrives in batches.
+        """
+        return WarehouseSync(self, fetched_at)
+
+    def _prune(self, conn: sqlite3.Connection, fetched_at: datetime) -> None:
+        """
+        Drop rows the sync fetched at `fetched_at` did not see, and record the sync time.
+        """
+        seen = to_micros(fetched_at)
+        conn.execute(
+            "DELETE FROM billing_schedule WHERE subscription_id IN "
+            "(SELECT id FROM subscriptions WHERE last_seen < ?)",
+            (seen,)
+        )
+        conn.execute("DELETE FROM subscriptions WHERE last_seen < ?", (seen,))
+        conn.execute("DELETE FROM orders WHERE last_seen < ?", (seen,))
+        self._set_meta(conn, "synced_at", fetched_at.isoformat())
+
+    def synced_at(self) -> Optional[datetime]:
+        """
+        When the last full sync was fetched from upstream, if ever.
+        """
+        with self._connect() as conn:
+            stored = self._get_meta(conn, "synced_at")
+        return datetime.fromisoformat(stored) if stored else None
+
+    def _load_subscriptions(self, conn: sqlite3.Connection) -> List[Subscription]:
+        return [
+            Subscription(
+                id=row[0], billing_interval__c=row[1], end_date__c=from_micros(row[2]),
+                next_payment_date__c=from_micros(row[3]), recurring_amount__c=row[4],
+                start_date__c=from_micros(row[5]), status__c=row[6]
+            )
+            for row in conn.execute(
+                "SELECT id, billing_interval, end_date, next_payment_date, recurring_amount, start_date, status "
+                "FROM subscriptions ORDER BY id"
+            )
+        ]
+
+    def load_subscriptions(self) -> List[Subscription]:
+        with self._connect() as conn:
+            return self._load_subscriptions(conn)
+
+    def load_orders(self) -> Dict[int, List[Order]]:
+        all_orders: Dict[int, List[Order]] = {}
+        with self._connect() as conn:
+            for row in conn.execute(
+                "SELECT id, closedate, total_order_value, subscription_id FROM orders "
+                "ORDER BY subscription_id, closedate"
+            ):
+                all_orders.setdefault(row[3], []).append(Order(
+                    id=row[0], closedate=from_micros(row[1]),
+                    total_order_value__c=row[2], parent_subscription_id__c=row[3]
+                ))
+        return all_orders
+
+    def subscription_stats(self, as_of: datetime) -> SubscriptionStats:
+        """
+        Same figures as calculate_subscription_stats, computed in SQL.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                SELECT COUNT(*),
+                       COALESCE(SUM(status = 'active'), 0),
+                       COALESCE(SUM(status = 'on-hold'), 0),
+                       COALESCE(SUM(status = 'canceled'), 0),
+                       AVG(CASE WHEN start_date IS NOT NULL AND (end_date IS NOT NULL OR status = 'canceled')
+                           -- floor division, like timedelta.days
+                           THEN (COALESCE(end_date, :as_of) - start_date
+                                 - (((COALESCE(end_date, :as_of) - start_date) % :day) + :day) % :day) / :day
+                           END)
+                FROM subscriptions
+                """,
+                {"as_of": to_micros(as_of), "day": MICROS_PER_DAY}
+            ).fetchone()
+
+        return SubscriptionStats(
+            total_subscriptions=row[0],
+            active_subscriptions=row[1],
+            on_hold_subscriptions=row[2],
+            cancelled_subscriptions=row[3],
+            average_subscription_length_days=row[4] or 0
+        )
+
+    def missed_payments(self, as_of: datetime, grace_days: int = GRACE_DAYS) -> MissedPaymentStats:
+        """
+        Same figures as calculate_missed_payments, computed in SQL over the
+        materialized billing schedule.
+        """
+        with self._connect() as conn:
+            schedule_until = self._get_meta(conn, "schedule_until")
+            if schedule_until is None or as_of > datetime.fromisoformat(schedule_until):
+                raise ValueError("as_of is beyond the materialized billing schedule")
+
+            row = conn.execute(
+                """
+                SELECT COUNT(*), COALESCE(SUM(s.recurring_amount), 0.0)
+                FROM billing_schedule b
+                JOIN subscriptions s ON s.id = b.subscription_id
+                WHERE s.status IN ('active', 'on-hold')
+                  AND s.recurring_amount IS NOT NULL AND s.recurring_amount != 0
+                  AND b.expected_date <= :as_of
+                  AND NOT EXISTS (
+                      SELECT 1 FROM orders o
+                      WHERE o.subscription_id = b.subscription_id
+                        AND o.closedate >= b.expected_date - :before
+                        AND o.closedate < b.expected_date + :after
+                        AND o.closedate <= :as_of
+                  )
+                """,
+                {
+                    "as_of": to_micros(as_of),
+                    "before": grace_days * MICROS_PER_DAY,
+                    # timedelta.days floors, so the window extends to (but excludes) grace_days + 1 days later
+                    "after": (grace_days + 1) * MICROS_PER_DAY,
+                }
+            ).fetchone()
+
+        return MissedPaymentStats(missed_payments_count=row[0], missed_payments_value=row[1])
+
+class WarehouseSync:
+    """
+    A sync making the warehouse match a full upstream fetch, fed one batch of
+    subscriptions and their orders at a time (e.g. a page from upstream), so
+    only the current batch needs to be in memory.
+
+    Batches are upserted as they are added and `commit` drops the rows the
+    sync did not see, all in one transaction: readers in other processes see
+    either the previous sync or this one, never a mix. A sync that saw no
+    subscriptions (usually a failed upstream) commits nothing.
+
+    The connection may be used from any thread, one call at a time, so each
+    call can run through asyncio.to_thread.
+    """
+
+    def __init__(self, warehouse: SQLiteWarehouse, fetched_at: datetime):
+        self.warehouse = warehouse
+        self.fetched_at = fetched_at
+        self.subscriptions = 0
+        self._conn: Optional[sqlite3.Connection] = warehouse._open(check_same_thread=False)
+
+    def add(self, subscriptions: List[Subscription], orders: List[Order]) -> None:
+        self.warehouse._upsert_subscriptions(self._conn, subscriptions, self.fetched_at)
+        self.warehouse._upsert_orders(self._conn, orders, self.fetched_at)
+        self.subscriptions += len(subscriptions)
+
+    def commit(self) -> bool:
+        """
+        Prune and commit; returns whether anything was synced.
+        """
+        if not self.subscriptions:
+            self.rollback()
+            return False
+        self.warehouse._prune(self._conn, self.fetched_at)
+        self._conn.commit()
+        self._close()
+        return True
+
+    def rollback(self) -> None:
+        """
+        Discard everything added; safe to call after commit or a failed call.
+        """
+        if self._conn is not None:
+            try:
+                self._conn.rollback()
+            finally:
+                self._close()
+
+    def _close(self) -> None:
+        self._conn.close()
+        self._conn = None
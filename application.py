@@ -1,4 +1,69 @@
+import argparse
+import importlib.util
+import logging
+import os
+from typing import Any, Dict, List, Optional
 import uvicorn
 
+logger = logging.getLogger(__name__)
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the Audicus Subscription Analytics API")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")),
+                        help="Worker processes (default: WEB_CONCURRENCY or 1); more than one requires SNAPSHOT_FILE")
+    parser.add_argument("--backlog", type=int, default=2048, help="Pending connections the socket queues")
+    parser.add_argument("--keep-alive", type=int, default=5, help="Seconds an idle keep-alive connection stays open")
+    parser.add_argument("--limit-concurrency", type=int, default=None,
+                        help="Connections per worker before new ones get 503")
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="Seconds to let in-flight requests finish on shutdown")
+    parser.add_argument("--preload", action="store_true", default=os.getenv("PRELOAD_SNAPSHOT", "").lower() in ("1", "true", "yes"),
+                        help="Load the data snapshot before accepting traffic")
+    parser.add_argument("--reload", action="store_true", help="Development mode: one worker, restart on code changes")
+    args = parser.parse_args(argv)
+    # Without a snapshot file to follow, every worker would run its own full upstream sync
+    if args.workers > 1 and not args.reload and not os.getenv("SNAPSHOT_FILE"):
+        parser.error("--workers above 1 requires SNAPSHOT_FILE, so that a single worker syncs from upstream")
+    return args
+
+def build_server_options(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Keyword arguments for uvicorn.run.
+    """
+    if args.reload:
+        return {"host": args.host, "port": args.port, "reload": True}
+
+    return {
+        "host": args.host,
+        "port": args.port,
+        "workers": args.workers,
+        # Fall back to the pure-Python loop and parser when the fast ones are not installed
+        "loop": "uvloop" if _available("uvloop") else "asyncio",
+        "http": "httptools" if _available("httptools") else "h11",
+        "backlog": args.backlog,
+        "timeout_keep_alive": args.keep_alive,
+        "limit_concurrency": args.limit_concurrency,
+        "timeout_graceful_shutdown": args.graceful_timeout,
+        "proxy_headers": True,
+    }
+
+def main(argv: Optional[List[str]] = None) -> None:
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    options = build_server_options(args)
+
+    if args.preload:
+        # Read by app.main in every worker process
+        os.environ["PRELOAD_SNAPSHOT"] = "1"
+    if not args.reload:
+        logger.info(f"Starting {args.workers} workers with the {options['loop']} loop and {options['http']} parser")
+
+    uvicorn.run("app.main:app", **options)
+
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    main()
@@ -0,0 +1,182 @@
+"""
+Scale benchmarks for the analytics engine over synthetic books.
+
+    python -m benchmarks.analytics --sizes 1000 10000 100000 --output results.json
+    python -m benchmarks.analytics --sizes 10000 --baseline results.json
+
+Each function is timed on every book size (best of --repeat runs) and then
+run once more under tracemalloc for its peak allocation. Results are written
+as JSON; with --baseline, functions that got slower than --max-slowdown times
+their baseline are reported and the exit status is 1.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.analytics import (
+    calculate_subscription_stats, parse_billing_interval, calculate_missed_payments,
+    calculate_missed_payments_by_subscription, calculate_missed_payments_by_grace, calculate_distributions,
+    calculate_missed_payment_trend
+)
+from app.cohorts import calculate_cohort_retention
+from app.forecast import RevenueIndex
+from app.indexes import SubscriptionIndex
+from app.synthetic import SyntheticBook
+
+# Bumped when the output layout changes
+RESULTS_FORMAT = 1
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+# Each benchmark gets (subscriptions, orders, as_of) and says which records its cost is per
+BENCHMARKS: Dict[str, Tuple[Callable, str]] = {
+    "calculate_subscription_stats": (lambda subs, orders, as_of: calculate_subscription_stats(subs, as_of), "subscriptions"),
+    "parse_billing_interval": (
+        lambda subs, orders, as_of: [parse_billing_interval(sub.billing_interval__c) for sub in subs], "subscriptions"
+    ),
+    "calculate_missed_payments": (lambda subs, orders, as_of: calculate_missed_payments(subs, orders, as_of), "orders"),
+    "calculate_missed_payments_by_subscription": (
+        lambda subs, orders, as_of: calculate_missed_payments_by_subscription(subs, orders, as_of), "orders"
+    ),
+    "calculate_missed_payments_by_grace": (
+        lambda subs, orders, as_of: calculate_missed_payments_by_grace(subs, orders, [3, 7, 14, 30], as_of), "orders"
+    ),
+    "calculate_missed_payment_trend": (
+        lambda subs, orders, as_of: calculate_missed_payment_trend(
+            subs, orders, [as_of - timedelta(days=30 * months) for months in range(12, -1, -1)]
+        ),
+        "orders"
+    ),
+    "calculate_distributions": (lambda subs, orders, as_of: calculate_distributions(subs, orders, as_of), "orders"),
+    "calculate_cohort_retention": (
+        lambda subs, orders, as_of: calculate_cohort_retention(subs, orders, now=as_of), "orders"
+    ),
+    "SubscriptionIndex": (lambda subs, orders, as_of: SubscriptionIndex(subs), "subscriptions"),
+    "RevenueIndex.update": (lambda subs, orders, as_of: RevenueIndex().update(subs, as_of.date()), "subscriptions"),
+}
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def measure(fn: Callable, args: tuple, repeat: int) -> Tuple[float, int]:
+    """
+    Best wall time of `repeat` runs, and the peak traced allocation of one more.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+def run_suite(sizes: List[int], seed: int = 0, repeat: int = 3, functions: Optional[List[str]] = None,
+              mean_tenure_days: float = 400) -> Dict[str, Any]:
+    names = functions or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {', '.join(unknown)}")
+
+    results = []
+    for size in sizes:
+        book = SyntheticBook(size, seed=seed, mean_tenure_days=mean_tenure_days)
+        subscriptions, orders = book.dataset()
+        counts = {"subscriptions": len(subscriptions), "orders": sum(len(sub_orders) for sub_orders in orders.values())}
+
+        for name in names:
+            fn, unit = BENCHMARKS[name]
+            seconds, peak = measure(fn, (subscriptions, orders, book.as_of), repeat)
+            records = max(counts[unit], 1)
+            results.append({
+                "function": name,
+                "subscriptions": counts["subscriptions"],
+                "orders": counts["orders"],
+                "record_unit": unit,
+                "seconds": seconds,
+                "records_per_second": records / seconds if seconds else None,
+                "us_per_record": seconds / records * 1e6,
+                "peak_memory_bytes": peak,
+            })
+            print(f"{name:45} {size:>9} subs {seconds * 1000:10.1f} ms {seconds / records * 1e6:8.2f} us/{unit[:-1]} "
+                  f"{peak / 2 ** 20:8.1f} MiB", file=sys.stderr)
+
+    return {
+        "format": RESULTS_FORMAT,
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+            "mean_tenure_days": mean_tenure_days,
+        },
+        "results": results,
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_slowdown: float) -> List[Dict[str, Any]]:
+    """
+    Results that got slower than `max_slowdown` times the same function and size in the baseline.
+    """
+    previous = {(result["function"], result["subscriptions"]): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = previous.get((result["function"], result["subscriptions"]))
+        if before and before["seconds"] and result["seconds"] / before["seconds"] > max_slowdown:
+            regressions.append({
+                "function": result["function"],
+                "subscriptions": result["subscriptions"],
+                "baseline_seconds": before["seconds"],
+                "seconds": result["seconds"],
+                "slowdown": result["seconds"] / before["seconds"],
+            })
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the analytics engine on synthetic books")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Subscriptions per book")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per function and size (best is kept)")
+    parser.add_argument("--mean-tenure-days", type=float, default=400,
+                        help="Average subscription age; raise it for more orders per subscription")
+    parser.add_argument("--functions", nargs="+", choices=list(BENCHMARKS), help="Only run these benchmarks")
+    parser.add_argument("--output", help="Write results here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier results to check for regressions")
+    parser.add_argument("--max-slowdown", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.sizes, args.seed, args.repeat, args.functions, args.mean_tenure_days)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["regressions"] = compare(results, json.load(f), args.max_slowdown)
+        for regression in results["regressions"]:
+            print(f"REGRESSION {regression['function']} at {regression['subscriptions']} subscriptions: "
+                  f"{regression['slowdown']:.2f}x slower", file=sys.stderr)
+        exit_code = 1 if results["regressions"] else 0
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
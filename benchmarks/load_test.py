@@ -0,0 +1,240 @@
+"""
+End-to-end load test of /analytics against the mock upstream.
+
+    python -m benchmarks.load_test --size 20000 --requests 200 --concurrency 20 --output load.json
+    python -m benchmarks.load_test --upstream http://localhost:9000 --scenarios warm --rate 50
+
+Starts the mock upstream in a subprocess (unless --upstream points at a
+running one) and drives the app in this process through its ASGI interface,
+so event-loop lag and peak RSS are the app's (plus the small load generator).
+
+Scenarios:
+- cold: every request starts without a snapshot, so each pays the full sync
+  (or the reload from CACHE_URL / WAREHOUSE_PATH when those are set)
+- warm: the snapshot is loaded once, then requests are served from it
+- burst: the snapshot is dropped and all requests arrive together, so they
+  share a single sync
+
+Each reports latency percentiles, throughput, upstream requests per
+/analytics call, event-loop lag percentiles and peak RSS, as JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+from app.memory import peak_rss_bytes
+from benchmarks.analytics import _git_commit
+
+# Bumped when the output layout changes
+RESULTS_FORMAT = 1
+
+SCENARIOS = ("cold", "warm", "burst")
+
+# How often the lag probe wakes up
+LAG_PROBE_INTERVAL = 0.01
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """
+    Nearest-rank percentile, q in [0, 100].
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+class LagProbe:
+    """
+    Measures how late a periodic timer fires, i.e. how long the loop was blocked.
+    """
+
+    def __init__(self, interval: float = LAG_PROBE_INTERVAL):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - expected))
+
+    def __enter__(self) -> "LagProbe":
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._task.cancel()
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_mock_upstream(mock_args: List[str]) -> Tuple[subprocess.Popen, str]:
+    """
+    Run the mock upstream in a subprocess and wait until it answers.
+    """
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, "-m", "benchmarks.mock_upstream", "--port", str(port), *mock_args])
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{url}/_stats", timeout=1.0)
+            return process, url
+        except httpx.HTTPError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("The mock upstream did not start")
+
+async def _upstream_stats(upstream: httpx.AsyncClient, reset: bool = False) -> Dict[str, int]:
+    if reset:
+        await upstream.post("/_stats/reset")
+        return {}
+    return (await upstream.get("/_stats")).json()
+
+async def run_scenario(name: str, app_client: httpx.AsyncClient, upstream: httpx.AsyncClient, requests: int,
+                       concurrency: int, rate: Optional[float], path: str) -> Dict[str, Any]:
+    from app.snapshot import snapshot_store
+
+    if name == "warm":
+        # Load the snapshot before the clock starts
+        snapshot_store.invalidate()
+        await app_client.get(path)
+    else:
+        snapshot_store.invalidate()
+    await _upstream_stats(upstream, reset=True)
+
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    semaphore = asyncio.Semaphore(requests if name == "burst" else concurrency)
+
+    async def call(index: int) -> None:
+        if rate and name != "burst":
+            # Open loop: request i starts at i / rate seconds, whatever the latency
+            await asyncio.sleep(max(0.0, started + index / rate - time.perf_counter()))
+        async with semaphore:
+            if name == "cold":
+                snapshot_store.invalidate()
+            request_started = time.perf_counter()
+            try:
+                response = await app_client.get(path)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            latencies.append(time.perf_counter() - request_started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    with LagProbe() as probe:
+        started = time.perf_counter()
+        await asyncio.gather(*[call(i) for i in range(requests)])
+        elapsed = time.perf_counter() - started
+
+    upstream_requests = await _upstream_stats(upstream)
+    total_upstream = sum(upstream_requests.get(endpoint, 0) for endpoint in ("subscriptions", "orders", "order"))
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": requests if name == "burst" else concurrency,
+        "rate": rate if name != "burst" else None,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "errors": sum(count for status, count in statuses.items() if status != 200),
+        "duration_seconds": round(elapsed, 4),
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 50)),
+            "p95": ms(percentile(latencies, 95)),
+            "p99": ms(percentile(latencies, 99)),
+            "max": ms(max(latencies) if latencies else None),
+        },
+        "upstream_requests": upstream_requests,
+        "upstream_requests_per_call": round(total_upstream / requests, 3),
+        "loop_lag_ms": {
+            "p50": ms(percentile(probe.samples, 50)),
+            "p99": ms(percentile(probe.samples, 99)),
+            "max": ms(max(probe.samples) if probe.samples else None),
+        },
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+async def run_load_test(upstream_url: str, scenarios: List[str], requests: int, concurrency: int,
+                        rate: Optional[float], path: str = "/analytics") -> Dict[str, Any]:
+    # The app reads the upstream URL when it creates clients
+    os.environ["AUDICUS_BASE_URL"] = upstream_url
+    from app.main import app
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as app_client, \
+            httpx.AsyncClient(base_url=upstream_url) as upstream:
+        for name in scenarios:
+            # Cold requests each pay a full sync, so keep them to a sequential handful
+            count = min(requests, max(1, requests // 20)) if name == "cold" else requests
+            results.append(await run_scenario(name, app_client, upstream, count,
+                                              1 if name == "cold" else concurrency, rate, path))
+            print(f"{name:6} {results[-1]['throughput_rps']:>9} req/s  p50 {results[-1]['latency_ms']['p50']} ms  "
+                  f"p99 {results[-1]['latency_ms']['p99']} ms  upstream/call {results[-1]['upstream_requests_per_call']}",
+                  file=sys.stderr)
+
+    return {
+        "format": RESULTS_FORMAT,
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "path": path,
+        },
+        "results": results,
+    }
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Load test /analytics against the mock upstream")
+    parser.add_argument("--upstream", help="URL of a running mock upstream (default: start one)")
+    parser.add_argument("--size", type=int, default=10_000, help="Subscriptions in the started mock's book")
+    parser.add_argument("--mock-arg", action="append", default=[],
+                        help="Extra argument for the started mock, e.g. --mock-arg=--error-rate=0.01 (repeatable)")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario (cold runs 1 in 20)")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=None, help="Requests per second (default: as fast as possible)")
+    parser.add_argument("--path", default="/analytics", help="Path and query to request")
+    parser.add_argument("--output", help="Write results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    process = None
+    upstream_url = args.upstream
+    if upstream_url is None:
+        process, upstream_url = start_mock_upstream(["--size", str(args.size), *args.mock_arg])
+    try:
+        results = asyncio.run(run_load_test(upstream_url, args.scenarios, args.requests, args.concurrency,
+                                            args.rate, args.path))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Memory growth with the size of the book.
+
+    python -m benchmarks.memory --sizes 1000 10000 100000 --output memory.json
+
+For every size, a mock upstream serves a synthetic book and a fresh process
+runs one full /analytics against it, then reports /debug/memory: bytes per
+subscription and per order in each representation, what the caches retain,
+and RSS before and after. Fresh processes keep each size's peak RSS its own.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import httpx
+from benchmarks.analytics import _git_commit
+from benchmarks.load_test import start_mock_upstream
+
+# Bumped when the output layout changes
+RESULTS_FORMAT = 1
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+# Token the measuring process is started with, to call /debug/memory
+CHILD_TOKEN = "memory-benchmark"
+
+async def measure_analytics_run(upstream_url: str, sample: int) -> Dict[str, Any]:
+    """
+    In this process: one /analytics against the upstream, then the memory report.
+    """
+    os.environ["AUDICUS_BASE_URL"] = upstream_url
+    from app.main import app
+    from app.memory import current_rss_bytes, peak_rss_bytes
+
+    baseline_rss = current_rss_bytes()
+    baseline_peak = peak_rss_bytes()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as client:
+        response = await client.get("/analytics")
+        response.raise_for_status()
+        report = await client.get("/debug/memory", params={"sample": sample}, headers={"X-Profile-Token": CHILD_TOKEN})
+        report.raise_for_status()
+
+    return {"baseline_rss_bytes": baseline_rss, "baseline_peak_rss_bytes": baseline_peak, **report.json()}
+
+def run_size(size: int, sample: int, mock_args: List[str]) -> Dict[str, Any]:
+    process, url = start_mock_upstream(["--size", str(size), *mock_args])
+    try:
+        child = subprocess.run(
+            [sys.executable, "-m", "benchmarks.memory", "--child", url, "--sample", str(sample)],
+            capture_output=True, text=True, check=True,
+            env={**os.environ, "PROFILE_TOKEN": CHILD_TOKEN, "LOOP_LAG_INTERVAL_SECONDS": "0"}
+        )
+    finally:
+        process.terminate()
+        process.wait()
+    return {"size": size, **json.loads(child.stdout)}
+
+def run_suite(sizes: List[int], sample: int, mock_args: Optional[List[str]] = None) -> Dict[str, Any]:
+    results = []
+    for size in sizes:
+        result = run_size(size, sample, mock_args or [])
+        results.append(result)
+        print(f"{size:>9} subs  {result['subscriptions']['pydantic']['bytes_per_record']:8.1f} B/sub  "
+              f"{result['orders']['pydantic']['bytes_per_record']:8.1f} B/order  "
+              f"peak RSS {result['peak_rss_bytes'] / 2 ** 20:8.1f} MiB", file=sys.stderr)
+
+    return {
+        "format": RESULTS_FORMAT,
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sample": sample,
+        },
+        "results": results,
+    }
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure memory per record and peak RSS of /analytics by book size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Subscriptions per book")
+    parser.add_argument("--sample", type=int, default=1000, help="Records measured per representation")
+    parser.add_argument("--mock-arg", action="append", default=[], help="Extra argument for the mock upstream (repeatable)")
+    parser.add_argument("--output", help="Write results here instead of stdout")
+    parser.add_argument("--child", metavar="UPSTREAM_URL", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(asyncio.run(measure_analytics_run(args.child, args.sample))))
+        return
+
+    output = json.dumps(run_suite(args.sizes, args.sample, args.mock_arg), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Local stand-in for the Audicus upstream API, serving a synthetic book.
+
+    python -m benchmarks.mock_upstream --size 1000000 --port 9000 \\
+        --latency subscriptions=80 --latency orders=30 --error-rate 0.01 --rate-limit 500
+    AUDICUS_BASE_URL=http://localhost:9000 python application.py
+
+Implements /subscriptions/{page}, /orders/{subscription_id}/{page} and
+/order/{order_id} like upstream. Records are generated on demand from the
+seeded book, so millions of them cost no memory up front. Latency (lognormal
+around a per-endpoint median), slow tails, random 5xx, a global rate limit
+answered with 429 and page-size caps are all configurable. Request counts
+per endpoint are served at /_stats (reset with POST /_stats/reset).
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from app.models import Order
+from app.synthetic import SyntheticBook
+
+ENDPOINTS = ("subscriptions", "orders", "order")
+
+@dataclass
+class MockUpstreamConfig:
+    size: int = 10_000
+    seed: int = 0
+    # Median latency per endpoint in milliseconds, and the lognormal spread around it
+    latency_ms: Dict[str, float] = field(default_factory=dict)
+    latency_sigma: float = 0.5
+    # Share of requests that get an extra slow_tail_ms of latency
+    slow_tail_rate: float = 0.0
+    slow_tail_ms: float = 2000.0
+    # Share of requests answered with a random 500, 502 or 503
+    error_rate: float = 0.0
+    # Requests per second across all endpoints before answering 429 (None: unlimited)
+    rate_limit: Optional[float] = None
+    # Largest subscriptions page served whatever per_page asks for, and the orders page size
+    max_page_size: int = 100
+    orders_page_size: int = 50
+
+class TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+def _to_json(record) -> dict:
+    return {
+        key: value.isoformat().replace("+00:00", "Z") if isinstance(value, datetime) else value
+        for key, value in record.__dict__.items()
+    }
+
+def create_app(config: MockUpstreamConfig) -> FastAPI:
+    app = FastAPI(title="Mock Audicus upstream")
+    book = SyntheticBook(config.size, seed=config.seed)
+    rng = random.Random(config.seed)
+    bucket = TokenBucket(config.rate_limit) if config.rate_limit else None
+    stats: Counter = Counter()
+
+    @lru_cache(maxsize=10_000)
+    def orders_of(sub_id: int) -> List[Order]:
+        return book.orders(sub_id)
+
+    async def misbehave(endpoint: str) -> Optional[JSONResponse]:
+        """
+        Apply latency and faults; returns the error response to send, if any.
+        """
+        stats[endpoint] += 1
+        if bucket is not None and not bucket.take():
+            stats["rate_limited"] += 1
+            return JSONResponse({"error": "rate limited"}, status_code=429,
+                                headers={"Retry-After": str(max(1, math.ceil(1 / config.rate_limit)))})
+
+        delay_ms = 0.0
+        median = config.latency_ms.get(endpoint, 0.0)
+        if median > 0:
+            delay_ms += rng.lognormvariate(math.log(median), config.latency_sigma)
+        if rng.random() < config.slow_tail_rate:
+            delay_ms += config.slow_tail_ms
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000)
+
+        if rng.random() < config.error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error": "upstream failure"}, status_code=rng.choice([500, 502, 503]))
+        return None
+
+    @app.get("/subscriptions/{page}")
+    async def subscriptions(page: int, per_page: int = 100):
+        error = await misbehave("subscriptions")
+        if error is not None:
+            return error
+        per_page = max(1, min(per_page, config.max_page_size))
+        first = (page - 1) * per_page + 1
+        ids = range(max(first, 1), min(first + per_page, config.size + 1))
+        return {"subscriptions": [_to_json(book.subscription(sub_id)) for sub_id in ids]}
+
+    @app.get("/orders/{subscription_id}/{page}")
+    async def orders(subscription_id: int, page: int):
+        error = await misbehave("orders")
+        if error is not None:
+            return error
+        if not 1 <= subscription_id <= config.size:
+            return {"orders": []}
+        start = (page - 1) * config.orders_page_size
+        page_orders = orders_of(subscription_id)[max(start, 0):start + config.orders_page_size] if page >= 1 else []
+        return {"orders": [_to_json(order) for order in page_orders]}
+
+    @app.get("/order/{order_id}")
+    async def order(order_id: int):
+        error = await misbehave("order")
+        if error is not None:
+            return error
+        found = book.order(order_id)
+        if found is None:
+            return JSONResponse({"error": "not found"}, status_code=404)
+        return {"order": _to_json(found)}
+
+    @app.get("/_stats")
+    async def get_stats():
+        return dict(stats)
+
+    @app.post("/_stats/reset")
+    async def reset_stats():
+        stats.clear()
+        return {}
+
+    return app
+
+def _latency_arg(value: str) -> Tuple[str, float]:
+    endpoint, _, milliseconds = value.partition("=")
+    try:
+        if endpoint in ENDPOINTS:
+            return endpoint, float(milliseconds)
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"expected ENDPOINT=MS with ENDPOINT in {', '.join(ENDPOINTS)}, got {value}")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve a synthetic book through the Audicus API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--size", type=int, default=10_000, help="Subscriptions in the book")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=_latency_arg, action="append", default=[], metavar="ENDPOINT=MS",
+                        help="Median latency for subscriptions, orders or order (repeatable)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--slow-tail-rate", type=float, default=0.0)
+    parser.add_argument("--slow-tail-ms", type=float, default=2000.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None, help="Requests per second before 429s")
+    parser.add_argument("--max-page-size", type=int, default=100)
+    parser.add_argument("--orders-page-size", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    config = MockUpstreamConfig(
+        size=args.size,
+        seed=args.seed,
+        latency_ms=dict(args.latency),
+        latency_sigma=args.latency_sigma,
+        slow_tail_rate=args.slow_tail_rate,
+        slow_tail_ms=args.slow_tail_ms,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        max_page_size=args.max_page_size,
+        orders_page_size=args.orders_page_size,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,16 @@ import respx
 from datetime import datetime, timezone
 from typing import List, Dict
 from app.models import Subscription, Order
+from app.snapshot import snapshot_store
+
+@pytest.fixture(autouse=True)
+def reset_snapshot_store():
+    """
+    Make sure every test starts without a cached snapshot.
+    """
+    snapshot_store.invalidate()
+    yield
+    snapshot_store.invalidate()
 
 @pytest.fixture
 def mock_subscriptions() -> List[Subscription]:
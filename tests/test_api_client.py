@@ -0,0 +1,61 @@
+import pytest
+import pytest_asyncio
+import respx
+from app.api_client import AudicusAPIClient
+
+BASE_URL = "https://jungle.audicus.com/v1/coding_test"
+
+def order_json(order_id: int, sub_id: int = 1):
+    return {
+        "id": order_id,
+        "closedate": "2024-01-01T00:00:00Z",
+        "total_order_value__c": 29.99,
+        "parent_subscription_id__c": sub_id
+    }
+
+@pytest_asyncio.fixture
+async def api_client():
+    """Fixture for the API client."""
+    client = AudicusAPIClient()
+    yield client
+    await client.close()
+
+class TestBatchOrders:
+
+    @pytest.mark.asyncio
+    async def test_get_orders_serves_index_hits(self, api_client):
+        """Test that get_orders only fetches orders missing from the index."""
+        with respx.mock(base_url=BASE_URL) as respx_mock:
+            respx_mock.get("/orders/1/1").respond(json={"orders": [order_json(101), order_json(102)]})
+            respx_mock.get("/orders/1/2").respond(json={"orders": []})
+            single = respx_mock.get("/order/777").respond(json={"order": order_json(777, 7)})
+            missing = respx_mock.get("/order/888").respond(status_code=404)
+
+            await api_client.get_subscription_orders(1)
+            orders = await api_client.get_orders([102, 777, 888, 101, 777])
+
+            assert [order.id if order else None for order in orders] == [102, 777, None, 101, 777]
+            # Duplicates and index hits are not fetched
+            assert single.call_count == 1
+            assert missing.call_count == 1
+
+            # The fetched order is now indexed too
+            await api_client.get_orders([777])
+            assert single.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_shared_order_index(self):
+        """Test that clients constructed with the same index share hits."""
+        shared = {}
+        with respx.mock(base_url=BASE_URL) as respx_mock:
+            route = respx_mock.get("/order/5").respond(json={"order": order_json(5)})
+
+            first = AudicusAPIClient(order_index=shared)
+            await first.get_order(5)
+            await first.close()
+
+            second = AudicusAPIClient(order_index=shared)
+            assert (await second.get_orders([5]))[0].id == 5
+            await second.close()
+
+            assert route.call_count == 1
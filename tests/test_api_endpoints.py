@@ -2,6 +2,8 @@ import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import AsyncMock, patch, MagicMock
 from app.main import app, get_api_client
+from app.snapshot import snapshot_store
+from app.warehouse import SQLiteWarehouse
 import asyncio
 
 client = TestClient(app)
@@ -120,6 +122,398 @@ class TestAPIEndpoints:
             # Clean up the override after the test
             app.dependency_overrides = {}
     
+    @pytest.mark.asyncio
+    async def test_analytics_endpoint_distributions(self, mock_subscriptions, mock_orders):
+        """Test that /analytics includes distributions only when requested."""
+        mock_api_client_instance = AsyncMock()
+        mock_api_client_instance.get_subscriptions.return_value = mock_subscriptions
+        
+        async def mock_get_orders_side_effect(sub_id: int):
+            return mock_orders.get(sub_id, [])
+        
+        mock_api_client_instance.get_subscription_orders.side_effect = mock_get_orders_side_effect
+        
+        async def override_get_api_client():
+            yield mock_api_client_instance
+        
+        app.dependency_overrides[get_api_client] = override_get_api_client
+        
+        try:
+            response = client.get("/analytics")
+            assert response.status_code == 200
+            assert response.json()["distributions"] is None
+            
+            response = client.get("/analytics?include_distributions=true")
+            assert response.status_code == 200
+            
+            distributions = response.json()["distributions"]
+            assert distributions["relative_accuracy"] == 0.01
+            assert distributions["order_value"]["count"] == 11
+            for key in ("p50", "p90", "p99"):
+                assert key in distributions["subscription_length_days"]
+        finally:
+            app.dependency_overrides = {}
+    
+    @pytest.mark.asyncio
+    async def test_analytics_endpoint_approx_mode(self, mock_subscriptions, mock_orders):
+        """Test that approx mode only fetches orders for sampled billable subscriptions."""
+        mock_api_client_instance = AsyncMock()
+        mock_api_client_instance.get_subscriptions.return_value = mock_subscriptions
+        
+        async def mock_get_orders_side_effect(sub_id: int):
+            return mock_orders.get(sub_id, [])
+        
+        mock_api_client_instance.get_subscription_orders.side_effect = mock_get_orders_side_effect
+        
+        async def override_get_api_client():
+            yield mock_api_client_instance
+        
+        app.dependency_overrides[get_api_client] = override_get_api_client
+        
+        try:
+            response = client.get("/analytics?mode=approx&sample=0.05&seed=1")
+            assert response.status_code == 200, response.text
+            
+            data = response.json()
+            estimate = data["missed_payment_estimate"]
+            assert estimate["billable_subscriptions"] == 3
+            assert estimate["sampled_subscriptions"] == 3
+            assert estimate["missed_payments_count_ci"]["lower"] <= estimate["missed_payments_count"]
+            assert data["missed_payment_stats"]["missed_payments_count"] == round(estimate["missed_payments_count"])
+            
+            # Canceled and prepaid subscriptions are never sampled
+            fetched = {call.args[0] for call in mock_api_client_instance.get_subscription_orders.call_args_list}
+            assert fetched == {1, 3, 4}
+            
+            # Every grace window is estimated; with every billable subscription sampled they are exact
+            windows = client.get("/analytics?mode=approx&seed=1&grace_days=30&grace_days=0").json()
+            exact = client.get("/analytics?grace_days=30&grace_days=0").json()
+            assert [w["grace_days"] for w in windows["missed_payment_stats_by_grace"]] == [30, 0]
+            for approx_window, exact_window in zip(windows["missed_payment_stats_by_grace"], exact["missed_payment_stats_by_grace"]):
+                assert approx_window["missed_payments_count"] == exact_window["missed_payments_count"]
+            assert windows["missed_payment_stats"]["missed_payments_count"] == \
+                windows["missed_payment_stats_by_grace"][0]["missed_payments_count"]
+            
+            response = client.get("/analytics?mode=approx&sample=0")
+            assert response.status_code == 422
+        finally:
+            app.dependency_overrides = {}
+    
+    @pytest.mark.asyncio
+    async def test_cohorts_endpoint_reuses_snapshot(self, mock_subscriptions, mock_orders):
+        """Test that /analytics/cohorts is served from the snapshot fetched by /analytics."""
+        mock_api_client_instance = AsyncMock()
+        mock_api_client_instance.get_subscriptions.return_value = mock_subscriptions
+        
+        async def mock_get_orders_side_effect(sub_id: int):
+            return mock_orders.get(sub_id, [])
+        
+        mock_api_client_instance.get_subscription_orders.side_effect = mock_get_orders_side_effect
+        
+        async def override_get_api_client():
+            yield mock_api_client_instance
+        
+        app.dependency_overrides[get_api_client] = override_get_api_client
+        
+        try:
+            assert client.get("/analytics").status_code == 200
+            
+            response = client.get("/analytics/cohorts?months=12")
+            assert response.status_code == 200, response.text
+            
+            data = response.json()
+            assert data["max_months"] == 12
+            assert sum(row["subscriptions"] for row in data["cohorts"]) == len(mock_subscriptions)
+            assert sum(row["paid_orders"] for row in data["cohorts"]) == 11
+            
+            # No second upstream pass
+            mock_api_client_instance.get_subscriptions.assert_called_once()
+            assert mock_api_client_instance.get_subscription_orders.call_count == len(mock_subscriptions)
+        finally:
+            app.dependency_overrides = {}
+    
+    @pytest.mark.asyncio
+    async def test_forecast_endpoint(self, mock_subscriptions, mock_orders):
+        """Test the /analytics/forecast endpoint buckets and validation."""
+        mock_api_client_instance = AsyncMock()
+        mock_api_client_instance.get_subscriptions.return_value = mock_subscriptions
+        
+        async def mock_get_orders_side_effect(sub_id: int):
+            return mock_orders.get(sub_id, [])
+        
+        mock_api_client_instance.get_subscription_orders.side_effect = mock_get_orders_side_effect
+        
+        async def override_get_api_client():
+            yield mock_api_client_instance
+        
+        app.dependency_overrides[get_api_client] = override_get_api_client
+        
+        try:
+            response = client.get("/analytics/forecast?days=60&bucket=month")
+            assert response.status_code == 200, response.text
+            
+            data = response.json()
+            assert data["days"] == 60
+            assert data["bucket"] == "month"
+            assert len(data["buckets"]) == 2
+            assert data["expected_payments"] == sum(b["expected_payments"] for b in data["buckets"])
+            
+            response = client.get("/analytics/forecast?days=1000")
+            assert response.status_code == 422
+        finally:
+            app.dependency_overrides = {}
+    
+    @pytest.mark.asyncio
+    async def test_trend_endpoint_matches_analytics_as_of(self, mock_subscriptions, mock_orders):
+        """Test that /analytics/trend points match /analytics with the same as_of."""
+        mock_api_client_instance = AsyncMock()
+        mock_api_client_instance.get_subscriptions.return_value = mock_subscriptions
+        
+        async def mock_get_orders_side_effect(sub_id: int):
+            return mock_orders.get(sub_id, [])
+        
+        mock_api_client_instance.get_subscription_orders.side_effect = mock_get_orders_side_effect
+        
+        async def override_get_api_client():
+            yield mock_api_client_instance
+        
+        app.dependency_overrides[get_api_client] = override_get_api_client
+        
+        try:
+            response = client.get("/analytics/trend?start=2024-01-01T00:00:00Z&end=2024-12-31T00:00:00Z&step=month")
+            assert response.status_code == 200, response.text
+            
+            points = response.json()["points"]
+            assert len(points) == 12
+            
+            for point in points[::4]:
+                analytics = client.get("/analytics", params={"as_of": point["as_of"]}).json()
+                assert analytics["missed_payment_stats"]["missed_payments_count"] == point["missed_payments_count"]
+            
+            response = client.get("/analytics/trend?as_of=2024-06-01T00:00:00Z&as_of=2024-03-01T00:00:00Z")
+            assert [p["as_of"][:10] for p in response.json()["points"]] == ["2024-06-01", "2024-03-01"]
+            
+            assert client.get("/analytics/trend").status_code == 400
+            inverted = client.get("/analytics/trend?start=2024-06-01T00:00:00Z&end=2024-01-01T00:00:00Z")
+            assert inverted.status_code == 400 and "is after end" in inverted.json()["detail"]
+            mock_api_client_instance.get_subscriptions.assert_called_once()
+        finally:
+            app.dependency_overrides = {}
+    
+    @pytest.mark.asyncio
+    async def test_filtered_subscriptions_and_analytics(self, mock_subscriptions, mock_orders):
+        """Test that filters restrict /subscriptions and /analytics to matching rows."""
+        mock_api_client_instance = AsyncMock()
+        mock_api_client_instance.get_subscriptions.return_value = mock_subscriptions
+        
+        async def mock_get_orders_side_effect(sub_id: int):
+            return mock_orders.get(sub_id, [])
+        
+        mock_api_client_instance.get_subscription_orders.side_effect = mock_get_orders_side_effect
+        
+        async def override_get_api_client():
+            yield mock_api_client_instance
+        
+        app.dependency_overrides[get_api_client] = override_get_api_client
+        
+        try:
+            response = client.get("/subscriptions?status=active&status=on-hold&limit=2")
+            assert response.status_code == 200, response.text
+            data = response.json()
+            assert data["total"] == 3
+            assert [sub["id"] for sub in data["subscriptions"]] == [1, 3]
+            
+            response = client.get("/analytics?status=on-hold&as_of=2024-05-31T00:00:00Z")
+            assert response.status_code == 200, response.text
+            data = response.json()
+            assert data["subscription_stats"]["total_subscriptions"] == 1
+            assert data["missed_payment_stats"]["missed_payments_count"] == 1
+            
+            response = client.get("/analytics?recurring_amount_min=1000")
+            assert response.json()["subscription_stats"]["total_subscriptions"] == 0
+            
+            mock_api_client_instance.get_subscriptions.assert_called_once()
+        finally:
+            app.dependency_overrides = {}
+    
+    @pytest.mark.asyncio
+    async def test_delinquent_endpoint_paging(self, mock_subscriptions, mock_orders):
+        """Test that /analytics/delinquent pages through cached per-subscription results."""
+        mock_api_client_instance = AsyncMock()
+        mock_api_client_instance.get_subscriptions.return_value = mock_subscriptions
+        
+        async def mock_get_orders_side_effect(sub_id: int):
+            return mock_orders.get(sub_id, [])
+        
+        mock_api_client_instance.get_subscription_orders.side_effect = mock_get_orders_side_effect
+        
+        async def override_get_api_client():
+            yield mock_api_client_instance
+        
+        app.dependency_overrides[get_api_client] = override_get_api_client
+        
+        try:
+            first = client.get("/analytics/delinquent?limit=1").json()
+            second = client.get("/analytics/delinquent?limit=1&offset=1").json()
+            
+            assert first["total_delinquent"] == 3
+            assert len(first["subscriptions"]) == 1
+            assert first["subscriptions"][0]["missed_payments_value"] >= second["subscriptions"][0]["missed_payments_value"]
+            assert first["subscriptions"][0]["subscription_id"] != second["subscriptions"][0]["subscription_id"]
+            
+            # Totals agree with /analytics on the same snapshot
+            analytics = client.get("/analytics").json()
+            everything = client.get("/analytics/delinquent?limit=10").json()["subscriptions"]
+            assert sum(item["missed_payments_count"] for item in everything) == \
+                analytics["missed_payment_stats"]["missed_payments_count"]
+            
+            mock_api_client_instance.get_subscriptions.assert_called_once()
+        finally:
+            app.dependency_overrides = {}
+    
+    @pytest.mark.asyncio
+    async def test_timeline_endpoint(self, mock_subscriptions, mock_orders):
+        """Test that /subscriptions/{id}/timeline is served from the snapshot."""
+        mock_api_client_instance = AsyncMock()
+        mock_api_client_instance.get_subscriptions.return_value = mock_subscriptions
+        
+        async def mock_get_orders_side_effect(sub_id: int):
+            return mock_orders.get(sub_id, [])
+        
+        mock_api_client_instance.get_subscription_orders.side_effect = mock_get_orders_side_effect
+        
+        async def override_get_api_client():
+            yield mock_api_client_instance
+        
+        app.dependency_overrides[get_api_client] = override_get_api_client
+        
+        try:
+            response = client.get("/subscriptions/3/timeline")
+            assert response.status_code == 200, response.text
+            
+            data = response.json()
+            assert data["billable"] is True
+            assert data["periods"][0]["order_id"] == 301
+            assert data["missed_payments_count"] == sum(1 for p in data["periods"] if p["status"] == "missed")
+            
+            assert client.get("/subscriptions/1/timeline").status_code == 200
+            assert client.get("/subscriptions/999/timeline").status_code == 404
+            
+            # Orders were only fetched once, while building the snapshot
+            assert mock_api_client_instance.get_subscription_orders.call_count == len(mock_subscriptions)
+        finally:
+            app.dependency_overrides = {}
+    
+    @pytest.mark.asyncio
+    async def test_orders_endpoint(self, mock_orders):
+        """Test the /orders batch lookup endpoint."""
+        mock_api_client_instance = AsyncMock()
+        
+        async def mock_get_orders_side_effect(order_ids, max_concurrency=10):
+            known = {order.id: order for orders in mock_orders.values() for order in orders}
+            return [known.get(order_id) for order_id in order_ids]
+        
+        mock_api_client_instance.get_orders.side_effect = mock_get_orders_side_effect
+        
+        async def override_get_api_client():
+            yield mock_api_client_instance
+        
+        app.dependency_overrides[get_api_client] = override_get_api_client
+        
+        try:
+            response = client.get("/orders?ids=301,999&ids=101")
+            assert response.status_code == 200, response.text
+            
+            data = response.json()
+            assert [order["id"] for order in data["orders"]] == [301, 101]
+            assert data["missing"] == [999]
+            
+            assert client.get("/orders?ids=abc").status_code == 400
+        finally:
+            app.dependency_overrides = {}
+    
+    @pytest.mark.asyncio
+    async def test_analytics_grace_windows(self, mock_subscriptions, mock_orders):
+        """Test that /analytics reports every requested grace window."""
+        mock_api_client_instance = AsyncMock()
+        mock_api_client_instance.get_subscriptions.return_value = mock_subscriptions
+        
+        async def mock_get_orders_side_effect(sub_id: int):
+            return mock_orders.get(sub_id, [])
+        
+        mock_api_client_instance.get_subscription_orders.side_effect = mock_get_orders_side_effect
+        
+        async def override_get_api_client():
+            yield mock_api_client_instance
+        
+        app.dependency_overrides[get_api_client] = override_get_api_client
+        
+        try:
+            response = client.get("/analytics?grace_days=3&grace_days=7&grace_days=30")
+            assert response.status_code == 200, response.text
+            
+            data = response.json()
+            windows = data["missed_payment_stats_by_grace"]
+            assert [window["grace_days"] for window in windows] == [3, 7, 30]
+            assert data["missed_payment_stats"]["missed_payments_count"] == windows[0]["missed_payments_count"]
+            
+            default = client.get("/analytics").json()
+            assert default["missed_payment_stats_by_grace"] is None
+            assert default["missed_payment_stats"]["missed_payments_count"] == windows[1]["missed_payments_count"]
+            
+            assert client.get("/analytics?grace_days=-1").status_code == 400
+        finally:
+            app.dependency_overrides = {}
+    
+    @pytest.mark.asyncio
+    async def test_analytics_sql_engine(self, mock_subscriptions, mock_orders, tmp_path):
+        """Test that engine=sql agrees with the Python engine and that a second worker reuses the warehouse."""
+        mock_api_client_instance = AsyncMock()
+        mock_api_client_instance.get_subscriptions.return_value = mock_subscriptions
+        
+        async def mock_get_orders_side_effect(sub_id: int):
+            return mock_orders.get(sub_id, [])
+        
+        mock_api_client_instance.get_subscription_orders.side_effect = mock_get_orders_side_effect
+        
+        async def override_get_api_client():
+            yield mock_api_client_instance
+        
+        app.dependency_overrides[get_api_client] = override_get_api_client
+        
+        try:
+            assert client.get("/analytics?engine=sql").status_code == 400
+            
+            snapshot_store.warehouse = SQLiteWarehouse(str(tmp_path / "warehouse.db"))
+            python_result = client.get("/analytics?grace_days=3&grace_days=7").json()
+            sql_result = client.get("/analytics?engine=sql&grace_days=3&grace_days=7").json()
+            assert sql_result["as_of"] == python_result["as_of"]
+            assert sql_result["subscription_stats"] == python_result["subscription_stats"]
+            for sql_window, python_window in zip(sql_result["missed_payment_stats_by_grace"],
+                                                 python_result["missed_payment_stats_by_grace"]):
+                assert sql_window["missed_payments_count"] == python_window["missed_payments_count"]
+                assert sql_window["missed_payments_value"] == pytest.approx(python_window["missed_payments_value"])
+            
+            assert client.get("/analytics?engine=sql&status=active").status_code == 400
+            
+            # A recently synced warehouse is queried without loading a snapshot
+            snapshot_store.invalidate()
+            mock_api_client_instance.get_subscriptions.reset_mock()
+            assert client.get("/analytics?engine=sql").json()["as_of"] == python_result["as_of"]
+            assert snapshot_store.snapshot is None
+            mock_api_client_instance.get_subscriptions.assert_not_called()
+            
+            # A fresh process finds the warehouse recently synced and skips upstream
+            snapshot_store.invalidate()
+            mock_api_client_instance.get_subscriptions.reset_mock()
+            reloaded = client.get("/analytics").json()
+            assert reloaded["as_of"] == python_result["as_of"]
+            assert reloaded["subscription_stats"] == python_result["subscription_stats"]
+            mock_api_client_instance.get_subscriptions.assert_not_called()
+        finally:
+            snapshot_store.warehouse = None
+            app.dependency_overrides = {}
+    
     def test_docs_endpoint(self):
         """Test that API documentation endpoints are available."""
         response = client.get("/docs")
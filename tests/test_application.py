@@ -0,0 +1,58 @@
+import pytest
+import application
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock
+from app import main
+from app.snapshot import snapshot_store
+
+def test_production_options(monkeypatch):
+    """Test that production mode uses the fast loop and parser when installed."""
+    monkeypatch.setattr(application, "_available", lambda module: True)
+    monkeypatch.setenv("SNAPSHOT_FILE", "/tmp/snapshot.bin")
+    options = application.build_server_options(application.parse_args(
+        ["--workers", "4", "--backlog", "4096", "--keep-alive", "10", "--limit-concurrency", "500"]
+    ))
+
+    assert options["workers"] == 4
+    assert options["loop"] == "uvloop"
+    assert options["http"] == "httptools"
+    assert options["backlog"] == 4096
+    assert options["timeout_keep_alive"] == 10
+    assert options["limit_concurrency"] == 500
+    assert "reload" not in options
+    assert options["timeout_graceful_shutdown"] == 30
+
+def test_workers_require_snapshot_file(monkeypatch):
+    """Test that one worker is the default and several need a shared snapshot file."""
+    monkeypatch.delenv("SNAPSHOT_FILE", raising=False)
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    assert application.parse_args([]).workers == 1
+    with pytest.raises(SystemExit):
+        application.parse_args(["--workers", "4"])
+
+def test_fallbacks_and_reload(monkeypatch):
+    """Test the pure-Python fallbacks and that reload stays opt-in."""
+    monkeypatch.setattr(application, "_available", lambda module: False)
+    options = application.build_server_options(application.parse_args([]))
+    assert (options["loop"], options["http"]) == ("asyncio", "h11")
+
+    options = application.build_server_options(application.parse_args(["--reload"]))
+    assert options["reload"] is True
+    assert "workers" not in options
+
+def test_snapshot_preloaded_before_traffic(monkeypatch, mock_subscriptions, mock_orders):
+    """Test that PRELOAD_SNAPSHOT fetches the snapshot during startup."""
+    api_client = AsyncMock()
+    api_client.get_subscriptions.return_value = mock_subscriptions
+
+    async def mock_get_orders_side_effect(sub_id: int):
+        return mock_orders.get(sub_id, [])
+
+    api_client.get_subscription_orders.side_effect = mock_get_orders_side_effect
+    monkeypatch.setattr(main, "PRELOAD_SNAPSHOT", True)
+    monkeypatch.setattr(main, "AudicusAPIClient", lambda **kwargs: api_client)
+
+    with TestClient(main.app):
+        assert snapshot_store.snapshot is not None
+        assert snapshot_store.snapshot.subscriptions == mock_subscriptions
+    api_client.close.assert_awaited()
@@ -0,0 +1,34 @@
+import json
+from benchmarks.analytics import run_suite, compare, main
+
+def test_suite_output_is_machine_readable():
+    """Test that every function gets a timing and memory result per size."""
+    results = run_suite([20, 40], repeat=1, functions=["calculate_subscription_stats", "calculate_missed_payments"])
+
+    assert json.loads(json.dumps(results)) == results
+    assert [(r["function"], r["subscriptions"]) for r in results["results"]] == [
+        ("calculate_subscription_stats", 20), ("calculate_missed_payments", 20),
+        ("calculate_subscription_stats", 40), ("calculate_missed_payments", 40),
+    ]
+    for result in results["results"]:
+        assert result["seconds"] > 0
+        assert result["us_per_record"] > 0
+        assert result["peak_memory_bytes"] >= 0
+
+def test_regressions_are_flagged(tmp_path):
+    """Test that functions slower than the baseline allows are reported."""
+    baseline = run_suite([20], repeat=1, functions=["calculate_subscription_stats"])
+    current = json.loads(json.dumps(baseline))
+    current["results"][0]["seconds"] = baseline["results"][0]["seconds"] * 2
+
+    assert compare(baseline, baseline, 1.25) == []
+    [regression] = compare(current, baseline, 1.25)
+    assert regression["slowdown"] == 2
+
+    baseline["results"][0]["seconds"] = 1e-12
+    path = tmp_path / "baseline.json"
+    path.write_text(json.dumps(baseline))
+    output = tmp_path / "results.json"
+    assert main(["--sizes", "20", "--repeat", "1", "--functions", "calculate_subscription_stats",
+                 "--baseline", str(path), "--output", str(output)]) == 1
+    assert json.loads(output.read_text())["regressions"]
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+import pytest
+import pytest_asyncio
+import respx
+from unittest.mock import AsyncMock
+from app.api_client import AudicusAPIClient
+from app.cache import (
+    CacheBackend, MemoryCacheBackend, OrderIndex, SQLiteCacheBackend, RedisCacheBackend, create_cache_backend, dump_models, load_models
+)
+from app.models import Subscription, Order
+from app.snapshot import SnapshotStore
+
+BASE_URL = "https://jungle.audicus.com/v1/coding_test"
+
+@pytest_asyncio.fixture(params=["memory", "sqlite", "redis"])
+async def backend(request, tmp_path):
+    if request.param == "memory":
+        backend = MemoryCacheBackend()
+    elif request.param == "sqlite":
+        backend = SQLiteCacheBackend(str(tmp_path / "cache.db"))
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        backend = RedisCacheBackend(client=fakeredis.aioredis.FakeRedis())
+    yield backend
+    await backend.close()
+
+class TestBackends:
+
+    @pytest.mark.asyncio
+    async def test_get_set_delete(self, backend):
+        """Test the basic operations every backend supports."""
+        assert await backend.get("key") is None
+
+        await backend.set("key", b"\x00value", 60)
+        assert await backend.get("key") == b"\x00value"
+
+        await backend.set("key", b"other", 60)
+        assert await backend.get("key") == b"other"
+
+        await backend.delete("key")
+        assert await backend.get("key") is None
+
+    @pytest.mark.asyncio
+    async def test_expiry(self, backend):
+        """Test that entries stop being served after their TTL."""
+        await backend.set("key", b"value", 0.05)
+        await asyncio.sleep(0.1)
+        assert await backend.get("key") is None
+
+    @pytest.mark.asyncio
+    async def test_memory_evicts_least_recently_used(self):
+        """Test that the in-memory backend stays within its size."""
+        backend = MemoryCacheBackend(max_entries=2)
+        await backend.set("a", b"1", 60)
+        await backend.set("b", b"2", 60)
+        await backend.get("a")
+        await backend.set("c", b"3", 60)
+
+        assert await backend.get("b") is None
+        assert await backend.get("a") == b"1"
+        assert backend.evictions == 1
+
+    def test_create_from_url(self, tmp_path):
+        """Test that cache URLs pick the right backend."""
+        assert isinstance(create_cache_backend("memory://"), MemoryCacheBackend)
+        assert isinstance(create_cache_backend(f"sqlite:///{tmp_path}/cache.db"), SQLiteCacheBackend)
+        with pytest.raises(ValueError):
+            create_cache_backend("memcached://localhost")
+    
+    def test_incomplete_backend_cannot_be_created(self):
+        """Test that a backend missing one of the operations fails when instantiated."""
+        class WriteOnlyBackend(CacheBackend):
+            async def set(self, key, value, ttl_seconds):
+                pass
+            
+            async def delete(self, key):
+                pass
+        
+        with pytest.raises(TypeError):
+            WriteOnlyBackend()
+
+def test_model_serialization_round_trip(mock_subscriptions):
+    """Test that models survive serialization and are stored compactly."""
+    data = dump_models(mock_subscriptions)
+
+    assert load_models(Subscription, data) == mock_subscriptions
+    assert load_models(Order, dump_models([])) == []
+    assert len(data) < len(json.dumps([sub.__dict__ for sub in mock_subscriptions], default=str))
+
+class TestCachedClient:
+
+    @pytest.mark.asyncio
+    async def test_clients_share_cached_responses(self, backend):
+        """Test that a second client sharing the backend does not call upstream."""
+        with respx.mock(base_url=BASE_URL) as respx_mock:
+            page = respx_mock.get("/orders/1/1").respond(json={"orders": [{
+                "id": 101, "closedate": "2024-01-01T00:00:00Z",
+                "total_order_value__c": 29.99, "parent_subscription_id__c": 1
+            }]})
+            respx_mock.get("/orders/1/2").respond(json={"orders": []})
+
+            first = AudicusAPIClient(cache=backend)
+            second = AudicusAPIClient(cache=backend)
+            try:
+                orders = await first.get_subscription_orders(1)
+                assert await second.get_subscription_orders(1) == orders
+                assert 101 in second.order_index
+            finally:
+                await first.close()
+                await second.close()
+
+            assert page.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_incomplete_listings_are_not_cached(self, backend):
+        """Test that a listing cut short by an error is refetched next time."""
+        with respx.mock(base_url=BASE_URL) as respx_mock:
+            respx_mock.get("/subscriptions/1?per_page=100").respond(json={"subscriptions": [{
+                "id": 1, "billing_interval__c": "1 month", "status__c": "active",
+                "start_date__c": "2024-01-01T00:00:00Z", "recurring_amount__c": 29.99
+            }]})
+            failing = respx_mock.get("/subscriptions/2?per_page=100").respond(status_code=500)
+
+            client = AudicusAPIClient(cache=backend)
+            try:
+                assert len(await client.get_subscriptions()) == 1
+                assert len(await client.get_subscriptions()) == 1
+            finally:
+                await client.close()
+
+            assert failing.call_count == 2
+
+@pytest.mark.asyncio
+async def test_replicas_share_snapshot(backend, mock_subscriptions, mock_orders):
+    """Test that a replica reuses the snapshot another one stored in the backend."""
+    api_client = AsyncMock()
+    api_client.get_subscriptions.return_value = mock_subscriptions
+
+    async def mock_get_orders_side_effect(sub_id: int):
+        return mock_orders.get(sub_id, [])
+
+    api_client.get_subscription_orders.side_effect = mock_get_orders_side_effect
+
+    fetched = await SnapshotStore(cache=backend).get(api_client)
+    reused = await SnapshotStore(cache=backend).get(api_client)
+
+    assert api_client.get_subscriptions.call_count == 1
+    assert reused.fetched_at == fetched.fetched_at
+    assert reused.subscriptions == fetched.subscriptions
+
+def test_order_index_expires_and_evicts(monkeypatch):
+    """Test that the order index forgets orders after the TTL and past its size."""
+    clock = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+    index = OrderIndex(max_entries=2, ttl_seconds=60)
+    orders = [Order(id=i, closedate=datetime(2024, 1, 1, tzinfo=timezone.utc), total_order_value__c=10.0,
+                    parent_subscription_id__c=1) for i in range(3)]
+
+    index[0] = orders[0]
+    index[1] = orders[1]
+    assert index.get(0) == orders[0]
+    index[2] = orders[2]
+    assert 1 not in index and 0 in index and len(index) == 2
+
+    clock[0] += 61
+    assert index.get(0) is None and 2 not in index
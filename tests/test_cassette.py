@@ -0,0 +1,71 @@
+import time
+import httpx
+import pytest
+from app.api_client import AudicusAPIClient
+from app import cassette as cassette_module
+from app.cassette import Cassette, RecordingTransport, ReplayTransport, cassette_transport, save_recordings
+from benchmarks.mock_upstream import MockUpstreamConfig, create_app
+
+@pytest.mark.asyncio
+async def test_record_then_replay(tmp_path):
+    """Test that a replayed cassette gives the client exactly what was recorded."""
+    path = str(tmp_path / "upstream.json.gz")
+    upstream = httpx.ASGITransport(app=create_app(MockUpstreamConfig(size=30, error_rate=0.2, seed=3)))
+    cassette = Cassette()
+    client = AudicusAPIClient(base_url="http://upstream", transport=RecordingTransport(cassette, upstream))
+    recorded_subs = await client.get_subscriptions(per_page=10)
+    recorded_orders = await client.get_subscription_orders(5)
+    await client.close()
+    assert cassette.unsaved
+    cassette.save(path)
+    assert not cassette.unsaved
+
+    replayed = Cassette.load(path)
+    assert len(replayed) == len(cassette) > 0
+    # Recorded failures replay as failures too
+    assert {interaction[2] for interaction in replayed.interactions} <= {200, 500, 502, 503}
+
+    client = AudicusAPIClient(base_url="http://elsewhere", transport=ReplayTransport(replayed, speed=0))
+    assert await client.get_subscriptions(per_page=10) == recorded_subs
+    assert await client.get_subscription_orders(5) == recorded_orders
+    # Requests that were never recorded fail like a network error
+    assert await client.get_order(123) is None
+    await client.close()
+
+@pytest.mark.asyncio
+async def test_replay_timing_and_repeats():
+    """Test that replay scales the recorded latency and cycles through repeated responses."""
+    cassette = Cassette([
+        ["GET", "/order/1", 200, 0.2, {"content-type": "application/json"}, '{"n": 1}'],
+        ["GET", "/order/1", 200, 0.2, {"content-type": "application/json"}, '{"n": 2}'],
+    ])
+    async with httpx.AsyncClient(transport=ReplayTransport(cassette, speed=4), base_url="http://x") as client:
+        started = time.perf_counter()
+        bodies = [(await client.get("/order/1")).json()["n"] for _ in range(3)]
+        elapsed = time.perf_counter() - started
+
+    assert bodies == [1, 2, 1]
+    assert 0.15 <= elapsed < 0.5
+
+def test_transport_from_settings(tmp_path, monkeypatch):
+    """Test choosing recording, replay or the network, and saving recordings once."""
+    monkeypatch.setattr(cassette_module, "_recordings", {})
+    path = tmp_path / "a.json.gz"
+    assert cassette_transport(None, None) is None
+    transport = cassette_transport(str(path), None)
+    assert isinstance(transport, RecordingTransport)
+    with pytest.raises(ValueError):
+        cassette_transport("a", "b")
+
+    save_recordings()
+    assert not list(tmp_path.iterdir())
+    transport.cassette.add("GET", "/order/1", 200, 0.1, {}, "{}")
+    save_recordings()
+    assert not list(tmp_path.glob("*.tmp"))
+
+    # Another worker's recording of the same path is merged on replay
+    Cassette([["GET", "/order/2", 200, 0.1, {}, "{}"]]).save(f"{path}.1")
+    replayed = Cassette.load_recording(str(path))
+    assert [interaction[1] for interaction in replayed.interactions] == ["/order/2", "/order/1"]
+    with pytest.raises(FileNotFoundError):
+        Cassette.load_recording(str(tmp_path / "missing.json.gz"))
@@ -0,0 +1,58 @@
+import pytest
+from datetime import datetime, timezone
+from app.cohorts import calculate_cohort_retention
+from app.models import Subscription, CohortRetentionResponse
+
+NOW = datetime(2024, 12, 15, tzinfo=timezone.utc)
+
+class TestCohortRetention:
+
+    def test_cohort_matrix(self, mock_subscriptions, mock_orders):
+        """Test retention and paid orders per start-month cohort."""
+        result = calculate_cohort_retention(mock_subscriptions, mock_orders, max_months=36, now=NOW)
+
+        assert isinstance(result, CohortRetentionResponse)
+        cohorts = {row.cohort: row for row in result.cohorts}
+        # Subscription 4 starts after NOW and still gets an offset-0 cohort
+        assert set(cohorts) == {"2024-01", "2024-02", "2024-03", "2025-01"}
+
+        january = cohorts["2024-01"]
+        assert january.subscriptions == 2
+        # Subscription 2 ends in October (9 months), subscription 1 is still active
+        assert len(january.retained) == 12
+        assert january.retained[9] == 2
+        assert january.retained[10] == 1
+        assert january.retention_rate[11] == 0.5
+        assert january.paid_orders == 8
+        assert january.paid_order_value == pytest.approx(5 * 29.99 + 3 * 79.99)
+
+        february = cohorts["2024-02"]
+        # Subscription 5 ended after 6 months
+        assert february.retained[:8] == [1, 1, 1, 1, 1, 1, 1, 0]
+
+    def test_max_months_caps_offsets(self, mock_subscriptions, mock_orders):
+        """Test that offsets are capped at max_months."""
+        result = calculate_cohort_retention(mock_subscriptions, mock_orders, max_months=3, now=NOW)
+
+        for row in result.cohorts:
+            assert len(row.retained) <= 4
+            assert row.retained == sorted(row.retained, reverse=True)
+
+    def test_single_pass_scale(self):
+        """Test that a large book produces consistent retention counts."""
+        subscriptions = [
+            Subscription(
+                id=i,
+                billing_interval__c="1 month",
+                start_date__c=datetime(2021 + i % 3, 1 + i % 12, 1 + i % 28, tzinfo=timezone.utc),
+                end_date__c=datetime(2024, 1 + i % 12, 1, tzinfo=timezone.utc) if i % 4 == 0 else None,
+                status__c="canceled" if i % 4 == 0 else "active"
+            )
+            for i in range(5000)
+        ]
+        result = calculate_cohort_retention(subscriptions, {}, max_months=36, now=NOW)
+
+        assert sum(row.subscriptions for row in result.cohorts) == 5000
+        for row in result.cohorts:
+            assert row.retained[0] == row.subscriptions
+            assert len(row.retained) <= 37
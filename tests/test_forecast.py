@@ -0,0 +1,83 @@
+import pytest
+from datetime import date, datetime, timezone
+from app.forecast import FenwickTree, RevenueIndex
+from app.models import Subscription, ForecastResponse
+
+TODAY = date(2025, 5, 20)
+
+def make_subscription(sub_id: int, next_payment: datetime, interval: str = "1 month",
+                      amount: float = 10.0, status: str = "active") -> Subscription:
+    return Subscription(
+        id=sub_id,
+        billing_interval__c=interval,
+        next_payment_date__c=next_payment,
+        recurring_amount__c=amount,
+        start_date__c=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        status__c=status
+    )
+
+class TestFenwickTree:
+
+    def test_range_sums(self):
+        """Test prefix and range sums after point updates."""
+        tree = FenwickTree(10)
+        for i in range(10):
+            tree.add(i, i)
+
+        assert tree.prefix_sum(10) == 45
+        assert tree.range_sum(2, 5) == 2 + 3 + 4
+        assert tree.range_sum(-3, 100) == 45
+
+class TestRevenueIndex:
+
+    def test_forecast_buckets(self, mock_subscriptions):
+        """Test that only active subscriptions are projected into the forecast."""
+        index = RevenueIndex()
+        index.update(mock_subscriptions, TODAY)
+
+        result = index.forecast(TODAY, 90, "week")
+
+        assert isinstance(result, ForecastResponse)
+        # Subscription 1 pays on Jun 1, Jul 1 and Aug 1; subscription 3 is on hold
+        assert result.expected_payments == 3
+        assert result.expected_revenue == pytest.approx(3 * 29.99)
+        assert sum(bucket.expected_payments for bucket in result.buckets) == 3
+        assert result.buckets[0].start == TODAY
+        assert result.buckets[-1].end == date(2025, 8, 18)
+
+    def test_projection_follows_interval(self):
+        """Test that payments repeat along the billing interval."""
+        index = RevenueIndex()
+        index.update([make_subscription(1, datetime(2025, 5, 21, tzinfo=timezone.utc), "2 weeks")], TODAY)
+
+        revenue, payments = index.range_sum(TODAY, date(2025, 7, 1))
+        # May 21, Jun 4, Jun 18
+        assert payments == 3
+        assert revenue == pytest.approx(30.0)
+
+        result = index.forecast(TODAY, 30, "day")
+        assert len(result.buckets) == 30
+        assert result.buckets[1].expected_payments == 1
+
+    def test_incremental_update(self):
+        """Test that refreshes only re-project changed subscriptions."""
+        subs = [make_subscription(i, datetime(2025, 6, 1, tzinfo=timezone.utc)) for i in range(1, 101)]
+        index = RevenueIndex()
+
+        assert index.update(subs, TODAY) == 100
+        assert index.update(subs, TODAY) == 0
+
+        # One amount change, one cancellation, one removal
+        subs[0] = make_subscription(1, datetime(2025, 6, 1, tzinfo=timezone.utc), amount=50.0)
+        subs[1] = make_subscription(2, datetime(2025, 6, 1, tzinfo=timezone.utc), status="canceled")
+        del subs[2]
+        assert index.update(subs, TODAY) == 3
+
+        revenue, payments = index.range_sum(date(2025, 6, 1), date(2025, 6, 2))
+        assert payments == 98
+        assert revenue == pytest.approx(97 * 10.0 + 50.0)
+
+        # Same result as rebuilding from scratch
+        fresh = RevenueIndex()
+        fresh.update(subs, TODAY)
+        assert fresh.range_sum(TODAY, date(2026, 5, 1)) == pytest.approx(index.range_sum(TODAY, date(2026, 5, 1)))
@@ -0,0 +1,106 @@
+import gzip
+import json
+import httpx
+import pytest
+from app import http_cache, main
+from app.api_client import AudicusAPIClient
+from app.http_cache import choose_encoding, not_modified, request_key
+from app.snapshot import snapshot_store
+from benchmarks.mock_upstream import MockUpstreamConfig, create_app
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Serve the app's upstream from the mock."""
+    app = create_app(MockUpstreamConfig(size=40, max_page_size=20))
+    monkeypatch.setattr(main, "AudicusAPIClient", lambda **kwargs: AudicusAPIClient(
+        base_url="http://mock", transport=httpx.ASGITransport(app=app), **kwargs
+    ))
+    return app
+
+def test_validators_and_encoding_negotiation():
+    """Test the query key, If-None-Match matching across codings and Accept-Encoding parsing."""
+    assert request_key([("seed", "1"), ("grace_days", "7"), ("grace_days", "3")]) == "grace_days=7&grace_days=3&seed=1"
+    assert request_key([("grace_days", "3"), ("grace_days", "7")]) != request_key([("grace_days", "7"), ("grace_days", "3")])
+
+    base = '"18f-abc"'
+    assert not_modified(None, base) is None
+    assert not_modified('"other"', base) is None
+    assert not_modified(f'"x", W/{base}', base) == base
+    assert not_modified('"18f-abc-gzip"', base) == '"18f-abc-gzip"'
+    assert not_modified("*", base) == "*"
+
+    assert choose_encoding("gzip, br", 100) == "identity"
+    assert choose_encoding("gzip;q=0.5", 4096) == "gzip"
+    assert choose_encoding("gzip;q=0", 4096) == "identity"
+    assert choose_encoding(None, 4096) == "identity"
+
+@pytest.mark.asyncio
+async def test_analytics_etag_and_not_modified(upstream, monkeypatch):
+    """Test that repeated /analytics calls are answered with 304 until the snapshot changes."""
+    lookups = []
+    get_snapshot = snapshot_store.get
+
+    async def counting_get(api_client):
+        lookups.append(snapshot_store.snapshot)
+        return await get_snapshot(api_client)
+
+    monkeypatch.setattr(snapshot_store, "get", counting_get)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as client:
+        first = await client.get("/analytics", headers={"Accept-Encoding": "identity"})
+        # The snapshot resolved for the ETag is the one the response is computed from
+        assert lookups == [None]
+        etag = first.headers["etag"]
+        assert first.status_code == 200 and etag.startswith('"') and not etag.startswith("W/")
+        assert first.headers["vary"] == "Accept-Encoding"
+        max_age = int(first.headers["cache-control"].removeprefix("max-age="))
+        assert 0 < max_age <= snapshot_store.ttl_seconds
+
+        revalidated = await client.get("/analytics", headers={"If-None-Match": etag})
+        assert revalidated.status_code == 304 and revalidated.content == b""
+        assert revalidated.headers["etag"] == etag
+
+        # Another query on the same snapshot is a different response
+        other = await client.get("/analytics", params={"grace_days": [3, 7]}, headers={"If-None-Match": etag})
+        reordered = await client.get("/analytics", params={"grace_days": [7, 3]})
+        assert other.status_code == 200
+        assert len({etag, other.headers["etag"], reordered.headers["etag"]}) == 3
+
+        snapshot_store.invalidate()
+        refreshed = await client.get("/analytics", headers={"If-None-Match": etag, "Accept-Encoding": "identity"})
+        assert refreshed.status_code == 200 and refreshed.headers["etag"] != etag
+
+@pytest.mark.asyncio
+async def test_large_responses_are_compressed_once_per_snapshot(upstream, monkeypatch):
+    """Test that larger bodies are gzipped for clients that accept it, from the cached bytes."""
+    monkeypatch.setattr(http_cache, "MIN_COMPRESSED_BYTES", 256)
+    params = {"include_distributions": "true"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as client:
+        plain = await client.get("/analytics", params=params, headers={"Accept-Encoding": "identity"})
+
+        # A second request must not recompute the analytics
+        monkeypatch.setattr(main, "calculate_distributions", None)
+        request = client.build_request("GET", "/analytics", params=params, headers={"Accept-Encoding": "gzip"})
+        compressed = await client.send(request, stream=True)
+        raw = b"".join([chunk async for chunk in compressed.aiter_raw()])
+        await compressed.aclose()
+
+        assert "content-encoding" not in plain.headers
+        assert compressed.headers["content-encoding"] == "gzip"
+        assert len(raw) < len(plain.content)
+        assert json.loads(gzip.decompress(raw)) == plain.json()
+        assert compressed.headers["etag"] != plain.headers["etag"]
+
+        revalidated = await client.get("/analytics", params=params, headers={"If-None-Match": compressed.headers["etag"]})
+        assert revalidated.status_code == 304
+
+@pytest.mark.asyncio
+async def test_approx_and_profiled_responses_are_not_cached(upstream, monkeypatch):
+    """Test that sampled and profiled responses carry no validator."""
+    monkeypatch.setattr(main, "profile_token_valid", lambda token: True)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as client:
+        approx = await client.get("/analytics", params={"mode": "approx", "seed": 1})
+        profiled = await client.get("/analytics", params={"profile": "cpu"})
+
+    assert approx.status_code == 200 and "etag" not in approx.headers
+    assert profiled.status_code == 200 and "etag" not in profiled.headers
+    assert "subscription_stats" in profiled.json()["analytics"]
@@ -0,0 +1,93 @@
+import random
+from datetime import datetime, timedelta, timezone
+from app.indexes import SubscriptionIndex, normalize_billing_interval
+from app.models import Subscription, SubscriptionFilter
+
+def scan(subscriptions, criteria: SubscriptionFilter):
+    """
+    Reference implementation of the filters as a plain scan.
+    """
+    result = []
+    for sub in subscriptions:
+        if criteria.status and sub.status__c not in criteria.status:
+            continue
+        if criteria.billing_interval and normalize_billing_interval(sub.billing_interval__c) not in [
+                normalize_billing_interval(interval) for interval in criteria.billing_interval]:
+            continue
+        if criteria.start_date_from or criteria.start_date_to:
+            if not sub.start_date__c:
+                continue
+            if criteria.start_date_from and sub.start_date__c < criteria.start_date_from:
+                continue
+            if criteria.start_date_to and sub.start_date__c > criteria.start_date_to:
+                continue
+        if criteria.recurring_amount_min is not None or criteria.recurring_amount_max is not None:
+            if sub.recurring_amount__c is None:
+                continue
+            if criteria.recurring_amount_min is not None and sub.recurring_amount__c < criteria.recurring_amount_min:
+                continue
+            if criteria.recurring_amount_max is not None and sub.recurring_amount__c > criteria.recurring_amount_max:
+                continue
+        result.append(sub)
+    return result
+
+class TestSubscriptionIndex:
+
+    def test_filter_by_status_and_interval(self, mock_subscriptions):
+        """Test bitmap filters on status and billing interval."""
+        index = SubscriptionIndex(mock_subscriptions)
+
+        active = index.filter(SubscriptionFilter(status=["active"]))
+        assert [sub.id for sub in active] == [1, 4]
+
+        monthly = index.filter(SubscriptionFilter(billing_interval=["1 months"]))
+        assert [sub.id for sub in monthly] == [1, 3]
+
+        assert index.filter(SubscriptionFilter(status=["active"], billing_interval=["1 year"]))[0].id == 4
+        assert index.filter(SubscriptionFilter(status=["unknown"])) == []
+        assert index.filter(SubscriptionFilter()) == mock_subscriptions
+
+    def test_filter_by_ranges(self, mock_subscriptions):
+        """Test sorted-array filters on start date and recurring amount."""
+        index = SubscriptionIndex(mock_subscriptions)
+
+        started = index.filter(SubscriptionFilter(start_date_from=datetime(2024, 2, 1, tzinfo=timezone.utc),
+                                                  start_date_to=datetime(2024, 12, 31, tzinfo=timezone.utc)))
+        assert [sub.id for sub in started] == [3, 5]
+
+        # Prepaid subscription 5 has no recurring amount and never matches an amount range
+        cheap = index.filter(SubscriptionFilter(recurring_amount_max=50))
+        assert [sub.id for sub in cheap] == [1, 3]
+
+    def test_get_by_id(self, mock_subscriptions):
+        """Test lookup of a subscription by id."""
+        index = SubscriptionIndex(mock_subscriptions)
+        assert index.get(3).status__c == "on-hold"
+        assert index.get(999) is None
+
+    def test_matches_scan(self):
+        """Test that indexed filters agree with a plain scan on random data."""
+        rng = random.Random(11)
+        base = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        subscriptions = [
+            Subscription(
+                id=i,
+                billing_interval__c=rng.choice(["1 month", "3 months", "1 year", "2 weeks"]),
+                recurring_amount__c=rng.choice([None, 9.99, 29.99, 79.99, 299.99]),
+                start_date__c=rng.choice([None, base + timedelta(days=rng.randint(0, 1000))]),
+                status__c=rng.choice(["active", "on-hold", "canceled"])
+            )
+            for i in range(3000)
+        ]
+        index = SubscriptionIndex(subscriptions)
+
+        for _ in range(50):
+            criteria = SubscriptionFilter(
+                status=rng.choice([None, ["active"], ["active", "on-hold"]]),
+                billing_interval=rng.choice([None, ["1 month"], ["3 month", "1 year"]]),
+                start_date_from=rng.choice([None, base + timedelta(days=rng.randint(0, 1000))]),
+                start_date_to=rng.choice([None, base + timedelta(days=rng.randint(0, 1000))]),
+                recurring_amount_min=rng.choice([None, 10, 29.99]),
+                recurring_amount_max=rng.choice([None, 79.99, 100])
+            )
+            assert index.filter(criteria) == scan(subscriptions, criteria)
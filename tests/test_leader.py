@@ -0,0 +1,128 @@
+import pytest
+from unittest.mock import AsyncMock
+from app import snapshot as snapshot_module
+from app.cache import MemoryCacheBackend
+from app.leader import LeaderLock
+from app.snapshot import SnapshotStore
+
+def make_api_client(subscriptions, orders):
+    api_client = AsyncMock()
+    api_client.get_subscriptions.return_value = subscriptions
+
+    async def mock_get_orders_side_effect(sub_id: int):
+        return orders.get(sub_id, [])
+
+    api_client.get_subscription_orders.side_effect = mock_get_orders_side_effect
+    return api_client
+
+@pytest.fixture
+def stores(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    leader = SnapshotStore(snapshot_path=path)
+    follower = SnapshotStore(snapshot_path=path)
+    yield leader, follower
+    leader.leader_lock.release()
+    follower.leader_lock.release()
+
+def test_only_one_lock_holder(tmp_path):
+    """Test that the lock elects a single leader and can be handed over."""
+    first = LeaderLock(str(tmp_path / "leader.lock"))
+    second = LeaderLock(str(tmp_path / "leader.lock"))
+
+    assert first.try_acquire()
+    assert first.try_acquire()
+    assert not second.try_acquire()
+
+    first.release()
+    assert second.try_acquire()
+    assert not first.held
+    second.release()
+
+@pytest.mark.asyncio
+async def test_followers_never_call_upstream(stores, mock_subscriptions, mock_orders):
+    """Test that only the leader fetches and followers load what it publishes."""
+    leader, follower = stores
+    leader_client = make_api_client(mock_subscriptions, mock_orders)
+    follower_client = make_api_client(mock_subscriptions, mock_orders)
+
+    published = await leader.get(leader_client)
+    followed = await follower.get(follower_client)
+
+    assert leader.leader_lock.held and not follower.leader_lock.held
+    assert followed.fetched_at == published.fetched_at
+    assert followed.subscriptions == published.subscriptions
+    assert leader_client.get_subscriptions.call_count == 1
+    follower_client.get_subscriptions.assert_not_called()
+
+    # A new publication is picked up once the follower looks again
+    mock_subscriptions[0].status__c = "on-hold"
+    await leader.refresh(leader_client)
+    follower.poll_seconds = 0
+    await follower.get(follower_client)
+    assert follower.snapshot.fetched_at == leader.snapshot.fetched_at
+    assert follower.snapshot.subscriptions[0].status__c == "on-hold"
+    follower_client.get_subscriptions.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_follower_takes_over(stores, mock_subscriptions, mock_orders):
+    """Test that a follower becomes leader once the leader lets go."""
+    leader, follower = stores
+    await leader.get(make_api_client(mock_subscriptions, mock_orders))
+    follower_client = make_api_client(mock_subscriptions, mock_orders)
+    await follower.get(follower_client)
+
+    leader.leader_lock.release()
+    follower.invalidate()
+    await follower.get(follower_client)
+
+    assert follower.leader_lock.held
+    assert follower_client.get_subscriptions.call_count == 1
+
+@pytest.mark.asyncio
+async def test_follower_without_publication_fetches(stores, mock_subscriptions, mock_orders, monkeypatch):
+    """Test that a follower falls back to upstream when the leader never publishes."""
+    monkeypatch.setattr(snapshot_module, "LEADER_WAIT_SECONDS", 0.2)
+    leader, follower = stores
+    assert leader.is_leader()
+
+    follower_client = make_api_client(mock_subscriptions, mock_orders)
+    snapshot = await follower.get(follower_client)
+
+    assert snapshot.subscriptions == mock_subscriptions
+    assert follower_client.get_subscriptions.call_count == 1
+    assert snapshot_module._file_signature(follower.snapshot_path) is None
+
+@pytest.mark.asyncio
+async def test_leader_publishes_snapshots_from_the_cache(tmp_path, mock_subscriptions, mock_orders):
+    """Test that a leader publishes the file when its snapshot comes from the shared cache."""
+    cache = MemoryCacheBackend()
+    path = str(tmp_path / "snapshot.bin")
+    other_host = SnapshotStore(cache=cache)
+    leader = SnapshotStore(snapshot_path=path, cache=cache)
+    try:
+        fetched = await other_host.get(make_api_client(mock_subscriptions, mock_orders))
+        leader_client = make_api_client(mock_subscriptions, mock_orders)
+        await leader.get(leader_client)
+
+        leader_client.get_subscriptions.assert_not_called()
+        assert snapshot_module._decode_snapshot(path, 1).fetched_at == fetched.fetched_at
+    finally:
+        leader.leader_lock.release()
+
+@pytest.mark.asyncio
+async def test_follower_fetches_when_publication_goes_stale(stores, mock_subscriptions, mock_orders, monkeypatch):
+    """Test that a follower stops serving the leader's file once it is well past the TTL."""
+    monkeypatch.setattr(snapshot_module, "LEADER_WAIT_SECONDS", 0)
+    leader, follower = stores
+    published = await leader.get(make_api_client(mock_subscriptions, mock_orders))
+    follower_client = make_api_client(mock_subscriptions, mock_orders)
+    await follower.get(follower_client)
+    follower_client.get_subscriptions.assert_not_called()
+
+    # The leader still holds the lock but never publishes again
+    follower.ttl_seconds = follower.poll_seconds = 0
+    snapshot = await follower.get(follower_client)
+
+    assert leader.leader_lock.held and not follower.leader_lock.held
+    assert follower_client.get_subscriptions.call_count == 1
+    assert snapshot.fetched_at > published.fetched_at
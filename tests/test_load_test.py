@@ -0,0 +1,32 @@
+import pytest
+from benchmarks.load_test import percentile, start_mock_upstream, run_load_test
+
+def test_percentile():
+    """Test nearest-rank percentiles."""
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([5], 95) == 5
+    assert percentile([], 50) is None
+
+@pytest.mark.asyncio
+async def test_burst_shares_one_sync(monkeypatch):
+    """Test that a burst of cold requests costs about one sync upstream."""
+    monkeypatch.setenv("AUDICUS_BASE_URL", "")
+    process, url = start_mock_upstream(["--size", "20"])
+    try:
+        results = await run_load_test(url, ["cold", "burst", "warm"], requests=10, concurrency=5, rate=None)
+    finally:
+        process.terminate()
+        process.wait()
+
+    cold, burst, warm = results["results"]
+    assert cold["requests"] == 1
+    assert all(result["errors"] == 0 for result in results["results"])
+    # Ten concurrent cold calls cost the upstream requests of a single one
+    assert burst["upstream_requests"] == cold["upstream_requests"]
+    assert burst["upstream_requests_per_call"] == pytest.approx(cold["upstream_requests_per_call"] / 10, abs=0.01)
+    assert warm["upstream_requests_per_call"] == 0
+    assert burst["latency_ms"]["p99"] >= burst["latency_ms"]["p50"]
+    assert burst["peak_rss_bytes"] > 0
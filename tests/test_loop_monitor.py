@@ -0,0 +1,43 @@
+import asyncio
+import logging
+import time
+import pytest
+from prometheus_client import REGISTRY
+from app.loop_monitor import LoopMonitor
+
+def blocking_work(seconds: float) -> None:
+    time.sleep(seconds)
+
+@pytest.mark.asyncio
+async def test_blocking_code_is_caught_with_its_stack(caplog):
+    """Test that a blocked loop shows up as lag and its stack names the blocking function."""
+    monitor = LoopMonitor(interval=0.01, slow_threshold=0.05)
+    stalls = REGISTRY.get_sample_value("audicus_event_loop_stalls_total") or 0.0
+    monitor.start()
+    try:
+        await asyncio.sleep(0.05)
+        with caplog.at_level(logging.WARNING, logger="app.loop_monitor"):
+            blocking_work(0.3)
+            await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+
+    assert monitor.stalls == 1
+    assert REGISTRY.get_sample_value("audicus_event_loop_stalls_total") == stalls + 1
+    assert any("blocking_work" in record.getMessage() for record in caplog.records)
+    assert max(monitor.samples) >= 0.25
+    quantiles = monitor.lag_quantiles()
+    assert quantiles[0.5] < 0.05 <= quantiles[0.99]
+
+    monitor.publish()
+    assert REGISTRY.get_sample_value("audicus_event_loop_lag_quantile_seconds", {"quantile": "0.99"}) >= 0.25
+
+@pytest.mark.asyncio
+async def test_idle_loop_reports_no_stalls():
+    """Test that an idle loop has no stalls and stops cleanly."""
+    monitor = LoopMonitor(interval=0.01, slow_threshold=0.2)
+    monitor.start()
+    await asyncio.sleep(0.1)
+    await monitor.stop()
+    assert monitor.stalls == 0
+    assert monitor.samples and max(monitor.samples) < 0.2
@@ -0,0 +1,83 @@
+import httpx
+import pytest
+from app import main, profiling
+from app.api_client import AudicusAPIClient
+from app.cache import MemoryCacheBackend, OrderIndex
+from app.memory import cache_contents, copy_containers, deep_sizeof, memory_report
+from app.snapshot import Snapshot
+from app.synthetic import SyntheticBook
+from benchmarks.memory import run_suite
+from benchmarks.mock_upstream import MockUpstreamConfig, create_app
+
+def test_deep_sizeof_counts_shared_objects_once():
+    """Test that deep sizes follow references and skip what was already counted."""
+    shared = "x" * 1000
+    assert deep_sizeof([shared, shared]) < deep_sizeof([shared, "y" * 1000])
+    seen = set()
+    first = deep_sizeof([shared], seen)
+    assert deep_sizeof([shared], seen) < first
+
+def test_copy_containers_shares_contents():
+    """Test that containers are copied, once each, and what they hold is shared."""
+    record = object()
+    inner = [record]
+    original = {"a": inner, "b": (inner, 1)}
+    copy = copy_containers(original)
+    original["c"] = inner.append(2)
+    assert copy == {"a": [record], "b": ([record], 1)}
+    assert copy["a"] is copy["b"][0] and copy["a"] is not inner and copy["a"][0] is record
+
+@pytest.mark.asyncio
+async def test_memory_report_by_representation():
+    """Test bytes per record per representation and what the caches add."""
+    book = SyntheticBook(300)
+    subscriptions, orders = book.dataset()
+    snapshot = Snapshot(version=1, fetched_at=book.as_of, subscriptions=subscriptions, orders=orders)
+    snapshot.derive("ids", lambda: [sub.id * 1000 for sub in subscriptions])
+    cache = MemoryCacheBackend()
+    await cache.set("key", b"v" * 5000, 60)
+    order_count = sum(len(sub_orders) for sub_orders in orders.values())
+
+    order_index = OrderIndex()
+    order_index.update((order.id, order) for sub_orders in orders.values() for order in sub_orders)
+    report = memory_report(snapshot, cache_contents(snapshot, order_index), cache, sample_size=100)
+
+    for records, expected in ((report.subscriptions, 300), (report.orders, order_count)):
+        assert records["pydantic"].bytes_per_record > records["compact"].bytes_per_record > \
+            records["columnar"].bytes_per_record > 0
+        assert all(size.records == expected for size in records.values())
+        assert records["pydantic"].estimated_bytes == pytest.approx(records["pydantic"].bytes_per_record * expected, rel=0.01)
+    assert report.subscriptions["columnar"].bytes_per_record == 56
+    assert report.orders["columnar"].bytes_per_record == 32
+    # The derived list is ints the snapshot doesn't hold; the order index only adds its
+    # dict and an (expiry, order) tuple per entry
+    assert report.caches["snapshot_derived"] > 300 * 28
+    assert report.caches["order_index"] < order_count * 400
+    assert report.caches["memory_cache"] > 5000
+    assert report.peak_rss_bytes > 0
+
+@pytest.mark.asyncio
+async def test_memory_endpoint(monkeypatch):
+    """Test that /debug/memory is token-gated and reports the served snapshot."""
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    upstream = create_app(MockUpstreamConfig(size=25))
+    monkeypatch.setattr(main, "AudicusAPIClient", lambda **kwargs: AudicusAPIClient(
+        base_url="http://mock", transport=httpx.ASGITransport(app=upstream), **kwargs
+    ))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as client:
+        assert (await client.get("/debug/memory")).status_code == 403
+        await client.get("/analytics")
+        response = await client.get("/debug/memory", params={"sample": 10}, headers={"X-Profile-Token": "secret"})
+
+    assert response.status_code == 200
+    report = response.json()
+    assert report["sample_size"] == 10
+    assert report["subscriptions"]["pydantic"]["records"] == 25
+
+def test_memory_benchmark():
+    """Test the benchmark mode end to end on a tiny book."""
+    results = run_suite([30], sample=10)
+    [result] = results["results"]
+    assert result["size"] == 30
+    assert result["subscriptions"]["pydantic"]["records"] == 30
+    assert result["peak_rss_bytes"] >= result["baseline_peak_rss_bytes"] > 0
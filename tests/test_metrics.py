@@ -0,0 +1,59 @@
+import httpx
+import pytest
+from prometheus_client import REGISTRY
+from app import main
+from app.api_client import AudicusAPIClient
+from app.cache import MemoryCacheBackend
+from benchmarks.mock_upstream import MockUpstreamConfig, create_app
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+@pytest.mark.asyncio
+async def test_analytics_is_instrumented(monkeypatch):
+    """Test that an /analytics call shows up in upstream, pagination and compute metrics."""
+    upstream = create_app(MockUpstreamConfig(size=40, max_page_size=10))
+    monkeypatch.setattr(main, "AudicusAPIClient", lambda **kwargs: AudicusAPIClient(
+        base_url="http://mock", transport=httpx.ASGITransport(app=upstream), **kwargs
+    ))
+    before = {
+        "subscriptions": sample("audicus_upstream_request_seconds_count", endpoint="subscriptions", status="200"),
+        "syncs": sample("audicus_sync_pages_count"),
+        "pages": sample("audicus_sync_pages_sum"),
+        "stats": sample("audicus_compute_seconds_count", function="calculate_subscription_stats"),
+    }
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as client:
+        assert (await client.get("/analytics", params={"as_of": "2025-01-01T00:00:00Z"})).status_code == 200
+        response = await client.get("/metrics")
+
+    assert response.headers["content-type"].startswith("text/plain")
+    # Four full pages and the empty one that ends the listing
+    assert sample("audicus_upstream_request_seconds_count", endpoint="subscriptions", status="200") == \
+        before["subscriptions"] + 5
+    assert sample("audicus_sync_pages_count") == before["syncs"] + 1
+    # The subscription pages plus at least one orders page per subscription
+    assert sample("audicus_sync_pages_sum") - before["pages"] >= 5 + 40
+    assert sample("audicus_compute_seconds_count", function="calculate_subscription_stats") == before["stats"] + 1
+    assert sample("audicus_upstream_in_flight_requests") == 0
+    assert sample("audicus_snapshot_age_seconds") >= 0
+    assert "audicus_snapshot_age_seconds" in response.text
+
+@pytest.mark.asyncio
+async def test_truncations_and_cache_metrics():
+    """Test that failed paginations, cache lookups and evictions are counted."""
+    upstream = create_app(MockUpstreamConfig(size=5, error_rate=1.0))
+    cache = MemoryCacheBackend(max_entries=1)
+    client = AudicusAPIClient(base_url="http://mock", transport=httpx.ASGITransport(app=upstream), cache=cache)
+    truncated = sample("audicus_truncated_paginations_total", endpoint="subscriptions")
+    misses = sample("audicus_cache_lookups_total", kind="subscriptions", result="miss")
+    evictions = sample("audicus_cache_evictions_total")
+
+    assert await client.get_subscriptions() == []
+    await client.close()
+    await cache.set("a", b"1", 60)
+    await cache.set("b", b"2", 60)
+
+    assert sample("audicus_truncated_paginations_total", endpoint="subscriptions") == truncated + 1
+    assert sample("audicus_cache_lookups_total", kind="subscriptions", result="miss") == misses + 1
+    assert sample("audicus_cache_evictions_total") == evictions + 1
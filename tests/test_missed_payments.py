@@ -0,0 +1,174 @@
+import random
+from datetime import datetime, timedelta, timezone
+from app.analytics import (
+    calculate_missed_payments, calculate_missed_payment_trend, calculate_subscription_stats,
+    calculate_missed_payments_by_subscription, summarize_missed_payments, top_delinquent_subscriptions,
+    build_billing_timeline, count_missed_payments, calculate_missed_payments_by_grace
+)
+from app.models import Subscription, Order
+
+AS_OF = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+class TestMissedPaymentsAsOf:
+
+    def test_as_of_is_reproducible(self, mock_subscriptions, mock_orders):
+        """Test that an explicit as_of pins the result."""
+        as_of = datetime(2024, 5, 31, tzinfo=timezone.utc)
+        stats = calculate_missed_payments(mock_subscriptions, mock_orders, as_of)
+
+        # Subscription 3 misses May 15; subscription 1 is paid through May
+        assert stats.missed_payments_count == 1
+        assert stats.missed_payments_value == 29.99
+        assert calculate_missed_payments(mock_subscriptions, mock_orders, as_of) == stats
+
+    def test_orders_after_as_of_are_ignored(self, mock_subscriptions, mock_orders):
+        """Test that orders closed after as_of do not fulfill earlier dates."""
+        # Subscription 1's May 1 payment is due but its order only closes on May 1
+        before = calculate_missed_payments(mock_subscriptions, mock_orders, datetime(2024, 5, 1, tzinfo=timezone.utc))
+        after = calculate_missed_payments(mock_subscriptions, mock_orders, datetime(2024, 5, 2, tzinfo=timezone.utc))
+
+        assert before.missed_payments_count == after.missed_payments_count == 0
+
+        late = {1: [Order(id=1, closedate=datetime(2024, 1, 5, tzinfo=timezone.utc),
+                          total_order_value__c=29.99, parent_subscription_id__c=1)]}
+        early_view = calculate_missed_payments(mock_subscriptions[:1], late, datetime(2024, 1, 3, tzinfo=timezone.utc))
+        later_view = calculate_missed_payments(mock_subscriptions[:1], late, datetime(2024, 1, 6, tzinfo=timezone.utc))
+        assert early_view.missed_payments_count == 1
+        assert later_view.missed_payments_count == 0
+
+    def test_grace_window_boundaries(self):
+        """Test the 7-day tolerance on both sides of an expected date."""
+        sub = Subscription(id=1, billing_interval__c="1 year", recurring_amount__c=10.0,
+                           start_date__c=datetime(2024, 1, 10, tzinfo=timezone.utc), status__c="active")
+
+        def missed_with_order(closedate):
+            orders = {1: [Order(id=1, closedate=closedate, total_order_value__c=10.0, parent_subscription_id__c=1)]}
+            return calculate_missed_payments([sub], orders, AS_OF).missed_payments_count
+
+        assert missed_with_order(datetime(2024, 1, 3, tzinfo=timezone.utc)) == 0
+        assert missed_with_order(datetime(2024, 1, 2, 23, tzinfo=timezone.utc)) == 1
+        assert missed_with_order(datetime(2024, 1, 17, 23, tzinfo=timezone.utc)) == 0
+        assert missed_with_order(datetime(2024, 1, 18, tzinfo=timezone.utc)) == 1
+
+    def test_subscription_stats_as_of(self, mock_subscriptions):
+        """Test that canceled subscriptions without end date are measured to as_of."""
+        mock_subscriptions[1].end_date__c = None
+        stats = calculate_subscription_stats(mock_subscriptions, AS_OF)
+
+        # (Jun 1 - Jan 1) = 152 days and (Aug 1 - Feb 1) = 182 days
+        assert stats.average_subscription_length_days == (152 + 182) / 2
+
+class TestMissedPaymentTrend:
+
+    def test_trend_matches_engine(self, mock_subscriptions, mock_orders):
+        """Test that every trend point equals the engine run at that date."""
+        dates = [datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(days=9 * i) for i in range(60)]
+        random.Random(0).shuffle(dates)
+
+        points = calculate_missed_payment_trend(mock_subscriptions, mock_orders, dates)
+
+        assert [point.as_of for point in points] == dates
+        for point in points:
+            expected = calculate_missed_payments(mock_subscriptions, mock_orders, point.as_of)
+            assert point.missed_payments_count == expected.missed_payments_count
+            assert abs(point.missed_payments_value - expected.missed_payments_value) < 1e-6
+
+    def test_empty_trend(self, mock_subscriptions, mock_orders):
+        """Test that no dates produce no points."""
+        assert calculate_missed_payment_trend(mock_subscriptions, mock_orders, []) == []
+
+class TestMissedPaymentsBySubscription:
+
+    def test_breakdown_sums_to_totals(self, mock_subscriptions, mock_orders):
+        """Test that per-subscription results add up to the engine totals."""
+        per_subscription = calculate_missed_payments_by_subscription(mock_subscriptions, mock_orders, AS_OF)
+
+        assert [result.subscription_id for result in per_subscription] == [1, 3, 4]
+        assert summarize_missed_payments(per_subscription) == calculate_missed_payments(
+            mock_subscriptions, mock_orders, AS_OF)
+
+    def test_top_delinquent_matches_sort(self):
+        """Test that heap selection returns the same top entries as a full sort."""
+        rng = random.Random(5)
+        subscriptions = [
+            Subscription(id=i, billing_interval__c="1 month", recurring_amount__c=rng.choice([9.99, 29.99, 79.99]),
+                         start_date__c=AS_OF - timedelta(days=rng.randint(0, 400)), status__c="active")
+            for i in range(500)
+        ]
+        per_subscription = calculate_missed_payments_by_subscription(subscriptions, {}, AS_OF)
+
+        top = top_delinquent_subscriptions(per_subscription, 20)
+        expected = sorted(
+            (result for result in per_subscription if result.missed_payments_count > 0),
+            key=lambda result: (result.missed_payments_value, result.missed_payments_count),
+            reverse=True
+        )[:20]
+
+        assert [result.missed_payments_value for result in top] == [result.missed_payments_value for result in expected]
+        assert all(result.missed_payments_count > 0 for result in top)
+
+class TestBillingTimeline:
+
+    def test_timeline_marks_matched_and_missed(self, mock_subscriptions, mock_orders):
+        """Test that each expected date is matched to its order or marked missed."""
+        as_of = datetime(2024, 5, 31, tzinfo=timezone.utc)
+        periods = build_billing_timeline(mock_subscriptions[2], mock_orders[3], as_of)
+
+        assert [period.expected_date.month for period in periods] == [3, 4, 5]
+        assert [period.status for period in periods] == ["matched", "matched", "missed"]
+        assert [period.order_id for period in periods] == [301, 302, None]
+        assert periods[0].closedate == datetime(2024, 3, 15, tzinfo=timezone.utc)
+
+    def test_timeline_agrees_with_engine(self, mock_subscriptions, mock_orders):
+        """Test that the timeline's missed periods match the engine count."""
+        for sub in mock_subscriptions[:4]:
+            periods = build_billing_timeline(sub, mock_orders[sub.id], AS_OF)
+            missed = sum(1 for period in periods if period.status == "missed")
+            assert missed == count_missed_payments(sub, mock_orders[sub.id], AS_OF)
+
+    def test_canceled_timeline_stops_at_end_date(self, mock_subscriptions, mock_orders):
+        """Test that canceled subscriptions are only scheduled until they end."""
+        periods = build_billing_timeline(mock_subscriptions[1], mock_orders[2], datetime(2025, 6, 1, tzinfo=timezone.utc))
+
+        # Quarterly from Jan 1 to the Oct 1 end date
+        assert len(periods) == 4
+        assert [period.status for period in periods] == ["matched", "matched", "matched", "missed"]
+
+class TestGraceWindows:
+
+    def test_windows_match_engine(self):
+        """Test that a single sweep gives the same result as one engine run per window."""
+        rng = random.Random(9)
+        subscriptions = []
+        orders = {}
+        for sub_id in range(200):
+            start = AS_OF - timedelta(days=rng.randint(30, 700))
+            subscriptions.append(Subscription(
+                id=sub_id, billing_interval__c=rng.choice(["1 month", "2 weeks", "3 months"]),
+                recurring_amount__c=rng.choice([9.99, 29.99]), start_date__c=start,
+                status__c=rng.choice(["active", "on-hold", "canceled"])
+            ))
+            orders[sub_id] = [
+                Order(id=sub_id * 1000 + i, closedate=start + timedelta(hours=rng.randint(0, 24 * 800)),
+                      total_order_value__c=29.99, parent_subscription_id__c=sub_id)
+                for i in range(rng.randint(0, 25))
+            ]
+
+        windows = [14, 0, 3, 7, 30]
+        results = calculate_missed_payments_by_grace(subscriptions, orders, windows, AS_OF)
+
+        assert [result.grace_days for result in results] == windows
+        for result in results:
+            expected = calculate_missed_payments(subscriptions, orders, AS_OF, result.grace_days)
+            assert result.missed_payments_count == expected.missed_payments_count
+            assert abs(result.missed_payments_value - expected.missed_payments_value) < 1e-6
+
+        counts = [result.missed_payments_count for result in sorted(results, key=lambda r: r.grace_days)]
+        assert counts == sorted(counts, reverse=True)
+
+    def test_default_window_is_seven_days(self, mock_subscriptions, mock_orders):
+        """Test that a 7-day window reproduces the default engine."""
+        result = calculate_missed_payments_by_grace(mock_subscriptions, mock_orders, [7], AS_OF)[0]
+        default = calculate_missed_payments(mock_subscriptions, mock_orders, AS_OF)
+
+        assert result.missed_payments_count == default.missed_payments_count
@@ -0,0 +1,62 @@
+import httpx
+import pytest
+from app.api_client import AudicusAPIClient
+from app.synthetic import SyntheticBook
+from benchmarks.mock_upstream import MockUpstreamConfig, create_app
+
+def mock_client(app) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://mock")
+
+@pytest.mark.asyncio
+async def test_client_reads_the_whole_book():
+    """Test that AudicusAPIClient pointed at the mock sees the synthetic book."""
+    config = MockUpstreamConfig(size=120, seed=5, max_page_size=25, orders_page_size=4)
+    book = SyntheticBook(120, seed=5)
+    api_client = AudicusAPIClient(base_url="http://mock/")
+    await api_client.close()
+    api_client.client = mock_client(create_app(config))
+    try:
+        subscriptions = await api_client.get_subscriptions()
+        assert subscriptions == list(book.subscriptions())
+
+        sub_id = max(range(1, 121), key=lambda candidate: len(book.orders(candidate)))
+        assert await api_client.get_subscription_orders(sub_id) == book.orders(sub_id)
+
+        order = book.orders(sub_id)[0]
+        assert await api_client.get_order(order.id) == order
+        assert await api_client.get_order(999_999_999) is None
+    finally:
+        await api_client.close()
+
+@pytest.mark.asyncio
+async def test_page_size_is_capped_and_counted():
+    """Test that per_page is capped and requests are counted per endpoint."""
+    async with mock_client(create_app(MockUpstreamConfig(size=30, max_page_size=10))) as client:
+        page = (await client.get("/subscriptions/2?per_page=100")).json()["subscriptions"]
+        assert [sub["id"] for sub in page] == list(range(11, 21))
+        assert (await client.get("/subscriptions/4")).json() == {"subscriptions": []}
+
+        assert (await client.get("/_stats")).json() == {"subscriptions": 2}
+        await client.post("/_stats/reset")
+        assert (await client.get("/_stats")).json() == {}
+
+@pytest.mark.asyncio
+async def test_fault_injection():
+    """Test injected 5xx errors and rate limiting."""
+    async with mock_client(create_app(MockUpstreamConfig(size=10, error_rate=1.0))) as client:
+        assert (await client.get("/subscriptions/1")).status_code in (500, 502, 503)
+
+    async with mock_client(create_app(MockUpstreamConfig(size=10, rate_limit=2))) as client:
+        statuses = [(await client.get("/order/10000")).status_code for _ in range(5)]
+        assert statuses[:2] == [200, 200]
+        assert 429 in statuses
+        stats = (await client.get("/_stats")).json()
+        assert stats["rate_limited"] == statuses.count(429)
+
+@pytest.mark.asyncio
+async def test_latency_is_injected():
+    """Test that the configured median latency is applied."""
+    config = MockUpstreamConfig(size=10, latency_ms={"order": 50}, latency_sigma=0.01)
+    async with mock_client(create_app(config)) as client:
+        response = await client.get("/order/10000")
+    assert response.elapsed.total_seconds() >= 0.04
@@ -0,0 +1,79 @@
+import httpx
+import pytest
+from app import main, profiling
+from app.api_client import AudicusAPIClient
+from app.profiling import ProfilerBusyError, RequestProfiler, _merge_intervals
+from benchmarks.mock_upstream import MockUpstreamConfig, create_app
+
+@pytest.fixture
+def app_client(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    upstream = create_app(MockUpstreamConfig(size=20, latency_ms={"orders": 2.0}))
+    monkeypatch.setattr(main, "AudicusAPIClient", lambda **kwargs: AudicusAPIClient(
+        base_url="http://mock", transport=httpx.ASGITransport(app=upstream), **kwargs
+    ))
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app")
+
+@pytest.mark.asyncio
+async def test_profiling_requires_token(app_client, monkeypatch):
+    """Test that profiles, and the detailed tracing they use, need the configured token."""
+    traced = []
+    start_trace = main.trace
+
+    def recording_trace(name, detailed=None, **attributes):
+        traced.append(detailed)
+        return start_trace(name, detailed=detailed, **attributes)
+
+    monkeypatch.setattr(main, "trace", recording_trace)
+    async with app_client as client:
+        assert (await client.get("/analytics?profile=cpu")).status_code == 403
+        assert (await client.get("/analytics?profile=cpu", headers={"X-Profile-Token": "wrong"})).status_code == 403
+        assert traced == [False, False]
+        assert (await client.get("/analytics?profile=cpu", headers={"X-Profile-Token": "secret"})).status_code == 200
+        assert traced[-1] is True
+        monkeypatch.setattr(profiling, "PROFILE_TOKEN", None)
+        assert (await client.get("/analytics?profile=cpu", headers={"X-Profile-Token": ""})).status_code == 403
+
+@pytest.mark.asyncio
+async def test_cpu_profile_with_attribution(app_client, monkeypatch):
+    """Test that a CPU profile comes with the analytics and separates upstream wait from compute."""
+    monkeypatch.setattr(profiling, "PROFILE_TOP", 100_000)
+    async with app_client as client:
+        plain = (await client.get("/analytics", params={"as_of": "2025-01-01T00:00:00Z"})).json()
+        main.snapshot_store.invalidate()
+        response = await client.get("/analytics", params={"as_of": "2025-01-01T00:00:00Z", "profile": "cpu"},
+                                    headers={"X-Profile-Token": "secret"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["analytics"]["subscription_stats"] == plain["subscription_stats"]
+    profile = body["profile"]
+    assert profile["mode"] == "cpu"
+    assert "calculate_subscription_stats" in {function["function"] for function in profile["functions"]}
+    own = [function["own_ms"] for function in profile["functions"]]
+    assert own == sorted(own, reverse=True)
+    attribution = profile["attribution"]
+    assert attribution["upstream_requests"] > 20
+    assert 0 < attribution["upstream_wait_ms"] <= attribution["wall_ms"]
+    assert {"snapshot", "decode", "calculate_subscription_stats"} <= set(attribution["phases_ms"])
+
+@pytest.mark.asyncio
+async def test_alloc_profile(app_client):
+    """Test that an allocation profile lists allocation sites."""
+    async with app_client as client:
+        response = await client.get("/analytics", params={"profile": "alloc"}, headers={"X-Profile-Token": "secret"})
+
+    profile = response.json()["profile"]
+    assert profile["mode"] == "alloc"
+    assert profile["peak_traced_bytes"] > 0
+    assert profile["allocations"] and all(site["size_bytes"] > 0 for site in profile["allocations"])
+
+def test_one_profile_at_a_time():
+    """Test that overlapping profiles are refused and intervals are merged."""
+    with RequestProfiler("cpu"):
+        with pytest.raises(ProfilerBusyError):
+            with RequestProfiler("alloc"):
+                pass
+    with RequestProfiler("alloc"):
+        pass
+    assert _merge_intervals([(0, 10), (5, 15), (20, 30)]) == 25
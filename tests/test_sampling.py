@@ -0,0 +1,76 @@
+import random
+from datetime import datetime, timedelta, timezone
+from app.analytics import calculate_missed_payments
+from app.models import Subscription, Order, MissedPaymentEstimate
+from app.sampling import stratify_subscriptions, stratified_sample, estimate_missed_payments
+
+def make_book(size: int, seed: int = 1):
+    """
+    Build a book of monthly subscriptions where some skip recent payments.
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    subscriptions = []
+    orders = {}
+    for sub_id in range(1, size + 1):
+        start = now - timedelta(days=30 * rng.randint(3, 12))
+        status = rng.choice(["active", "active", "on-hold", "canceled"])
+        subscriptions.append(Subscription(
+            id=sub_id,
+            billing_interval__c=rng.choice(["1 month", "3 months"]),
+            recurring_amount__c=rng.choice([29.99, 79.99]),
+            start_date__c=start,
+            status__c=status
+        ))
+        # Orders only cover the first few periods
+        orders[sub_id] = [
+            Order(id=sub_id * 100 + i, closedate=start + timedelta(days=30 * i),
+                  total_order_value__c=29.99, parent_subscription_id__c=sub_id)
+            for i in range(rng.randint(0, 3))
+        ]
+    return subscriptions, orders
+
+class TestStratifiedSampling:
+
+    def test_stratify_skips_non_billable(self, mock_subscriptions):
+        """Test that only billable subscriptions are stratified."""
+        strata = stratify_subscriptions(mock_subscriptions)
+
+        assert set(strata) == {("active", "1 month"), ("on-hold", "1 month"), ("active", "1 year")}
+        assert sum(len(members) for members in strata.values()) == 3
+
+    def test_sample_sizes(self):
+        """Test that each stratum is sampled proportionally with a minimum."""
+        subscriptions, _ = make_book(400)
+        strata = stratify_subscriptions(subscriptions)
+        samples = stratified_sample(strata, 0.1, random.Random(0))
+
+        for key, members in strata.items():
+            assert len(samples[key]) >= min(2, len(members))
+            assert len(samples[key]) <= max(2, len(members) // 10 + 1)
+            assert set(sub.id for sub in samples[key]) <= set(sub.id for sub in members)
+
+    def test_full_sample_matches_exact(self, mock_subscriptions, mock_orders):
+        """Test that sampling every subscription reproduces the exact figures."""
+        strata = stratify_subscriptions(mock_subscriptions)
+        samples = stratified_sample(strata, 1.0, random.Random(0))
+        estimate = estimate_missed_payments(strata, samples, mock_orders, 1.0)
+        exact = calculate_missed_payments(mock_subscriptions, mock_orders)
+
+        assert isinstance(estimate, MissedPaymentEstimate)
+        assert round(estimate.missed_payments_count) == exact.missed_payments_count
+        assert estimate.missed_payments_count_ci.lower == estimate.missed_payments_count_ci.upper
+        assert abs(estimate.missed_payments_value - exact.missed_payments_value) < 1e-6
+
+    def test_confidence_interval_covers_exact(self):
+        """Test that the interval from a partial sample covers the exact value."""
+        subscriptions, orders = make_book(2000)
+        exact = calculate_missed_payments(subscriptions, orders)
+
+        strata = stratify_subscriptions(subscriptions)
+        samples = stratified_sample(strata, 0.2, random.Random(3))
+        estimate = estimate_missed_payments(strata, samples, orders, 0.2)
+
+        assert estimate.sampled_subscriptions < estimate.billable_subscriptions
+        assert estimate.missed_payments_count_ci.lower <= exact.missed_payments_count <= estimate.missed_payments_count_ci.upper
+        assert estimate.missed_payments_value_ci.lower <= exact.missed_payments_value <= estimate.missed_payments_value_ci.upper
@@ -0,0 +1,85 @@
+import pickle
+import random
+import pytest
+from app.sketches import QuantileSketch
+from app.analytics import build_distribution_sketches, calculate_distributions, summarize_sketches
+from app.models import DistributionStats
+
+class TestQuantileSketch:
+
+    def test_quantiles_within_relative_error(self):
+        """Test that quantiles stay within the documented relative error."""
+        rng = random.Random(42)
+        values = [rng.lognormvariate(4, 1.5) for _ in range(20000)]
+        sketch = QuantileSketch(alpha=0.01)
+        sketch.extend(values)
+
+        values.sort()
+        for q in (0.5, 0.9, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            assert abs(sketch.quantile(q) - exact) <= 0.01 * exact
+
+    def test_zero_and_negative_values(self):
+        """Test that zero and negative values are ranked correctly."""
+        sketch = QuantileSketch()
+        sketch.extend([-10, 0, 0, 0, 10])
+
+        assert sketch.quantile(0) == -10
+        assert sketch.quantile(0.5) == 0
+        assert sketch.quantile(1) == 10
+
+    def test_empty_sketch(self):
+        """Test that an empty sketch has no quantiles."""
+        assert QuantileSketch().quantile(0.5) is None
+
+    def test_merge_is_exact(self):
+        """Test that merging shard sketches equals sketching the union."""
+        rng = random.Random(7)
+        values = [rng.uniform(0, 1000) for _ in range(5000)]
+
+        whole = QuantileSketch()
+        whole.extend(values)
+
+        merged = QuantileSketch()
+        for i in range(4):
+            shard = QuantileSketch()
+            shard.extend(values[i::4])
+            # Simulate a sketch coming back from a process-pool worker
+            merged.merge(pickle.loads(pickle.dumps(shard)))
+
+        assert merged == whole
+        assert merged.count == len(values)
+        for q in (0.5, 0.9, 0.99):
+            assert merged.quantile(q) == whole.quantile(q)
+
+    def test_merge_rejects_different_accuracy(self):
+        """Test that sketches with different accuracy cannot be merged."""
+        with pytest.raises(ValueError):
+            QuantileSketch(alpha=0.01).merge(QuantileSketch(alpha=0.05))
+
+class TestDistributions:
+
+    def test_calculate_distributions(self, mock_subscriptions, mock_orders):
+        """Test distribution summaries over the fixture data."""
+        stats = calculate_distributions(mock_subscriptions, mock_orders)
+
+        assert isinstance(stats, DistributionStats)
+        # Only the two canceled subscriptions have a known length
+        assert stats.subscription_length_days.count == 2
+        assert stats.order_value.count == 11
+        assert stats.order_value.p50 == pytest.approx(29.99, rel=0.01)
+        assert stats.order_value.p99 == pytest.approx(79.99, rel=0.01)
+        # Subscriptions 1, 3 and 4 are eligible for missed payments
+        assert stats.missed_payment_value_per_subscription.count == 3
+
+    def test_sharded_sketches_merge(self, mock_subscriptions, mock_orders):
+        """Test that sketches built per shard merge into the full result."""
+        whole = build_distribution_sketches(mock_subscriptions, mock_orders)
+        left = build_distribution_sketches(mock_subscriptions[:2], mock_orders)
+        right = build_distribution_sketches(mock_subscriptions[2:], mock_orders)
+
+        for name, sketch in left.items():
+            sketch.merge(right[name])
+            assert sketch == whole[name]
+
+        assert summarize_sketches(left) == summarize_sketches(whole)
@@ -0,0 +1,102 @@
+import math
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock
+from app.snapshot import SnapshotStore
+from app.snapshot_file import MappedOrders, MappedSnapshot, MappedSubscriptions, write_snapshot_file
+
+FETCHED_AT = datetime(2024, 6, 1, 12, 30, tzinfo=timezone.utc)
+
+def test_round_trip(tmp_path, mock_subscriptions, mock_orders):
+    """Test that a written snapshot loads back unchanged."""
+    path = str(tmp_path / "snapshot.bin")
+    write_snapshot_file(path, FETCHED_AT, mock_subscriptions, mock_orders)
+
+    with MappedSnapshot(path) as mapped:
+        subscriptions, orders = MappedSubscriptions(mapped), MappedOrders(mapped)
+        assert mapped.fetched_at == FETCHED_AT
+        assert subscriptions == mock_subscriptions
+        assert orders == {sub_id: sub_orders for sub_id, sub_orders in mock_orders.items() if sub_orders}
+
+def test_rows_are_built_once_on_access(tmp_path, mock_subscriptions, mock_orders):
+    """Test that mapped rows become models only when read, and are kept."""
+    path = str(tmp_path / "snapshot.bin")
+    write_snapshot_file(path, FETCHED_AT, mock_subscriptions, mock_orders)
+
+    with MappedSnapshot(path) as mapped:
+        subscriptions, orders = MappedSubscriptions(mapped), MappedOrders(mapped)
+        assert subscriptions._rows == [None] * 5 and not orders._orders
+        assert subscriptions[-1] == mock_subscriptions[-1] and subscriptions[-1] is subscriptions[4]
+        assert subscriptions[1:3] == mock_subscriptions[1:3]
+        assert subscriptions._rows[0] is None
+        assert orders[3] is orders[3] and 5 not in orders and len(orders) == 4
+        with pytest.raises(IndexError):
+            subscriptions[5]
+
+def test_columns_are_typed_views(tmp_path, mock_subscriptions, mock_orders):
+    """Test that columns can be read without building models."""
+    path = str(tmp_path / "snapshot.bin")
+    write_snapshot_file(path, FETCHED_AT, mock_subscriptions, mock_orders)
+
+    with MappedSnapshot(path) as mapped:
+        assert list(mapped.columns["subscriptions.id"]) == [1, 2, 3, 4, 5]
+        assert math.isnan(mapped.columns["subscriptions.recurring_amount"][4])
+        assert list(mapped.columns["order_offsets"]) == [0, 5, 8, 10, 11, 11]
+        assert sorted(mapped.strings) == sorted({"1 month", "3 months", "1 year", "2 weeks",
+                                                 "active", "canceled", "on-hold"})
+        assert [order.id for order in mapped.orders(2)] == [301, 302]
+
+def test_rejects_other_files(tmp_path):
+    """Test that files that are not snapshots, or from another format version, are rejected."""
+    path = tmp_path / "snapshot.bin"
+    path.write_bytes(b"not a snapshot" * 10)
+    with pytest.raises(ValueError):
+        MappedSnapshot(str(path))
+
+    write_snapshot_file(str(path), FETCHED_AT, [], {})
+    data = bytearray(path.read_bytes())
+    data[8] = 99
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        MappedSnapshot(str(path))
+
+def test_replacing_keeps_existing_mappings(tmp_path, mock_subscriptions, mock_orders):
+    """Test that rewriting the file does not disturb readers of the previous one."""
+    path = str(tmp_path / "snapshot.bin")
+    write_snapshot_file(path, FETCHED_AT, mock_subscriptions, mock_orders)
+
+    with MappedSnapshot(path) as old:
+        write_snapshot_file(path, FETCHED_AT, mock_subscriptions[:2], mock_orders)
+        assert len(old) == 5
+        with MappedSnapshot(path) as new:
+            assert len(new) == 2
+
+@pytest.mark.asyncio
+async def test_store_preloads_and_refreshes(tmp_path, mock_subscriptions, mock_orders):
+    """Test that a restarted store serves the file, then replaces it from upstream."""
+    path = str(tmp_path / "snapshot.bin")
+    api_client = AsyncMock()
+    api_client.get_subscriptions.return_value = mock_subscriptions
+
+    async def mock_get_orders_side_effect(sub_id: int):
+        return mock_orders.get(sub_id, [])
+
+    api_client.get_subscription_orders.side_effect = mock_get_orders_side_effect
+
+    first = SnapshotStore(snapshot_path=path)
+    assert not await first.preload()
+    fetched = await first.get(api_client)
+
+    restarted = SnapshotStore(snapshot_path=path)
+    assert await restarted.preload()
+    preloaded = await restarted.get(api_client)
+    assert preloaded.fetched_at == fetched.fetched_at
+    assert preloaded.subscriptions == fetched.subscriptions
+    assert api_client.get_subscriptions.call_count == 1
+
+    await restarted.refresh_in_background(api_client)
+    assert restarted.snapshot.version > preloaded.version
+    assert api_client.get_subscriptions.call_count == 2
+
+    first.leader_lock.release()
+    restarted.leader_lock.release()
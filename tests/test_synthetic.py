@@ -0,0 +1,30 @@
+from app.analytics import calculate_missed_payments
+from app.synthetic import SyntheticBook
+
+def test_books_are_deterministic():
+    """Test that a seed always produces the same book, and other seeds differ."""
+    assert SyntheticBook(50, seed=3).dataset() == SyntheticBook(50, seed=3).dataset()
+    assert SyntheticBook(50, seed=3).dataset() != SyntheticBook(50, seed=4).dataset()
+
+def test_records_can_be_generated_individually():
+    """Test that single records match the materialized book."""
+    book = SyntheticBook(100, seed=1)
+    subscriptions, orders = book.dataset()
+
+    assert book.subscription(42) == subscriptions[41]
+    assert book.orders(42) == orders.get(42, [])
+    some_order = next(iter(orders.values()))[-1]
+    assert book.order(some_order.id) == some_order
+    assert book.order(10_000 * 101) is None
+
+def test_book_is_realistic():
+    """Test that the book mixes intervals, statuses, prepaid rows and missed payments."""
+    book = SyntheticBook(2000, seed=0)
+    subscriptions, orders = book.dataset()
+
+    assert len({sub.billing_interval__c for sub in subscriptions}) >= 5
+    assert {sub.status__c for sub in subscriptions} == {"active", "on-hold", "canceled"}
+    assert any(sub.recurring_amount__c is None for sub in subscriptions)
+    assert max(book.as_of - sub.start_date__c for sub in subscriptions).days > 3 * 365
+    assert all(order.closedate <= book.as_of for sub_orders in orders.values() for order in sub_orders)
+    assert calculate_missed_payments(subscriptions, orders, book.as_of).missed_payments_count > 0
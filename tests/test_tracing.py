@@ -0,0 +1,82 @@
+import asyncio
+import json
+import httpx
+import pytest
+from app import main, tracing
+from app.api_client import AudicusAPIClient
+from app.tracing import NO_SPAN, span, trace
+from benchmarks.mock_upstream import MockUpstreamConfig, create_app
+
+def test_spans_nest_and_summarize():
+    """Test span parenting, the no-op span outside traces and the Server-Timing summary."""
+    with span("outside") as outside:
+        assert outside is NO_SPAN
+
+    with trace("root", detailed=True) as recorded:
+        with span("phase", summarize=True, records=3) as phase:
+            with span("detail") as detail:
+                pass
+        with span("phase", summarize=True):
+            pass
+
+    spans = {s.span_id: s for s in recorded.spans}
+    assert detail.parent_id == phase.span_id
+    assert phase.parent_id == recorded.root.span_id
+    assert recorded.root.parent_id is None and len(spans) == 4
+    assert list(recorded.timings()) == ["phase"]
+    header = recorded.server_timing()
+    assert header.startswith("phase;dur=") and ", total;dur=" in header
+
+def test_undetailed_traces_keep_only_phase_totals():
+    """Test that without an exporter no spans are kept, but Server-Timing still is."""
+    with trace("root") as recorded:
+        assert not recorded.detailed and recorded.root is NO_SPAN
+        with span("phase", summarize=True) as phase:
+            assert phase is NO_SPAN
+            with span("detail") as detail:
+                assert detail is NO_SPAN
+        with span("phase", summarize=True):
+            pass
+
+    assert recorded.spans == []
+    assert list(recorded.timings()) == ["phase"]
+    assert recorded.server_timing().startswith("phase;dur=")
+    assert ", total;dur=" in recorded.server_timing()
+
+@pytest.mark.asyncio
+async def test_analytics_trace_and_server_timing(monkeypatch, tmp_path):
+    """Test that /analytics reports its phases and exports spans with attributes."""
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(main, "TRACE_FILE", str(path))
+    monkeypatch.setattr(tracing, "TRACE_FILE", str(path))
+    upstream = create_app(MockUpstreamConfig(size=12, max_page_size=5))
+    monkeypatch.setattr(main, "AudicusAPIClient", lambda **kwargs: AudicusAPIClient(
+        base_url="http://mock", transport=httpx.ASGITransport(app=upstream), **kwargs
+    ))
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as client:
+        response = await client.get("/analytics", params={"as_of": "2025-01-01T00:00:00Z"})
+        metrics = await client.get("/metrics")
+    await asyncio.gather(*main.background_tasks)
+
+    assert response.status_code == 200
+    phases = [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")]
+    for phase in ("snapshot", "upstream.subscriptions", "decode", "upstream.orders", "filter",
+                  "calculate_subscription_stats", "calculate_missed_payments", "total"):
+        assert phase in phases
+    assert "server-timing" not in metrics.headers
+
+    [line] = path.read_text().splitlines()
+    spans = json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    ids = {s["spanId"] for s in spans}
+    assert all(s.get("parentSpanId") in ids for s in spans if "parentSpanId" in s)
+
+    def attributes(s):
+        return {a["key"]: list(a["value"].values())[0] for a in s["attributes"]}
+
+    pages = [attributes(s) for s in spans if s["name"] == "upstream.request" and attributes(s)["endpoint"] == "subscriptions"]
+    assert sorted(int(page["page"]) for page in pages) == [1, 2, 3, 4]
+    per_subscription = [attributes(s) for s in spans if s["name"] == "upstream.subscription_orders"]
+    assert sorted(int(s["subscription_id"]) for s in per_subscription) == list(range(1, 13))
+    [root] = [s for s in spans if "parentSpanId" not in s]
+    assert root["name"] == "GET /analytics" and attributes(root)["http.status_code"] == "200"
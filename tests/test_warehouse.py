@@ -0,0 +1,187 @@
+import random
+import sqlite3
+import httpx
+import pytest
+from datetime import datetime, timedelta, timezone
+from app.analytics import calculate_subscription_stats, calculate_missed_payments
+from app.api_client import AudicusAPIClient
+from app.models import Subscription, Order
+from app.snapshot import SnapshotStore
+from app.warehouse import SQLiteWarehouse
+from benchmarks.mock_upstream import MockUpstreamConfig, create_app
+
+AS_OF = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+@pytest.fixture
+def warehouse(tmp_path):
+    return SQLiteWarehouse(str(tmp_path / "warehouse.db"))
+
+def random_book(seed: int):
+    rng = random.Random(seed)
+    subscriptions = []
+    orders = {}
+    for sub_id in range(1, 201):
+        start = datetime(2023, 1, 1, tzinfo=timezone.utc) + timedelta(days=rng.randrange(500), hours=rng.randrange(24))
+        status = rng.choice(["active", "on-hold", "canceled"])
+        subscriptions.append(Subscription(
+            id=sub_id,
+            billing_interval__c=rng.choice(["1 month", "3 months", "2 weeks", "1 year"]),
+            end_date__c=start + timedelta(days=rng.randrange(1, 300)) if status == "canceled" and rng.random() < 0.7 else None,
+            recurring_amount__c=rng.choice([None, 19.99, 29.99, 79.99]),
+            start_date__c=start,
+            status__c=status
+        ))
+        orders[sub_id] = [
+            Order(id=sub_id * 1000 + n, closedate=start + timedelta(days=30 * n + rng.randrange(-10, 11)),
+                  total_order_value__c=29.99, parent_subscription_id__c=sub_id)
+            for n in range(rng.randrange(15))
+        ]
+    return subscriptions, orders
+
+def test_sql_matches_python_engine(warehouse):
+    """Test that the SQL aggregates agree with the Python engine."""
+    subscriptions, orders = random_book(7)
+    warehouse.sync(subscriptions, orders, AS_OF)
+
+    for as_of in [AS_OF - timedelta(days=200), AS_OF - timedelta(hours=5), AS_OF]:
+        assert warehouse.subscription_stats(as_of).average_subscription_length_days == pytest.approx(
+            calculate_subscription_stats(subscriptions, as_of).average_subscription_length_days
+        )
+        for grace_days in [0, 3, 7]:
+            expected = calculate_missed_payments(subscriptions, orders, as_of, grace_days)
+            actual = warehouse.missed_payments(as_of, grace_days)
+            assert actual.missed_payments_count == expected.missed_payments_count
+            assert actual.missed_payments_value == pytest.approx(expected.missed_payments_value)
+
+def test_fixture_figures(warehouse, mock_subscriptions, mock_orders):
+    """Test the SQL engine on the shared fixtures."""
+    warehouse.sync(mock_subscriptions, mock_orders, AS_OF)
+
+    stats = warehouse.subscription_stats(AS_OF)
+    assert stats.total_subscriptions == 5
+    assert stats.active_subscriptions == 2
+    assert stats.on_hold_subscriptions == 1
+    assert stats.cancelled_subscriptions == 2
+
+    missed = warehouse.missed_payments(datetime(2024, 5, 31, tzinfo=timezone.utc))
+    assert missed.missed_payments_count == 1
+    assert missed.missed_payments_value == pytest.approx(29.99)
+
+def test_sync_upserts_and_prunes(warehouse, mock_subscriptions, mock_orders):
+    """Test that a later sync updates changed rows and drops vanished ones."""
+    warehouse.sync(mock_subscriptions, mock_orders, AS_OF)
+
+    later = AS_OF + timedelta(minutes=5)
+    mock_subscriptions[2].status__c = "canceled"
+    del mock_orders[1][-1]
+    warehouse.sync(mock_subscriptions[:4], mock_orders, later)
+
+    assert warehouse.synced_at() == later
+    assert [sub.id for sub in warehouse.load_subscriptions()] == [1, 2, 3, 4]
+    assert warehouse.load_subscriptions()[2].status__c == "canceled"
+    assert len(warehouse.load_orders()[1]) == 4
+    assert warehouse.missed_payments(AS_OF) == calculate_missed_payments(mock_subscriptions[:4], mock_orders, AS_OF)
+
+def test_failed_sync_leaves_previous_sync(warehouse, mock_subscriptions, mock_orders, monkeypatch):
+    """Test that a sync failing part way through is rolled back as a whole."""
+    warehouse.sync(mock_subscriptions, mock_orders, AS_OF)
+
+    def fail(*args):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(warehouse, "_upsert_orders", fail)
+    mock_subscriptions[2].status__c = "canceled"
+    with pytest.raises(sqlite3.OperationalError):
+        warehouse.sync(mock_subscriptions[:4], mock_orders, AS_OF + timedelta(minutes=5))
+
+    assert warehouse.synced_at() == AS_OF
+    assert [sub.id for sub in warehouse.load_subscriptions()] == [1, 2, 3, 4, 5]
+    assert warehouse.load_subscriptions()[2].status__c != "canceled"
+
+def test_only_changed_schedules_are_regenerated(warehouse, mock_subscriptions):
+    """Test that unchanged subscriptions keep their materialized schedule."""
+    assert warehouse.upsert_subscriptions(mock_subscriptions, AS_OF) == 5
+
+    mock_subscriptions[0].recurring_amount__c = 39.99
+    assert warehouse.upsert_subscriptions(mock_subscriptions, AS_OF) == 1
+
+def test_as_of_beyond_schedule(warehouse, mock_subscriptions, mock_orders):
+    """Test that queries past the materialized horizon are rejected."""
+    warehouse.sync(mock_subscriptions, mock_orders, AS_OF)
+
+    with pytest.raises(ValueError):
+        warehouse.missed_payments(AS_OF + timedelta(days=5000))
+
+def test_round_trip(warehouse, mock_subscriptions, mock_orders):
+    """Test that loading returns what was synced."""
+    warehouse.sync(mock_subscriptions, mock_orders, AS_OF)
+
+    assert warehouse.load_subscriptions() == mock_subscriptions
+    assert warehouse.load_orders() == {sub_id: orders for sub_id, orders in mock_orders.items() if orders}
+
+def test_sync_in_batches(warehouse, tmp_path):
+    """Test that a sync fed in batches ends up like one given the whole book."""
+    subscriptions, orders = random_book(11)
+    whole = SQLiteWarehouse(str(tmp_path / "whole.db"))
+    whole.sync(subscriptions, orders, AS_OF)
+
+    sync = warehouse.begin_sync(AS_OF)
+    for start in range(0, len(subscriptions), 64):
+        batch = subscriptions[start:start + 64]
+        sync.add(batch, [order for sub in batch for order in orders[sub.id]])
+    assert sync.commit()
+    assert warehouse.synced_at() == AS_OF
+    assert warehouse.subscription_stats(AS_OF) == whole.subscription_stats(AS_OF)
+    assert warehouse.missed_payments(AS_OF) == whole.missed_payments(AS_OF)
+
+    # A sync that saw nothing keeps the previous one
+    assert not warehouse.begin_sync(AS_OF + timedelta(hours=1)).commit()
+    assert warehouse.synced_at() == AS_OF
+    assert len(warehouse.load_subscriptions()) == len(subscriptions)
+
+class FailingPage(httpx.AsyncBaseTransport):
+    """
+    Passes requests through, except for one subscriptions page that always fails.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, page: int):
+        self.transport = transport
+        self.path = f"/subscriptions/{page}"
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == self.path:
+            return httpx.Response(503, request=request)
+        return await self.transport.handle_async_request(request)
+
+@pytest.mark.asyncio
+async def test_sync_streams_upstream_pages(warehouse):
+    """Test that engine=sql syncs page by page from upstream without building a snapshot."""
+    upstream = httpx.ASGITransport(app=create_app(MockUpstreamConfig(size=45, max_page_size=20)))
+    store = SnapshotStore(warehouse=warehouse)
+    added = []
+    begin_sync = warehouse.begin_sync
+
+    def recording_begin_sync(fetched_at):
+        sync = begin_sync(fetched_at)
+        add = sync.add
+        sync.add = lambda subscriptions, orders: added.append(len(subscriptions)) or add(subscriptions, orders)
+        return sync
+
+    warehouse.begin_sync = recording_begin_sync
+    api_client = AudicusAPIClient(base_url="http://mock", transport=upstream)
+    synced_at = await store.sync_warehouse(api_client)
+    await api_client.close()
+
+    assert added == [20, 20, 5]
+    assert synced_at == warehouse.synced_at() and store.snapshot is None
+    assert warehouse.subscription_stats(synced_at).total_subscriptions == 45
+    assert await store.sync_warehouse(None) == synced_at
+
+    # A listing cut short leaves the previous sync in place
+    store.ttl_seconds = 0
+    api_client = AudicusAPIClient(base_url="http://mock", transport=FailingPage(upstream, 2))
+    with pytest.raises(httpx.HTTPStatusError):
+        await store.sync_warehouse(api_client)
+    await api_client.close()
+    assert warehouse.synced_at() == synced_at
+    assert len(warehouse.load_subscriptions()) == 45